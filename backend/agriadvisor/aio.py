@@ -0,0 +1,59 @@
+# aio.py
+# -----------------------------------------------------------------------------
+# Async building blocks for the ASGI chat path.
+# - Retrieval (BM25 / FAISS / cross-encoder) is CPU-bound → bounded thread pool
+# - Gemini is awaited through the SDK's aio client
+# - Translation (chat/translation.py) awaits one pooled httpx.AsyncClient per loop
+# Nothing here blocks the event loop, so one process can hold hundreds of chats
+# that are only waiting on upstream I/O.
+# -----------------------------------------------------------------------------
+
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from agriadvisor import utils
+from agriadvisor.singleflight import AsyncSingleFlight
+
+# ---------- Config ----------
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "4"))         # threads doing retrieval
+RETRIEVAL_MAX_PENDING = int(os.getenv("RETRIEVAL_MAX_PENDING", "64"))  # queued + running jobs
+
+_retrieval_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+_retrieval_slots: asyncio.Semaphore | None = None
+_aflight = AsyncSingleFlight()
+
+def _slots() -> asyncio.Semaphore:
+    global _retrieval_slots
+    if _retrieval_slots is None:
+        _retrieval_slots = asyncio.Semaphore(RETRIEVAL_MAX_PENDING)
+    return _retrieval_slots
+
+async def run_retrieval(fn, *args):
+    """Run a CPU-bound retrieval call on the bounded pool."""
+    async with _slots():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_retrieval_pool, fn, *args)
+
+# ---------- Answer generation ----------
+async def _agrounded_answer(q: str, language: str | None = None) -> str:
+    final, prompt, evidence = await run_retrieval(utils.prepare_answer, q, language)
+    if final is not None:
+        return final
+
+    try:
+        resp = await utils.get_gemini().aio.models.generate_content(model=utils.GEMINI_MODEL, contents=prompt)
+        text = (resp.text or "").strip()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        text = utils.model_error_text(e, evidence)
+    return utils.finalize_answer(text, evidence)
+
+async def agenerate_answer(user_query: str, language: str | None = None) -> str:
+    """Async counterpart of utils.generate_answer (coalesced per event loop)."""
+    if utils.COALESCE_MODE == "off":
+        return await _agrounded_answer(user_query, language)
+    key = await run_retrieval(utils.coalesce_key, user_query, language)  # parses with the engine's gazetteers
+    return await _aflight.do(key, lambda: _agrounded_answer(user_query, language))
+
@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agriadvisor.settings')
 
 application = get_asgi_application()
+
+from agriadvisor.warmup import start_warmup  # noqa: E402
+
+start_warmup()
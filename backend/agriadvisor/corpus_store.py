@@ -0,0 +1,559 @@
+# corpus_store.py
+# -----------------------------------------------------------------------------
+# Read-only columnar corpus store, memory-mapped by every server worker.
+# - texts.bin + texts_off.npy          → document text (utf-8 blob + offsets)
+# - <field>.npy + <field>.vocab.*      → categorical metadata as int32 codes
+# - year.npy / months.npy              → int32 year, 12-bit month mask
+# - bm25_*.npy + bm25_vocab.*          → term-major postings with precomputed
+#                                        BM25Okapi weights (same scores as rank_bm25)
+# - ids.npy, ids_sorted.npy, ids_order.npy → stable int64 doc ids (FAISS IndexIDMap2
+#                                        ids), sorted + argsort for id → row lookups
+# - gazetteer.json                     → crop / district names for the query parser
+# - manifest.json                      → format, snapshot id, per-file sha256 and
+#                                        the FAISS index it was built against
+# Everything is opened with mmap, so N workers share one copy through the OS
+# page cache instead of each holding Python lists of dicts. Nothing is
+# recomputed at load time; a cold start is a few mmaps and one small JSON.
+# Written by index_builder.py (write_store); no Django / torch imports here.
+# -----------------------------------------------------------------------------
+
+import os
+import json
+import hashlib
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+FORMAT_VERSION = 2
+MANIFEST = "manifest.json"
+GAZETTEER = "gazetteer.json"
+
+# Versioned artifact layout: <root>/versions/<name>/{index_flatip.faiss, corpus.jsonl, store/}
+# plus <root>/CURRENT naming the live one. Without CURRENT, <root> itself is the artifact set.
+VERSIONS_DIR = "versions"
+CURRENT = "CURRENT"
+
+# `state_raw` keeps the doc's original casing (scheme filter compares it as-is);
+# state/district/crop/season are lower-cased like the old `meta` dicts.
+CATEGORICAL = ("source", "metric", "level", "region", "state_raw", "state", "district", "crop", "season")
+LOWERED = ("state", "district", "crop", "season")
+MONTH_ABBR = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+MISSING = -1   # code for None / empty
+ABSENT = -2    # code returned for a value not in the vocab (matches nothing)
+YEAR_NONE = np.iinfo(np.int32).min
+
+# rank_bm25.BM25Okapi defaults
+BM25_K1, BM25_B, BM25_EPSILON = 1.5, 0.75, 0.25
+
+# ---------- Strings ----------
+def _write_strings(prefix: str, strings: Iterable[str]):
+    offsets = array("q", [0])
+    with open(prefix + ".bin", "wb") as f:
+        pos = 0
+        for s in strings:
+            b = s.encode("utf-8")
+            f.write(b)
+            pos += len(b)
+            offsets.append(pos)
+    np.save(prefix + "_off.npy", np.frombuffer(offsets, dtype=np.int64))
+
+class StringTable:
+    """Indexable view over a utf-8 blob + int64 offsets, both memory-mapped."""
+
+    def __init__(self, prefix: str):
+        self.off = np.load(prefix + "_off.npy", mmap_mode="r")
+        size = int(self.off[-1])
+        self.blob = np.memmap(prefix + ".bin", dtype=np.uint8, mode="r") if size else np.zeros(0, np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.off) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return bytes(self.blob[int(self.off[i]):int(self.off[i + 1])]).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+# ---------- Column extraction ----------
+def _as_str(v: Any) -> str | None:
+    return v if isinstance(v, str) and v else None
+
+def _as_year(v: Any) -> int:
+    if isinstance(v, bool):
+        return YEAR_NONE
+    if isinstance(v, int):
+        return v
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return YEAR_NONE
+
+def _months_mask(v: Any) -> int:
+    months = v if isinstance(v, list) else ([v] if v else [])
+    mask = 0
+    for m in months:
+        if m in MONTH_ABBR:
+            mask |= 1 << MONTH_ABBR.index(m)
+    return mask
+
+def extract_columns(d: Dict[str, Any]) -> Dict[str, Any]:
+    src = d.get("source", "unknown")
+    row = {
+        "source": src if isinstance(src, str) else None,
+        "metric": _as_str(d.get("metric")),
+        "level": _as_str(d.get("level")),
+        "region": _as_str(d.get("region")),
+        "state_raw": _as_str(d.get("state")),
+    }
+    for f in LOWERED:
+        v = _as_str(d.get(f))
+        row[f] = v.lower() if v else None
+    row["year"] = _as_year(d.get("year"))
+    row["months"] = _months_mask(d.get("months"))
+    return row
+
+# ---------- Writer ----------
+class StoreWriter:
+    """Streams docs into a store directory; call close() to finish and write the manifest."""
+
+    def __init__(self, out_dir: str):
+        self.out_dir = out_dir
+        os.makedirs(out_dir, exist_ok=True)
+        self._texts = open(os.path.join(out_dir, "texts.bin"), "wb")
+        self._text_off = array("q", [0])
+        self._pos = 0
+        self._vocab: Dict[str, Dict[str, int]] = {f: {} for f in CATEGORICAL}
+        self._codes: Dict[str, array] = {f: array("i") for f in CATEGORICAL}
+        self._year = array("i")
+        self._months = array("H")
+        # BM25 postings, term ids in first-seen order (remapped to sorted order at close)
+        self._terms: Dict[str, int] = {}
+        self._p_term = array("i")
+        self._p_doc = array("i")
+        self._p_tf = array("i")
+        self._doc_len = array("i")
+        self._ids = array("q")
+        self.n_docs = 0
+
+    def add(self, d: Dict[str, Any], doc_id: int | None = None):
+        text = d.get("text", "")
+        b = text.encode("utf-8")
+        self._texts.write(b)
+        self._pos += len(b)
+        self._text_off.append(self._pos)
+
+        if doc_id is not None:
+            self._ids.append(doc_id)
+        row = extract_columns(d)
+        for f in CATEGORICAL:
+            v = row[f]
+            if v is None:
+                self._codes[f].append(MISSING)
+            else:
+                voc = self._vocab[f]
+                self._codes[f].append(voc.setdefault(v, len(voc)))
+        self._year.append(row["year"])
+        self._months.append(row["months"])
+
+        tokens = text.split()  # same tokenization as the old BM25Okapi corpus
+        self._doc_len.append(len(tokens))
+        for tok, tf in Counter(tokens).items():
+            self._p_term.append(self._terms.setdefault(tok, len(self._terms)))
+            self._p_doc.append(self.n_docs)
+            self._p_tf.append(tf)
+        self.n_docs += 1
+
+    def close(self, extra: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        self._texts.close()
+        out = self.out_dir
+        np.save(os.path.join(out, "texts_off.npy"), np.frombuffer(self._text_off, dtype=np.int64))
+
+        vocab_sizes = {}
+        for f in CATEGORICAL:
+            np.save(os.path.join(out, f"{f}.npy"), np.frombuffer(self._codes[f], dtype=np.int32))
+            voc = self._vocab[f]
+            _write_strings(os.path.join(out, f"{f}.vocab"), sorted(voc, key=voc.get))
+            vocab_sizes[f] = len(voc)
+        np.save(os.path.join(out, "year.npy"), np.frombuffer(self._year, dtype=np.int32))
+        np.save(os.path.join(out, "months.npy"), np.frombuffer(self._months, dtype=np.uint16))
+        if len(self._ids):
+            if len(self._ids) != self.n_docs:
+                raise ValueError(f"{len(self._ids)} doc ids for {self.n_docs} docs")
+            ids = np.frombuffer(self._ids, dtype=np.int64)
+            np.save(os.path.join(out, "ids.npy"), ids)
+            order = np.argsort(ids, kind="stable")
+            np.save(os.path.join(out, "ids_order.npy"), order)
+            np.save(os.path.join(out, "ids_sorted.npy"), ids[order])
+
+        bm25 = self._write_bm25()
+
+        # Gazetteers: crops longest-first so "green gram" wins over "gram"
+        crops = sorted(self._vocab["crop"], key=lambda c: (-len(c), c))
+        with open(os.path.join(out, GAZETTEER), "w", encoding="utf-8") as f:
+            json.dump({"crops": crops, "districts": sorted(self._vocab["district"])}, f, ensure_ascii=False)
+
+        files = {name: file_info(os.path.join(out, name))
+                 for name in sorted(os.listdir(out)) if name != MANIFEST}
+        manifest = {
+            "format": FORMAT_VERSION,
+            "snapshot_id": _snapshot_id(files, (extra or {}).get("index")),
+            "n_docs": self.n_docs,
+            "categorical": list(CATEGORICAL),
+            "vocab_sizes": vocab_sizes,
+            "bm25": bm25,
+            "files": files,
+        }
+        if extra:
+            manifest.update(extra)
+        with open(os.path.join(out, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+    def _write_bm25(self) -> Dict[str, Any]:
+        out = self.out_dir
+        n = self.n_docs
+        terms = sorted(self._terms)                      # binary-searchable vocab
+        remap = np.empty(len(terms), dtype=np.int32)
+        for rank, t in enumerate(terms):
+            remap[self._terms[t]] = rank
+        _write_strings(os.path.join(out, "bm25_vocab"), terms)
+
+        p_term = remap[np.frombuffer(self._p_term, dtype=np.int32)] if len(self._p_term) else np.zeros(0, np.int32)
+        p_doc = np.frombuffer(self._p_doc, dtype=np.int32)
+        tf = np.frombuffer(self._p_tf, dtype=np.int32).astype(np.float64)
+        doc_len = np.frombuffer(self._doc_len, dtype=np.int32).astype(np.float64)
+        avgdl = float(doc_len.sum() / n) if n else 0.0
+
+        # idf exactly as BM25Okapi: negative idf → epsilon * average idf
+        df = np.bincount(p_term, minlength=len(terms)).astype(np.float64)
+        idf = np.log(n - df + 0.5) - np.log(df + 0.5)
+        avg_idf = float(idf.sum() / len(idf)) if len(idf) else 0.0
+        idf[idf < 0] = BM25_EPSILON * avg_idf
+
+        dl = doc_len[p_doc] if len(p_doc) else np.zeros(0)
+        denom = tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / (avgdl or 1.0))
+        weight = (idf[p_term] * (tf * (BM25_K1 + 1) / denom)).astype(np.float32)
+
+        order = np.argsort(p_term, kind="stable")        # term-major, docs ascending
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(df.astype(np.int64), out=indptr[1:])
+        np.save(os.path.join(out, "bm25_indptr.npy"), indptr)
+        np.save(os.path.join(out, "bm25_docs.npy"), p_doc[order].astype(np.int32))
+        np.save(os.path.join(out, "bm25_weights.npy"), weight[order])
+        return {"k1": BM25_K1, "b": BM25_B, "epsilon": BM25_EPSILON,
+                "avgdl": avgdl, "terms": len(terms), "postings": int(len(p_doc))}
+
+def write_store(out_dir: str, docs: Iterable[Dict[str, Any]], extra: Dict[str, Any] | None = None,
+                ids: Iterable[int] | None = None) -> Dict[str, Any]:
+    w = StoreWriter(out_dir)
+    if ids is None:
+        for d in docs:
+            w.add(d)
+    else:
+        for d, i in zip(docs, ids):
+            w.add(d, int(i))
+    return w.close(extra)
+
+def doc_id(shard: str, d: Dict[str, Any]) -> int:
+    """Stable positive int64 id from the shard name, `source` and text (same doc → same id every build)."""
+    key = f"{shard}\x00{d.get('source', '')}\x00{d.get('text', '')}".encode("utf-8")
+    return int.from_bytes(hashlib.sha1(key).digest()[:8], "big") & 0x7FFFFFFFFFFFFFFF
+
+# ---------- Checksums ----------
+def sha256_file(path: str, chunk: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            b = f.read(chunk)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
+def file_info(path: str) -> Dict[str, Any]:
+    return {"size": os.path.getsize(path), "sha256": sha256_file(path)}
+
+INDEX_SIDE_FILES = ("data", "vectors", "projection", "binary")
+
+def index_info(index_path: str, ntotal: int, dim: int, emb_model: str, data_path: str | None = None,
+               vectors_path: str | None = None, codec: str = "flat",
+               projection_path: str | None = None, binary_path: str | None = None) -> Dict[str, Any]:
+    """What the store records about the FAISS index it belongs to (manifest["index"])."""
+    info = {"file": os.path.basename(index_path), "ntotal": int(ntotal), "dim": int(dim), "emb_model": emb_model,
+            "codec": codec}
+    info.update(file_info(index_path))
+    if data_path:   # on-disk inverted lists (vector_index.IVF_DATA_FILE)
+        info["data"] = {"file": os.path.basename(data_path), **file_info(data_path)}
+    if vectors_path:   # full-precision vectors for re-scoring a lossy codec (vector_index.VECTORS_FILE)
+        info["vectors"] = {"file": os.path.basename(vectors_path), **file_info(vectors_path)}
+    if projection_path:   # query/doc vectors are multiplied by it first (vector_index.PROJECTION_FILE)
+        info["projection"] = {"file": os.path.basename(projection_path), **file_info(projection_path)}
+    if binary_path:   # sign-bit codes for the Hamming first stage (vector_index.BINARY_FILE)
+        info["binary"] = {"file": os.path.basename(binary_path), **file_info(binary_path)}
+    return info
+
+def _snapshot_id(files: Dict[str, Any], index: Dict[str, Any] | None) -> str:
+    h = hashlib.sha256()
+    for name, info in sorted(files.items()):
+        h.update(f"{name}:{info['sha256']}\n".encode())
+    if index:
+        h.update(f"index:{index['sha256']}\n".encode())
+        for side in INDEX_SIDE_FILES:
+            if index.get(side):
+                h.update(f"index-{side}:{index[side]['sha256']}\n".encode())
+    return h.hexdigest()[:16]
+
+def iter_corpus(path: str):
+    """Docs from a merged corpus.jsonl, skipping blank / broken lines like the server always did."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+def has_store(store_dir: str) -> bool:
+    return os.path.exists(os.path.join(store_dir, MANIFEST))
+
+def store_format(store_dir: str) -> int | None:
+    try:
+        with open(os.path.join(store_dir, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f).get("format")
+    except (OSError, ValueError):
+        return None
+
+# ---------- Artifact versions ----------
+def current_version(root: str) -> str | None:
+    try:
+        with open(os.path.join(root, CURRENT), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def current_art_dir(root: str) -> str:
+    name = current_version(root)
+    return os.path.join(root, VERSIONS_DIR, name) if name else root
+
+def list_versions(root: str) -> List[str]:
+    vdir = os.path.join(root, VERSIONS_DIR)
+    return sorted(os.listdir(vdir)) if os.path.isdir(vdir) else []
+
+def new_version_dir(root: str):
+    """Create versions/<timestamp>/ and return (name, path)."""
+    import time
+    base = time.strftime("%Y%m%d-%H%M%S")
+    name, n = base, 1
+    while os.path.exists(os.path.join(root, VERSIONS_DIR, name)):
+        n += 1
+        name = f"{base}-{n}"
+    path = os.path.join(root, VERSIONS_DIR, name)
+    os.makedirs(path)
+    return name, path
+
+def set_current(root: str, name: str):
+    """Point CURRENT at versions/<name> atomically (readers see the old or the new name, never half)."""
+    if not os.path.isdir(os.path.join(root, VERSIONS_DIR, name)):
+        raise FileNotFoundError(f"No artifact version {name!r} under {root}")
+    tmp = os.path.join(root, f".{CURRENT}.{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(name + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, CURRENT))
+
+# ---------- Reader ----------
+def write_bm25_subset(store_dir: str, rows: np.ndarray, out_dir: str) -> Dict[str, Any]:
+    """
+    The store's BM25 postings of rows only, into out_dir: same term ids, weights and row numbers,
+    so scores for those rows equal the full postings' while scoring walks just their postings.
+    Opened with SparseBM25(out_dir, n_docs, params, vocab=<the store's>).
+    """
+    indptr = np.load(os.path.join(store_dir, "bm25_indptr.npy"))
+    docs = np.load(os.path.join(store_dir, "bm25_docs.npy"), mmap_mode="r")
+    weights = np.load(os.path.join(store_dir, "bm25_weights.npy"), mmap_mode="r")
+    member = np.zeros(int(docs.max()) + 1 if len(docs) else 0, dtype=bool)
+    member[rows[rows < len(member)]] = True
+    keep = member[docs]
+    terms = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))[keep]
+    sub_indptr = np.zeros(len(indptr), dtype=np.int64)
+    np.cumsum(np.bincount(terms, minlength=len(indptr) - 1), out=sub_indptr[1:])
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "bm25_indptr.npy"), sub_indptr)
+    np.save(os.path.join(out_dir, "bm25_docs.npy"), np.asarray(docs[keep], dtype=np.int32))
+    np.save(os.path.join(out_dir, "bm25_weights.npy"), np.asarray(weights[keep], dtype=np.float32))
+    return {"postings": int(keep.sum()), "of": int(len(docs))}
+
+class SparseBM25:
+    """
+    BM25Okapi.get_scores over memory-mapped postings. With vocab (the full store's) it reads
+    a write_bm25_subset directory: scores for the subset's rows, zero elsewhere.
+    """
+
+    def __init__(self, store_dir: str, n_docs: int, params: Dict[str, Any] | None = None,
+                 vocab: StringTable | None = None):
+        params = params or {}
+        self.n_docs = n_docs
+        self.k1 = params.get("k1", BM25_K1)
+        self.b = params.get("b", BM25_B)
+        self.epsilon = params.get("epsilon", BM25_EPSILON)
+        self.avgdl = params.get("avgdl", 0.0)
+        self.vocab = vocab if vocab is not None else StringTable(os.path.join(store_dir, "bm25_vocab"))
+        self.indptr = np.load(os.path.join(store_dir, "bm25_indptr.npy"), mmap_mode="r")
+        self.docs = np.load(os.path.join(store_dir, "bm25_docs.npy"), mmap_mode="r")
+        self.weights = np.load(os.path.join(store_dir, "bm25_weights.npy"), mmap_mode="r")
+        self._avg_idf = None
+
+    def df(self, t: int) -> int:
+        return int(self.indptr[t + 1] - self.indptr[t])
+
+    @property
+    def avg_idf(self) -> float:
+        """Mean raw idf over the vocab, as BM25Okapi uses for its epsilon floor."""
+        if self._avg_idf is None:
+            df = np.diff(np.asarray(self.indptr)).astype(np.float64)
+            idf = np.log(self.n_docs - df + 0.5) - np.log(df + 0.5)
+            self._avg_idf = float(idf.mean()) if len(idf) else 0.0
+        return self._avg_idf
+
+    def term_id(self, tok: str) -> int:
+        i = bisect_left(self.vocab, tok)
+        return i if i < len(self.vocab) and self.vocab[i] == tok else -1
+
+    def get_scores(self, tokens: List[str]) -> np.ndarray:
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for tok in tokens:
+            t = self.term_id(tok)
+            if t < 0:
+                continue
+            s, e = int(self.indptr[t]), int(self.indptr[t + 1])
+            scores[self.docs[s:e]] += self.weights[s:e]   # doc ids are unique within a term
+        return scores
+
+class CorpusStore:
+    def __init__(self, store_dir: str):
+        self.dir = store_dir
+        with open(os.path.join(store_dir, MANIFEST), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != FORMAT_VERSION:
+            raise RuntimeError(f"Unsupported corpus store format in {store_dir}: {self.manifest.get('format')}")
+        self.n_docs = int(self.manifest["n_docs"])
+        self.texts = StringTable(os.path.join(store_dir, "texts"))
+        self._codes = {f: np.load(os.path.join(store_dir, f"{f}.npy"), mmap_mode="r") for f in CATEGORICAL}
+        self._vocabs = {f: StringTable(os.path.join(store_dir, f"{f}.vocab")) for f in CATEGORICAL}
+        self._lookup: Dict[str, Dict[str, int]] = {}
+        self.year = np.load(os.path.join(store_dir, "year.npy"), mmap_mode="r")
+        self.months = np.load(os.path.join(store_dir, "months.npy"), mmap_mode="r")
+        self._bm25 = None
+        has_ids = os.path.exists(os.path.join(store_dir, "ids.npy"))
+        self.ids = np.load(os.path.join(store_dir, "ids.npy"), mmap_mode="r") if has_ids else None
+        self.ids_order = np.load(os.path.join(store_dir, "ids_order.npy"), mmap_mode="r") if has_ids else None
+        self.ids_sorted = np.load(os.path.join(store_dir, "ids_sorted.npy"), mmap_mode="r") if has_ids else None
+
+    def rows_for_ids(self, I: np.ndarray) -> np.ndarray:
+        """Map FAISS ids (any shape, -1 = no hit) to store rows (-1 when unknown)."""
+        flat = I.reshape(-1)
+        pos = np.minimum(np.searchsorted(self.ids_sorted, flat), max(self.n_docs - 1, 0))
+        rows = self.ids_order[pos]
+        rows = np.where((flat >= 0) & (self.ids_sorted[pos] == flat), rows, -1)
+        return rows.reshape(I.shape)
+
+    @property
+    def snapshot_id(self) -> str | None:
+        return self.manifest.get("snapshot_id")
+
+    def gazetteer(self) -> Dict[str, List[str]]:
+        with open(os.path.join(self.dir, GAZETTEER), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def verify(self, deep: bool = False) -> List[str]:
+        """Problems with the files on disk: sizes always, sha256 too when deep."""
+        problems = []
+        for name, info in self.manifest.get("files", {}).items():
+            path = os.path.join(self.dir, name)
+            if not os.path.exists(path):
+                problems.append(f"{name}: missing")
+            elif os.path.getsize(path) != info["size"]:
+                problems.append(f"{name}: size {os.path.getsize(path)} != {info['size']}")
+            elif deep and sha256_file(path) != info["sha256"]:
+                problems.append(f"{name}: checksum mismatch")
+        return problems
+
+    def check_index(self, index_path: str, ntotal: int, dim: int, emb_model: str, deep: bool = False) -> List[str]:
+        """Problems pairing this store with a FAISS index (empty list = compatible)."""
+        problems = []
+        if ntotal != self.n_docs:
+            problems.append(f"index has {ntotal} vectors, store has {self.n_docs} docs")
+        expected = self.manifest.get("index")
+        if not expected:
+            return problems   # store written without an index (e.g. a private fallback store)
+        if dim != expected["dim"]:
+            problems.append(f"index dim {dim} != {expected['dim']}")
+        if emb_model != expected["emb_model"]:
+            problems.append(f"embedder {emb_model} != {expected['emb_model']} used for the index")
+        if os.path.getsize(index_path) != expected["size"]:
+            problems.append(f"{os.path.basename(index_path)} size differs from the snapshot (rebuilt without the store?)")
+        elif deep and sha256_file(index_path) != expected["sha256"]:
+            problems.append(f"{os.path.basename(index_path)} checksum mismatch")
+        for side in INDEX_SIDE_FILES:
+            info = expected.get(side)
+            if not info:
+                continue
+            path = os.path.join(os.path.dirname(index_path), info["file"])
+            if not os.path.exists(path) or os.path.getsize(path) != info["size"]:
+                problems.append(f"{info['file']} missing or size differs from the snapshot")
+            elif deep and sha256_file(path) != info["sha256"]:
+                problems.append(f"{info['file']} checksum mismatch")
+        return problems
+
+    def text(self, i: int) -> str:
+        return self.texts[i]
+
+    def codes(self, field: str) -> np.ndarray:
+        return self._codes[field]
+
+    def code(self, field: str, value: str) -> int:
+        """Code for value, or ABSENT (never equal to any row) if it doesn't occur."""
+        lk = self._lookup.get(field)
+        if lk is None:
+            lk = self._lookup[field] = {s: i for i, s in enumerate(self._vocabs[field])}
+        return lk.get(value, ABSENT)
+
+    def value(self, field: str, i: int) -> str | None:
+        c = int(self._codes[field][i])
+        return self._vocabs[field][c] if c >= 0 else None
+
+    def vocab_value(self, field: str, code: int) -> str:
+        return self._vocabs[field][code]
+
+    def vocab(self, field: str) -> List[str]:
+        return list(self._vocabs[field])
+
+    @property
+    def bm25(self) -> SparseBM25:
+        if self._bm25 is None:
+            self._bm25 = SparseBM25(self.dir, self.n_docs, self.manifest.get("bm25"))
+        return self._bm25
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+    ap = argparse.ArgumentParser(description="Verify a corpus store against its manifest checksums.")
+    ap.add_argument("store_dir")
+    args = ap.parse_args()
+    st = CorpusStore(args.store_dir)
+    issues = st.verify(deep=True)
+    idx = st.manifest.get("index")
+    if idx:
+        index_path = os.path.join(os.path.dirname(os.path.abspath(args.store_dir)), idx["file"])
+        issues += st.check_index(index_path, idx["ntotal"], idx["dim"], idx["emb_model"], deep=True)
+    for msg in issues:
+        print(msg)
+    print(f"snapshot {st.snapshot_id}: {'OK' if not issues else f'{len(issues)} problem(s)'}")
+    sys.exit(1 if issues else 0)
@@ -0,0 +1,265 @@
+# delta.py
+# -----------------------------------------------------------------------------
+# Mutable in-memory segment for documents ingested after the last index build.
+# - rows get global ids base_n, base_n+1, … after the immutable main store
+# - vectors are searched brute force (the segment stays small) and merged with
+#   the FAISS hits; BM25 postings score with the main corpus statistics
+# - categorical values reuse the main store's codes; unseen values get codes
+#   past the main vocab, so filter_pool works unchanged on the merged view
+# - every ingested record is appended to <version>/delta.jsonl and replayed on
+#   restart until compaction folds the segment into a new main version
+# Readers take an immutable snapshot (view()); writers only ever append.
+# -----------------------------------------------------------------------------
+
+import os
+import json
+import math
+import threading
+from collections import Counter
+from typing import Any, Dict, List
+
+import numpy as np
+
+try:
+    from agriadvisor import corpus_store
+except ImportError:  # running utils.py directly as a script
+    import corpus_store
+
+LOG_FILE = "delta.jsonl"
+
+class DeltaSegment:
+    def __init__(self, base: "corpus_store.CorpusStore", dim: int, log_path: str | None):
+        self.base = base
+        self.base_n = base.n_docs
+        self.dim = dim
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self.n = 0
+        self._cap = 0
+        self._vecs = np.zeros((0, dim), dtype=np.float32)
+        self._cols = {f: np.zeros(0, dtype=np.int32) for f in corpus_store.CATEGORICAL}
+        self._year = np.zeros(0, dtype=np.int32)
+        self._months = np.zeros(0, dtype=np.uint16)
+        self._doc_len = np.zeros(0, dtype=np.int32)
+        self._docs: List[Dict[str, Any]] = []
+        self._postings: Dict[str, List[tuple]] = {}
+        # values missing from the main vocab: value → code (>= main vocab size), and back
+        self._extra_codes = {f: {} for f in corpus_store.CATEGORICAL}
+        self._extra_values = {f: [] for f in corpus_store.CATEGORICAL}
+        self._base_vocab = {f: int(base.manifest["vocab_sizes"][f]) for f in corpus_store.CATEGORICAL}
+
+    # ---------- Writes ----------
+    def _code(self, field: str, value: str | None) -> int:
+        if value is None:
+            return corpus_store.MISSING
+        c = self.base.code(field, value)
+        if c != corpus_store.ABSENT:
+            return c
+        extra = self._extra_codes[field]
+        if value not in extra:
+            extra[value] = self._base_vocab[field] + len(self._extra_values[field])
+            self._extra_values[field].append(value)
+        return extra[value]
+
+    def _reserve(self, k: int):
+        if self.n + k <= self._cap:
+            return
+        cap = max(2 * self._cap, self.n + k, 256)
+        # New buffers; snapshots taken earlier keep the old ones
+        def grow(a, shape):
+            b = np.zeros(shape, dtype=a.dtype)
+            b[:self.n] = a[:self.n]
+            return b
+        self._vecs = grow(self._vecs, (cap, self.dim))
+        self._cols = {f: grow(a, cap) for f, a in self._cols.items()}
+        self._year = grow(self._year, cap)
+        self._months = grow(self._months, cap)
+        self._doc_len = grow(self._doc_len, cap)
+        self._cap = cap
+
+    def add(self, docs: List[Dict[str, Any]], vecs: np.ndarray, log: bool = True) -> int:
+        """Append docs (with their normalized embeddings); visible to the next view()."""
+        if not docs:
+            return self.n
+        with self._lock:
+            if log and self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    for d in docs:
+                        f.write(json.dumps(d, ensure_ascii=False) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._reserve(len(docs))
+            for j, (d, v) in enumerate(zip(docs, vecs)):
+                i = self.n + j
+                row = corpus_store.extract_columns(d)
+                for f in corpus_store.CATEGORICAL:
+                    self._cols[f][i] = self._code(f, row[f])
+                self._year[i] = row["year"]
+                self._months[i] = row["months"]
+                self._vecs[i] = v
+                tokens = d.get("text", "").split()
+                self._doc_len[i] = len(tokens)
+                for tok, tf in Counter(tokens).items():
+                    self._postings.setdefault(tok, []).append((i, tf))
+                self._docs.append(d)
+            self.n += len(docs)   # publish
+            return self.n
+
+    def docs(self, start: int = 0, stop: int | None = None) -> List[Dict[str, Any]]:
+        return self._docs[start:self.n if stop is None else stop]
+
+    def rewrite_log(self, start: int = 0):
+        """Log only rows >= start (after they were folded into a new main version)."""
+        if not self.log_path:
+            return
+        tmp = self.log_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for d in self.docs(start):
+                f.write(json.dumps(d, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.log_path)
+
+    def view(self) -> "DeltaView | None":
+        with self._lock:
+            if self.n == 0:
+                return None
+            return DeltaView(self, self.n)
+
+class DeltaView:
+    """Immutable snapshot of the first n delta rows."""
+
+    def __init__(self, seg: DeltaSegment, n: int):
+        self.seg = seg
+        self.n = n
+        self.base_n = seg.base_n
+        self.vecs = seg._vecs[:n]
+        self.cols = {f: a[:n] for f, a in seg._cols.items()}
+        self.year = seg._year[:n]
+        self.months = seg._months[:n]
+        self.doc_len = seg._doc_len[:n]
+        self.avgdl = float(self.doc_len.mean())
+
+    def code(self, field: str, value: str) -> int:
+        return self.seg._extra_codes[field].get(value, corpus_store.ABSENT)
+
+    def value(self, field: str, j: int) -> str | None:
+        c = int(self.cols[field][j])
+        if c < 0:
+            return None
+        base = self.seg._base_vocab[field]
+        return self.seg.base.vocab_value(field, c) if c < base else self.seg._extra_values[field][c - base]
+
+    def text(self, j: int) -> str:
+        return self.seg._docs[j].get("text", "")
+
+    def search(self, qv: np.ndarray, k: int):
+        """Exact inner product over the delta vectors → (D, I) with global ids."""
+        k = min(k, self.n)
+        scores = qv @ self.vecs.T
+        top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(scores, top, axis=1), top + self.base_n
+
+    def bm25_scores(self, tokens: List[str], bm25: "corpus_store.SparseBM25") -> np.ndarray:
+        """BM25Okapi for delta rows, idf over main + delta docs, length norm from the main corpus."""
+        out = np.zeros(self.n, dtype=np.float32)
+        total = self.base_n + self.n
+        avgdl = bm25.avgdl or self.avgdl or 1.0
+        k1, b = bm25.k1, bm25.b
+        for tok in tokens:
+            post = [(j, tf) for j, tf in self.seg._postings.get(tok, ()) if j < self.n]
+            if not post:
+                continue
+            t = bm25.term_id(tok)
+            df = len(post) + (bm25.df(t) if t >= 0 else 0)
+            idf = math.log(total - df + 0.5) - math.log(df + 0.5)
+            if idf < 0:
+                idf = bm25.epsilon * bm25.avg_idf
+            for j, tf in post:
+                out[j] += idf * (tf * (k1 + 1) / (tf + k1 * (1 - b + b * self.doc_len[j] / avgdl)))
+        return out
+
+# ---------- Merged main + delta view (what filter_pool / fusion read) ----------
+class _Column:
+    """Main mmap column followed by the delta rows, indexed by global id arrays."""
+
+    def __init__(self, main: np.ndarray, extra: np.ndarray):
+        self.main, self.extra = main, extra
+        self.n_main = len(main)
+
+    def __getitem__(self, idx: np.ndarray) -> np.ndarray:
+        idx = np.asarray(idx)
+        is_main = idx < self.n_main
+        if is_main.all():
+            return self.main[idx]
+        out = np.empty(len(idx), dtype=self.main.dtype)
+        out[is_main] = self.main[idx[is_main]]
+        out[~is_main] = self.extra[idx[~is_main] - self.n_main]
+        return out
+
+class SegmentedStore:
+    def __init__(self, store: "corpus_store.CorpusStore", delta: DeltaView):
+        self.store, self.delta = store, delta
+        self.n_docs = store.n_docs + delta.n
+        self.year = _Column(store.year, delta.year)
+        self.months = _Column(store.months, delta.months)
+        self.manifest = store.manifest
+        self.snapshot_id = store.snapshot_id
+
+    def codes(self, field: str) -> _Column:
+        return _Column(self.store.codes(field), self.delta.cols[field])
+
+    def code(self, field: str, value: str) -> int:
+        c = self.store.code(field, value)
+        return c if c != corpus_store.ABSENT else self.delta.code(field, value)
+
+    def value(self, field: str, i: int) -> str | None:
+        n = self.store.n_docs
+        return self.store.value(field, i) if i < n else self.delta.value(field, i - n)
+
+    def text(self, i: int) -> str:
+        n = self.store.n_docs
+        return self.store.text(i) if i < n else self.delta.text(i - n)
+
+class SegmentedBM25:
+    """main: the main rows' scorer when it isn't bm25 (a metric group's postings); bm25 keeps the corpus stats."""
+
+    def __init__(self, bm25: "corpus_store.SparseBM25", delta: DeltaView, main: "corpus_store.SparseBM25 | None" = None):
+        self.bm25, self.delta, self.main = bm25, delta, main or bm25
+
+    def get_scores(self, tokens: List[str]) -> np.ndarray:
+        return np.concatenate([self.main.get_scores(tokens), self.delta.bm25_scores(tokens, self.bm25)])
+
+def merge_hits(D: np.ndarray, I: np.ndarray, dD: np.ndarray, dI: np.ndarray, k: int):
+    """Top-k by score across main FAISS hits and delta hits (per query row)."""
+    D2 = np.concatenate([D, dD], axis=1)
+    I2 = np.concatenate([I, dI], axis=1)
+    D2 = np.where(I2 < 0, -np.inf, D2)
+    top = np.argsort(-D2, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(D2, top, axis=1), np.take_along_axis(I2, top, axis=1)
+
+def read_log(path: str) -> List[Dict[str, Any]]:
+    if not path or not os.path.exists(path):
+        return []
+    return list(corpus_store.iter_corpus(path))
+
+def validate_records(records: List[Any]) -> List[Dict[str, Any]]:
+    """Same schema as scripts/*_to_jsonl.py output: a dict with non-empty `text`, metadata optional."""
+    docs = []
+    for n, d in enumerate(records, 1):
+        if not isinstance(d, dict):
+            raise ValueError(f"record {n}: expected a JSON object")
+        if not isinstance(d.get("text"), str) or not d["text"].strip():
+            raise ValueError(f"record {n}: missing 'text'")
+        docs.append(d)
+    return docs
+
+def parse_jsonl(body: str) -> List[Dict[str, Any]]:
+    records = []
+    for n, line in enumerate(body.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"line {n}: {e.msg}")
+    return validate_records(records)
@@ -0,0 +1,126 @@
+# embedding_store.py
+# -----------------------------------------------------------------------------
+# Content-addressed cache of document embeddings, shared by every build:
+#   <root>/<model-slug>/vectors.f32   raw float32 rows (memory-mapped)
+#   <root>/<model-slug>/keys.i64      int64 key per row (sha1 of model spec + text)
+#   <root>/<model-slug>/keys_sorted.npy, keys_order.npy   key → row lookup
+#   <root>/<model-slug>/meta.json     model spec, dim, committed row count
+# Builds look up vectors by text and only encode misses; any FAISS variant can
+# be trained/built from the stored matrix without running the model.
+# Append-only; rows past meta["rows"] (an interrupted build) are ignored.
+# One writer at a time (index_builder.py); readers just mmap.
+# -----------------------------------------------------------------------------
+
+import os
+import re
+import json
+import hashlib
+from typing import Iterable, List
+
+import numpy as np
+
+META = "meta.json"
+
+def model_spec(model: str, max_seq_len: int, normalized: bool = True) -> str:
+    """Everything that changes the vector for a given text."""
+    return f"{model}|seq{max_seq_len}|{'norm' if normalized else 'raw'}"
+
+class EmbeddingStore:
+    def __init__(self, root: str, spec: str, dim: int | None = None):
+        self.spec = spec
+        self.dir = os.path.join(root, re.sub(r"[^A-Za-z0-9._-]+", "_", spec))
+        os.makedirs(self.dir, exist_ok=True)
+        self._vec_path = os.path.join(self.dir, "vectors.f32")
+        self._key_path = os.path.join(self.dir, "keys.i64")
+        meta_path = os.path.join(self.dir, META)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["spec"] != spec:
+                raise RuntimeError(f"{self.dir} holds {meta['spec']}, not {spec}")
+            self.dim, self.rows = int(meta["dim"]), int(meta["rows"])
+        else:
+            self.dim, self.rows = dim, 0
+        self._sorted = self._order = None
+        self._new_keys: List[np.ndarray] = []
+        self._load_lookup()
+
+    # ---------- Keys ----------
+    def key(self, text: str) -> int:
+        h = hashlib.sha1(f"{self.spec}\x00{text}".encode("utf-8")).digest()
+        return int.from_bytes(h[:8], "big", signed=True)
+
+    def keys(self, texts: Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.key(t) for t in texts), dtype=np.int64)
+
+    def _load_lookup(self):
+        sorted_path = os.path.join(self.dir, "keys_sorted.npy")
+        if self.rows and os.path.exists(sorted_path):
+            s = np.load(sorted_path, mmap_mode="r")
+            if len(s) == self.rows:
+                self._sorted = s
+                self._order = np.load(os.path.join(self.dir, "keys_order.npy"), mmap_mode="r")
+                return
+        if self.rows:   # lookup files missing / stale: rebuild from keys.i64
+            self._reindex(np.fromfile(self._key_path, dtype=np.int64, count=self.rows))
+
+    def _reindex(self, all_keys: np.ndarray):
+        order = np.argsort(all_keys, kind="stable")
+        self._sorted, self._order = all_keys[order], order
+        np.save(os.path.join(self.dir, "keys_sorted.npy"), self._sorted)
+        np.save(os.path.join(self.dir, "keys_order.npy"), self._order)
+
+    # ---------- Reads ----------
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        """Row per key, -1 for misses."""
+        keys = np.asarray(keys, dtype=np.int64)
+        if self._sorted is None or not len(self._sorted):
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self._sorted, keys), len(self._sorted) - 1)
+        return np.where(self._sorted[pos] == keys, np.asarray(self._order)[pos], -1).astype(np.int64)
+
+    def matrix(self) -> np.ndarray:
+        """All committed vectors, memory-mapped (rows × dim float32)."""
+        if not self.rows:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self._vec_path, dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+
+    def get(self, rows: np.ndarray) -> np.ndarray:
+        return np.asarray(self.matrix()[np.asarray(rows)], dtype=np.float32)
+
+    def vectors_for_texts(self, texts: Iterable[str]) -> np.ndarray:
+        """Stored vectors for texts (raises if any is missing — build them first)."""
+        rows = self.lookup(self.keys(texts))
+        if (rows < 0).any():
+            raise KeyError(f"{int((rows < 0).sum())} texts have no stored embedding")
+        return self.get(rows)
+
+    # ---------- Writes ----------
+    def append(self, keys: np.ndarray, vecs: np.ndarray):
+        """Add freshly encoded vectors; visible to lookup() after commit()."""
+        vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vecs.shape[1]
+        if vecs.shape[1] != self.dim:
+            raise ValueError(f"dim {vecs.shape[1]} != store dim {self.dim}")
+        pending = sum(len(k) for k in self._new_keys)
+        with open(self._vec_path, "r+b" if os.path.exists(self._vec_path) else "wb") as f:
+            f.seek((self.rows + pending) * self.dim * 4)   # drop any tail from an interrupted run
+            f.write(vecs.tobytes())
+        self._new_keys.append(np.asarray(keys, dtype=np.int64))
+
+    def commit(self):
+        """Persist appended rows (keys, lookup, meta). Call once at the end of a build."""
+        if not self._new_keys:
+            return
+        new = np.concatenate(self._new_keys)
+        old = np.fromfile(self._key_path, dtype=np.int64, count=self.rows) if self.rows else np.zeros(0, np.int64)
+        all_keys = np.concatenate([old, new])
+        all_keys.tofile(self._key_path)
+        self._reindex(all_keys)
+        self.rows = len(all_keys)
+        self._new_keys = []
+        tmp = os.path.join(self.dir, META + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"spec": self.spec, "dim": self.dim, "rows": self.rows}, f)
+        os.replace(tmp, os.path.join(self.dir, META))
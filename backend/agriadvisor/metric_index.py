@@ -0,0 +1,141 @@
+# metric_index.py
+# -----------------------------------------------------------------------------
+# Per-metric sub-indexes, so a query whose intent pins a metric (filter_pool) scans
+# only that metric's docs instead of the whole index:
+#   <version>/metrics/metrics.json             group → metrics, docs; store snapshot it was cut from
+#   <version>/metrics/<group>/index_flatip.faiss   the group's vectors, FAISS ids = store rows
+#                                              (version's codec and IVF layout; re-scored from
+#                                              the version's vectors.f32 like the main index)
+#   <version>/metrics/<group>/bm25_*.npy       the store's BM25 postings of the group's rows
+#                                              (same weights, so same scores as the full postings)
+# Written by index_builder.py (and by delta compaction when the old version had them).
+# The engine routes a query to its intent's group when every row of its pool is in the
+# group, i.e. the metric filter matched. General questions, a metric filter that fell back
+# and a sub-index that comes back short go to the global index as before.
+# -----------------------------------------------------------------------------
+
+import os
+import json
+import shutil
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+try:
+    from agriadvisor import corpus_store
+except ImportError:  # running next to corpus_store.py as a script
+    import corpus_store
+
+METRICS_SUBDIR = "metrics"
+MAP_FILE = "metrics.json"
+INDEX_FILE = "index_flatip.faiss"
+
+# Group → the metric values filter_pool narrows to; intent → group
+GROUPS: Dict[str, Tuple[str, ...]] = {
+    "rainfall": ("rainfall",),
+    "pop": ("pop",),
+    "crop_stats": ("crop_stats",),
+    "crop_env": ("crop_env",),
+    "scheme": ("scheme",),
+    "market": ("price", "price_weather", "market"),
+}
+INTENT_GROUP = {
+    "rainfall": "rainfall",
+    "pop_practice": "pop",
+    "stats": "crop_stats",
+    "crop_env": "crop_env",
+    "scheme": "scheme",
+    "market": "market",
+}
+
+def _vector_index():
+    try:
+        from agriadvisor import vector_index
+    except ImportError:
+        import vector_index
+    return vector_index
+
+def group_dir(art_dir: str, group: str) -> str:
+    return os.path.join(art_dir, METRICS_SUBDIR, group)
+
+def group_rows(store: "corpus_store.CorpusStore", metrics: Tuple[str, ...]) -> np.ndarray:
+    codes = [store.code("metric", m) for m in metrics]
+    return np.flatnonzero(np.isin(np.asarray(store.codes("metric")), codes)).astype(np.int64)
+
+# ---------- Build ----------
+def write_groups(art_dir: str, store_dir: str, budget_mb: int) -> Dict[str, Any]:
+    """Sub-indexes for every non-empty group of the artifact set in art_dir (replaces old ones)."""
+    vector_index = _vector_index()
+    root = os.path.join(art_dir, METRICS_SUBDIR)
+    shutil.rmtree(root, ignore_errors=True)
+    store = corpus_store.CorpusStore(store_dir)
+    index_path = os.path.join(art_dir, INDEX_FILE)
+    index = vector_index.read_index(index_path)
+    codec, ivf = vector_index.codec_of(index), vector_index.is_ondisk(index_path)
+    read_rows = vector_index.row_reader(art_dir, index, store.ids, store.n_docs)
+
+    groups = {}
+    for group, metrics in GROUPS.items():
+        rows = group_rows(store, metrics)
+        if not len(rows):
+            continue
+        gdir = group_dir(art_dir, group)
+        os.makedirs(gdir)
+        # PQ can't train on a handful of vectors; a small group is cheap to keep exact
+        gcodec = "flat" if codec.startswith("pq") and len(rows) < 256 * vector_index.TRAIN_PER_LIST else codec
+
+        def blocks(k, rows=rows):
+            for s in range(0, len(rows), k):
+                yield rows[s:s + k], read_rows(rows[s:s + k])
+
+        print(f"[metrics] {group}: {len(rows)} of {store.n_docs} docs")
+        vector_index.build_streamed(os.path.join(gdir, INDEX_FILE), blocks, rows, index.d, budget_mb,
+                                    gcodec, ivf, None, keep_vectors=False)
+        bm25 = corpus_store.write_bm25_subset(store.dir, rows, gdir)
+        groups[group] = {"metrics": list(metrics), "docs": int(len(rows)), "codec": gcodec,
+                         "bm25_postings": bm25["postings"]}
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, MAP_FILE), "w", encoding="utf-8") as f:
+        json.dump({"snapshot_id": store.snapshot_id, "n_docs": store.n_docs, "groups": groups}, f, indent=1)
+    return groups
+
+# ---------- Serve ----------
+class Group:
+    """One metric's sub-index: dense search to store rows, BM25 over the group's postings."""
+
+    def __init__(self, art_dir: str, name: str, info: Dict[str, Any], store: "corpus_store.CorpusStore",
+                 nprobe: int):
+        vector_index = _vector_index()
+        gdir = group_dir(art_dir, name)
+        self.name = name
+        self.n = int(info["docs"])
+        self.index = vector_index.read_index(os.path.join(gdir, INDEX_FILE))
+        vector_index.set_nprobe(self.index, nprobe)
+        self.lossy = vector_index.is_lossy(vector_index.codec_of(self.index))
+        self.bm25 = corpus_store.SparseBM25(gdir, store.n_docs, store.manifest.get("bm25"), vocab=store.bm25.vocab)
+
+    def search(self, qv: np.ndarray, k: int, vectors: np.ndarray | None = None, rescore_factor: int = 0):
+        """Top-k (D, store rows); a lossy group is re-scored from vectors (the version's exact copy)."""
+        k = min(k, self.n)
+        rescore = self.lossy and vectors is not None and rescore_factor > 0
+        D, I = self.index.search(qv, min(k * rescore_factor, self.n) if rescore else k)
+        if rescore:
+            D, I = _vector_index().rescore(qv, I, vectors, k)
+        return D, I
+
+def load_groups(art_dir: str, store: "corpus_store.CorpusStore", nprobe: int) -> Dict[str, Group]:
+    """The artifact set's sub-indexes; none when it has none or they were cut from another store."""
+    try:
+        with open(os.path.join(art_dir, METRICS_SUBDIR, MAP_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if meta.get("snapshot_id") != store.snapshot_id or meta.get("n_docs") != store.n_docs:
+        print(f"Metric sub-indexes in {art_dir} don't match the corpus store; searching the full index only "
+              f"(rebuild with index_builder.py).")
+        return {}
+    groups = {g: Group(art_dir, g, info, store, nprobe) for g, info in meta["groups"].items()}
+    if groups:
+        print("Metric sub-indexes: " + ", ".join(f"{g} {grp.n}" for g, grp in groups.items())
+              + f" (of {store.n_docs} docs)")
+    return groups
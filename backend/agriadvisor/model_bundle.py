@@ -0,0 +1,163 @@
+# model_bundle.py
+# -----------------------------------------------------------------------------
+# Versioned local copy of every model the backend and index_builder.py load, so
+# a deploy never talks to the Hugging Face hub or the Whisper CDN:
+#   <root>/versions/<ts>/<model-slug>/...     saved model, weights as safetensors
+#   <root>/versions/<ts>/manifest.json        model id → kind, dir, per-file size + sha256
+#   <root>/CURRENT                            active bundle (same scheme as artifacts/)
+# root is artifacts/models. Model ids (EMB_MODEL, RERANK_MODEL, WHISPER_MODEL)
+# stay the identity used in index manifests and caches; only where the weights
+# come from changes. While a bundle is CURRENT, loading is strict: a model missing
+# from it is an error, never a download, and the hub is switched to offline mode.
+# Startup checks file sizes; VERIFY_CHECKSUMS=1 also re-hashes them.
+# Built with `python manage.py bundle_models` (needs network once).
+# -----------------------------------------------------------------------------
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+from typing import Any, Dict, List, Tuple
+
+try:
+    from agriadvisor import corpus_store
+except ImportError:  # running next to corpus_store.py as a script
+    import corpus_store
+
+BUNDLE_SUBDIR = "models"
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 1
+KINDS = ("sentence-transformer", "cross-encoder", "whisper")
+WHISPER_WEIGHTS = "model.safetensors"
+WHISPER_META = "whisper.json"
+OFFLINE_ENV = ("HF_HUB_OFFLINE", "TRANSFORMERS_OFFLINE", "HF_DATASETS_OFFLINE")
+
+def model_slug(model: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model)
+
+def go_offline():
+    """No hub lookups from here on (also for huggingface_hub if it was imported already)."""
+    for k in OFFLINE_ENV:
+        os.environ[k] = "1"
+    constants = sys.modules.get("huggingface_hub.constants")
+    if constants is not None:
+        constants.HF_HUB_OFFLINE = True
+
+# ---------- Pack (needs network, or the models in the local HF / Whisper caches) ----------
+def _save(kind: str, source: str, out: str):
+    if kind == "sentence-transformer":
+        from sentence_transformers import SentenceTransformer
+        SentenceTransformer(source, device="cpu").save(out, safe_serialization=True)
+    elif kind == "cross-encoder":
+        from sentence_transformers import CrossEncoder
+        CrossEncoder(source, device="cpu").save(out, safe_serialization=True)
+    elif kind == "whisper":
+        import whisper
+        from dataclasses import asdict
+        from safetensors.torch import save_file
+        model = whisper.load_model(source, device="cpu", download_root=os.path.join(out, ".download"))
+        # In the dtype the model runs in, so load_whisper can use the mapped tensors as they are
+        save_file({k: v.contiguous() for k, v in model.state_dict().items()}, os.path.join(out, WHISPER_WEIGHTS))
+        heads = getattr(whisper, "_ALIGNMENT_HEADS", {}).get(source)
+        with open(os.path.join(out, WHISPER_META), "w", encoding="utf-8") as f:
+            json.dump({"dims": asdict(model.dims), "alignment_heads": heads.decode() if heads else None}, f, indent=2)
+        shutil.rmtree(os.path.join(out, ".download"), ignore_errors=True)
+    else:
+        raise ValueError(f"Unknown model kind {kind!r} (expected one of {KINDS})")
+
+def pack(root: str, models: Dict[str, Tuple[str, str]], activate: bool = True) -> str:
+    """Save models ({model id: (kind, source)}) into a new bundle version; returns its name."""
+    name, path = corpus_store.new_version_dir(root)
+    entries = {}
+    try:
+        for model, (kind, source) in models.items():
+            t0 = time.time()
+            rel = model_slug(model)
+            out = os.path.join(path, rel)
+            os.makedirs(out)
+            print(f"Bundling {model} ({kind}) from {source} …")
+            _save(kind, source, out)
+            files = {}
+            for d, _, fnames in os.walk(out):
+                for fn in sorted(fnames):
+                    fp = os.path.join(d, fn)
+                    files[os.path.relpath(fp, out).replace(os.sep, "/")] = corpus_store.file_info(fp)
+            if kind != "whisper" and not any(f.endswith(".safetensors") for f in files):
+                raise RuntimeError(f"{model}: no safetensors weights were written")
+            entries[model] = {"kind": kind, "source": source, "dir": rel, "files": files}
+            print(f"  {len(files)} files, {sum(f['size'] for f in files.values()) / 2**20:.0f} MB "
+                  f"in {time.time() - t0:.0f}s")
+        manifest = {"format": FORMAT_VERSION, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "models": entries}
+        with open(os.path.join(path, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+    except BaseException:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    if activate:
+        corpus_store.set_current(root, name)
+    return name
+
+# ---------- Runtime ----------
+def verify(path: str, deep: bool = False) -> List[str]:
+    """Problems with a bundle version on disk: sizes always, sha256 too when deep."""
+    try:
+        with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        return [f"{MANIFEST}: {e}"]
+    if manifest.get("format") != FORMAT_VERSION:
+        return [f"{MANIFEST}: format {manifest.get('format')} (expected {FORMAT_VERSION})"]
+    problems = []
+    for model, entry in manifest["models"].items():
+        for rel, info in entry["files"].items():
+            fp = os.path.join(path, entry["dir"], rel)
+            if not os.path.exists(fp):
+                problems.append(f"{model}: {rel} missing")
+            elif os.path.getsize(fp) != info["size"]:
+                problems.append(f"{model}: {rel} is {os.path.getsize(fp)} bytes, manifest says {info['size']}")
+            elif deep and corpus_store.sha256_file(fp) != info["sha256"]:
+                problems.append(f"{model}: {rel} sha256 mismatch")
+    return problems
+
+class Bundle:
+    """The CURRENT bundle, checked once; path() maps a model id to its local directory."""
+
+    def __init__(self, path: str, deep: bool = False):
+        problems = verify(path, deep=deep)
+        if problems:
+            raise RuntimeError(f"Model bundle {path} is damaged: " + "; ".join(problems[:5]))
+        with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.dir = path
+        go_offline()
+
+    def path(self, model: str) -> str:
+        entry = self.manifest["models"].get(model)
+        if entry is None:
+            raise RuntimeError(f"{model} is not in the model bundle {self.dir} "
+                               f"(has {', '.join(self.manifest['models']) or 'nothing'}); re-run bundle_models")
+        return os.path.join(self.dir, entry["dir"])
+
+def open_current(root: str, deep: bool = False) -> Bundle | None:
+    """The active bundle under root, or None when none was built (models load by name)."""
+    name = corpus_store.current_version(root)
+    if not name:
+        return None
+    return Bundle(os.path.join(root, corpus_store.VERSIONS_DIR, name), deep=deep)
+
+def load_whisper(path: str, device: str | None = None):
+    """whisper.load_model for a bundled model: weights memory-mapped from safetensors."""
+    import torch
+    from whisper.model import ModelDimensions, Whisper
+    from safetensors.torch import load_file
+    with open(os.path.join(path, WHISPER_META), "r", encoding="utf-8") as f:
+        meta: Dict[str, Any] = json.load(f)
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    model = Whisper(ModelDimensions(**meta["dims"]))
+    # assign=True keeps the mmap-backed tensors instead of copying them into fresh parameters
+    model.load_state_dict(load_file(os.path.join(path, WHISPER_WEIGHTS)), assign=True)
+    if meta.get("alignment_heads"):
+        model.set_alignment_heads(meta["alignment_heads"].encode())
+    return model.to(device)
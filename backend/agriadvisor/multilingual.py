@@ -0,0 +1,340 @@
+# multilingual.py
+# -----------------------------------------------------------------------------
+# Hindi / Tamil / Bengali questions without a translation round trip:
+# - Retrieval: a multilingual SentenceTransformer (MODEL) whose vectors are mapped
+#   into the index's embedder space by a linear map fitted on corpus texts that
+#   both models encode (ridge least squares, English only). No re-embedding:
+#   the index and English queries are untouched, and Indic-script queries go
+#   through the multilingual model + map (MixedEncoder routes by script).
+#   <root>/<model>__<emb-model>/align.npy   map, float32 (multilingual dim × index dim)
+#   <root>/<model>__<emb-model>/meta.json   models, dims, held-out + cross-lingual checks
+#   Built by `python manage.py align_multilingual`, which only writes meta.json when
+#   the held-out English cosine reaches MIN_COSINE (same rule as query_encoder.py).
+# - Parsing: native-script names of states, crops, months and intent words are
+#   appended to the query in English (expand_native), so parse_query's English
+#   matchers and BM25 see them.
+# - Generation: the prompt names the language to answer in, and the canned
+#   replies below are localized.
+# -----------------------------------------------------------------------------
+
+import os
+import re
+import json
+import unicodedata
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+META = "meta.json"
+MAP_FILE = "align.npy"
+MIN_COSINE = 0.8     # mean held-out cosine, mapped multilingual vs index embedder (English texts)
+RIDGE = 1e-3         # × number of training texts
+
+# Languages answered end to end without translation (others still go through English)
+LANGUAGES = {"hi": "Hindi", "ta": "Tamil", "bn": "Bengali"}
+
+_INDIC = re.compile("[\u0900-\u0DFF]")   # Devanagari … Sinhala blocks
+_DIGITS = {zero + d: str(d) for zero in (0x0966, 0x09E6, 0x0BE6) for d in range(10)}   # hi, bn, ta digits
+_PUNCT = re.compile(r"[\s.,;:!?()\[\]{}\"'“”‘’/\\|।॥-]+")
+
+def is_indic(text: str) -> bool:
+    return _INDIC.search(text) is not None
+
+# ---------- Gazetteer ----------
+# Native term → what parse_query understands. Terms match at the start of a word
+# (Tamil and Bengali attach case endings: பஞ்சாபில், ধানের), so most are stems;
+# a trailing "$" means the whole word (short words that start other words).
+NATIVE_TERMS: Dict[str, Dict[str, str]] = {
+    "hi": {
+        # states
+        "पंजाब": "punjab", "हरियाणा": "haryana", "राजस्थान": "rajasthan", "उत्तर प्रदेश": "uttar pradesh",
+        "उत्तराखंड": "uttarakhand", "हिमाचल": "himachal pradesh", "बिहार": "bihar", "झारखंड": "jharkhand",
+        "पश्चिम बंगाल": "west bengal", "बंगाल": "west bengal", "ओडिशा": "odisha", "उड़ीसा": "odisha",
+        "छत्तीसगढ़": "chhattisgarh", "मध्य प्रदेश": "madhya pradesh", "महाराष्ट्र": "maharashtra",
+        "तेलंगाना": "telangana", "आंध्र प्रदेश": "andhra pradesh", "तमिलनाडु": "tamil nadu",
+        "तमिल नाडु": "tamil nadu", "केरल": "kerala", "कर्नाटक": "karnataka", "गुजरात": "gujarat",
+        "असम$": "assam", "गोवा": "goa", "दिल्ली": "delhi", "जम्मू": "jammu and kashmir",
+        # crops
+        "गेहूं": "wheat", "गेहूँ": "wheat", "गेंहू": "wheat", "धान": "rice", "चावल": "rice", "मक्का": "maize",
+        "कपास": "cotton", "गन्ना": "sugarcane", "गन्ने": "sugarcane", "सोयाबीन": "soybean", "सरसों": "mustard",
+        "चना$": "chickpea", "चने$": "chickpea", "अरहर": "pigeonpea", "तुअर": "pigeonpea", "मूंग$": "green gram",
+        "उड़द": "black gram", "बाजरा": "pearl millet", "ज्वार": "sorghum", "मूंगफली": "groundnut",
+        "आलू": "potato", "प्याज": "onion", "टमाटर": "tomato", "जौ$": "barley", "तिल$": "sesame",
+        "जूट": "jute", "हल्दी": "turmeric", "केला": "banana", "केले": "banana", "गाजर": "carrot", "रागी": "ragi",
+        # months
+        "जनवरी": "january", "फरवरी": "february", "मार्च": "march", "अप्रैल": "april", "मई$": "may",
+        "जून$": "june", "जुलाई": "july", "अगस्त": "august", "सितंबर": "september", "सितम्बर": "september",
+        "अक्टूबर": "october", "अक्तूबर": "october", "नवंबर": "november", "नवम्बर": "november",
+        "दिसंबर": "december", "दिसम्बर": "december",
+        # intent words
+        "बुवाई": "sowing time", "बुआई": "sowing time", "बोने": "sowing time", "बोएं": "sowing time",
+        "किस्म": "variety", "बीज दर": "seed rate", "बारिश": "rainfall", "वर्षा": "rainfall",
+        "मानसून": "monsoon", "भाव": "price", "दाम": "price", "कीमत": "price", "मंडी": "mandi",
+        "बेच": "sell", "बाजार": "market", "बाज़ार": "market", "खाद$": "fertilizer", "उर्वरक": "fertilizer",
+        "सिंचाई": "irrigation", "उपज": "yield", "पैदावार": "yield", "उत्पादन": "production",
+        "योजना": "scheme", "सब्सिडी": "subsidy", "अनुदान": "subsidy", "ऋण": "loan", "कर्ज": "loan",
+        "लोन": "loan", "पात्रता": "eligibility", "आवेदन": "apply", "कौन सी फसल": "which crop",
+        "कौनसी फसल": "which crop", "तापमान": "temperature", "पीएम किसान": "pm kisan",
+    },
+    "ta": {
+        # states
+        "பஞ்சாப": "punjab", "ஹரியான": "haryana", "ராஜஸ்தான": "rajasthan", "உத்தரப் பிரதேச": "uttar pradesh",
+        "உத்தரப்பிரதேச": "uttar pradesh", "உத்தர பிரதேச": "uttar pradesh", "பீகார": "bihar",
+        "மேற்கு வங்க": "west bengal", "ஒடிசா": "odisha", "மகாராஷ்டிர": "maharashtra",
+        "தெலங்கான": "telangana", "தெலுங்கான": "telangana", "ஆந்திர": "andhra pradesh",
+        "தமிழ்நாட": "tamil nadu", "தமிழக": "tamil nadu", "கேரள": "kerala", "கர்நாடக": "karnataka",
+        "குஜராத": "gujarat", "அஸ்ஸாம": "assam", "அசாம": "assam", "மத்தியப் பிரதேச": "madhya pradesh",
+        "மத்திய பிரதேச": "madhya pradesh", "புதுச்சேரி": "puducherry", "டெல்லி": "delhi",
+        # crops
+        "நெல்": "rice", "அரிசி": "rice", "கோதுமை": "wheat", "மக்காச்சோள": "maize", "பருத்தி": "cotton",
+        "கரும்ப": "sugarcane", "நிலக்கடலை": "groundnut", "வேர்க்கடலை": "groundnut", "உளுந்": "black gram",
+        "பாசிப்பயறு": "green gram", "பாசிப் பயறு": "green gram", "துவரை": "pigeonpea", "கம்ப": "pearl millet",
+        "சோள": "sorghum", "கேழ்வரகு": "ragi", "எள்": "sesame", "வாழை": "banana", "தென்னை": "coconut",
+        "தேங்காய்": "coconut", "மஞ்சள்": "turmeric", "வெங்காய": "onion", "தக்காளி": "tomato",
+        "உருளைக்கிழங்கு": "potato", "சோயா": "soybean", "கடுகு": "mustard", "கொண்டைக்கடலை": "chickpea",
+        # months
+        "ஜனவரி": "january", "பிப்ரவரி": "february", "மார்ச": "march", "ஏப்ரல": "april", "மே$": "may",
+        "ஜூன": "june", "ஜூலை": "july", "ஆகஸ்ட": "august", "செப்டம்பர": "september", "அக்டோபர": "october",
+        "நவம்பர": "november", "டிசம்பர": "december",
+        # intent words
+        "விதைப்பு": "sowing time", "விதைக்க": "sowing time", "நடவு": "sowing time", "ரகம": "variety",
+        "ரகங்க": "variety", "மழை": "rainfall", "பருவமழை": "monsoon", "விலை": "price", "சந்தை": "market",
+        "மண்டி": "mandi", "விற்": "sell", "உரம": "fertilizer", "உரங்க": "fertilizer", "உரத்": "fertilizer",
+        "பாசன": "irrigation", "நீர்ப்பாசன": "irrigation", "மகசூல": "yield", "விளைச்சல": "yield",
+        "உற்பத்தி": "production", "திட்ட": "scheme", "மானிய": "subsidy", "கடன": "loan", "தகுதி": "eligibility",
+        "விண்ணப்ப": "apply", "எந்த பயிர": "which crop", "வெப்பநிலை": "temperature", "பிஎம் கிசான": "pm kisan",
+    },
+    "bn": {
+        # states
+        "পাঞ্জাব": "punjab", "হরিয়ানা": "haryana", "রাজস্থান": "rajasthan", "উত্তরপ্রদেশ": "uttar pradesh",
+        "উত্তর প্রদেশ": "uttar pradesh", "বিহার": "bihar", "ঝাড়খণ্ড": "jharkhand", "পশ্চিমবঙ্গ": "west bengal",
+        "পশ্চিম বঙ্গ": "west bengal", "ওড়িশা": "odisha", "উড়িষ্যা": "odisha", "আসাম": "assam",
+        "ত্রিপুরা": "tripura", "মহারাষ্ট্র": "maharashtra", "তামিলনাড়ু": "tamil nadu", "কর্ণাটক": "karnataka",
+        "কেরালা": "kerala", "কেরল": "kerala", "গুজরাট": "gujarat", "মধ্যপ্রদেশ": "madhya pradesh",
+        "মধ্য প্রদেশ": "madhya pradesh", "অন্ধ্রপ্রদেশ": "andhra pradesh", "অন্ধ্র": "andhra pradesh",
+        "তেলেঙ্গানা": "telangana", "ছত্তিসগড়": "chhattisgarh", "দিল্লি": "delhi",
+        # crops
+        "ধান": "rice", "চাল$": "rice", "চালের": "rice", "গম$": "wheat", "গমের": "wheat", "পাট": "jute",
+        "ভুট্টা": "maize", "আলু": "potato", "পেঁয়াজ": "onion", "সরিষা": "mustard", "সর্ষে": "mustard",
+        "মসুর": "lentil", "ছোলা": "chickpea", "মুগ": "green gram", "মাষকলাই": "black gram", "তুলা$": "cotton",
+        "তুলার": "cotton", "আখ$": "sugarcane", "আখের": "sugarcane", "টমেটো": "tomato", "বেগুন": "brinjal",
+        "সয়াবিন": "soybean", "চিনাবাদাম": "groundnut", "হলুদ": "turmeric", "কলা$": "banana", "কলার": "banana",
+        # months
+        "জানুয়ারি": "january", "ফেব্রুয়ারি": "february", "মার্চ": "march", "এপ্রিল": "april", "মে$": "may",
+        "জুন": "june", "জুলাই": "july", "আগস্ট": "august", "সেপ্টেম্বর": "september", "অক্টোবর": "october",
+        "নভেম্বর": "november", "ডিসেম্বর": "december",
+        # intent words
+        "বপন": "sowing time", "বোনা": "sowing time", "জাত$": "variety", "জাতের": "variety",
+        "বৃষ্টি": "rainfall", "বর্ষা": "monsoon", "দাম": "price", "দর$": "price", "বাজার": "market",
+        "মণ্ডি": "mandi", "মান্ডি": "mandi", "বিক্রি": "sell", "সার$": "fertilizer", "সারের": "fertilizer",
+        "সেচ": "irrigation", "ফলন": "yield", "উৎপাদন": "production", "প্রকল্প": "scheme", "যোজনা": "yojana",
+        "ভর্তুকি": "subsidy", "ঋণ": "loan", "যোগ্যতা": "eligibility", "আবেদন": "apply",
+        "কোন ফসল": "which crop", "তাপমাত্রা": "temperature", "পিএম কিষাণ": "pm kisan",
+    },
+}
+
+def _words(text: str) -> str:
+    """ NFC, lower-cased words separated by single spaces, padded with spaces. """
+    return " " + " ".join(_PUNCT.split(unicodedata.normalize("NFC", text).lower())).strip() + " "
+
+# (" term " or " stem", english), longest first: when two terms start at one position the
+# longer (more specific) one's value comes first; NFC so nukta / ড় spellings agree
+_NEEDLES: List[Tuple[str, str]] = sorted(
+    (((" " + unicodedata.normalize("NFC", t[:-1]) + " ") if t.endswith("$") else (" " + unicodedata.normalize("NFC", t)), en)
+     for terms in NATIVE_TERMS.values() for t, en in terms.items()),
+    key=lambda n: -len(n[0]))
+
+def native_terms(q: str) -> List[str]:
+    """English gazetteer values for the native-script terms in q (first occurrence order)."""
+    if q.isascii():
+        return []
+    words = _words(q)
+    hits = []
+    for needle, en in _NEEDLES:
+        pos = words.find(needle)
+        if pos >= 0:
+            hits.append((pos, en))
+    out: List[str] = []
+    for _, en in sorted(hits, key=lambda h: h[0]):   # stable: longer needles first at a position
+        if en not in out:
+            out.append(en)
+    return out
+
+def expand_native(q: str) -> str:
+    """q with native digits as ASCII and its native terms appended in English (like expand_with_synonyms)."""
+    if q.isascii():
+        return q
+    terms = native_terms(q)
+    q = q.translate(_DIGITS)
+    return q if not terms else f"{q} ({', '.join(terms)})"
+
+# ---------- Replies generated without the LLM ----------
+MESSAGES: Dict[str, Dict[str, str]] = {
+    "hi": {
+        "ask": "सटीक जवाब के लिए कृपया अपना {ask} बताएं।",
+        "and": " और ", "state": "राज्य", "month": "महीना",
+        "no_evidence": "कॉर्पस में कोई मिलता-जुलता स्रोत नहीं मिला।",
+        "crop_mismatch": ("मुझे मुख्य रूप से **{maj}** के लिए जानकारी मिली, लेकिन आप शायद **{crop}** के बारे में "
+                          "पूछ रहे हैं। आपको {crop} की जानकारी चाहिए या {maj} की?"),
+    },
+    "ta": {
+        "ask": "துல்லியமாகப் பதில் சொல்ல உங்கள் {ask} தேவை.",
+        "and": " மற்றும் ", "state": "மாநிலம்", "month": "மாதம்",
+        "no_evidence": "தரவுத்தொகுப்பில் பொருந்தும் ஆதாரங்கள் எதுவும் கிடைக்கவில்லை.",
+        "crop_mismatch": ("எனக்கு பெரும்பாலும் **{maj}** பற்றிய ஆதாரங்களே கிடைத்தன, ஆனால் நீங்கள் **{crop}** "
+                          "பற்றிக் கேட்பதாகத் தெரிகிறது. உங்களுக்கு {crop} பற்றிய தகவல் வேண்டுமா, {maj} பற்றியதா?"),
+    },
+    "bn": {
+        "ask": "সঠিক উত্তরের জন্য আপনার {ask} জানান।",
+        "and": " এবং ", "state": "রাজ্য", "month": "মাস",
+        "no_evidence": "কর্পাসে কোনো মিলে যাওয়া উৎস পাওয়া যায়নি।",
+        "crop_mismatch": ("আমি মূলত **{maj}** সম্পর্কে তথ্য পেয়েছি, কিন্তু আপনি সম্ভবত **{crop}** নিয়ে জানতে "
+                          "চাইছেন। আপনি কি {crop} নাকি {maj} সম্পর্কে জানতে চান?"),
+    },
+}
+
+def message(language: str | None, key: str, default: str, **kw: Any) -> str:
+    return MESSAGES.get(language or "", {}).get(key, default).format(**kw)
+
+# ---------- Serving ----------
+def _slug(model: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model)
+
+def align_dir(root: str, model: str, emb_model: str) -> str:
+    return os.path.join(root, f"{_slug(model)}__{_slug(emb_model)}")
+
+def is_aligned(root: str, model: str, emb_model: str) -> bool:
+    return os.path.exists(os.path.join(align_dir(root, model, emb_model), META))
+
+def _normalize(v: np.ndarray) -> np.ndarray:
+    return (v / np.maximum(np.linalg.norm(v, axis=1, keepdims=True), 1e-12)).astype(np.float32)
+
+class AlignedEncoder:
+    """A multilingual model (anything with SentenceTransformer.encode) followed by the fitted map."""
+
+    def __init__(self, path: str, model):
+        with open(os.path.join(path, META), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.map = np.load(os.path.join(path, MAP_FILE)).astype(np.float32)
+        self.model = model
+
+    def encode(self, texts, batch_size: int = 32, **_: Any) -> np.ndarray:
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        v = self.model.encode(texts, batch_size=batch_size, normalize_embeddings=True, convert_to_numpy=True)
+        out = _normalize(np.asarray(v, dtype=np.float32).reshape(len(texts), -1) @ self.map)
+        return out[0] if single else out
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self.map.shape[1])
+
+class MixedEncoder:
+    """Indic-script texts through the aligned multilingual encoder, everything else through base."""
+
+    def __init__(self, base, aligned: AlignedEncoder):
+        dim = base.get_sentence_embedding_dimension()
+        if aligned.get_sentence_embedding_dimension() != dim:
+            raise RuntimeError(f"multilingual map outputs {aligned.get_sentence_embedding_dimension()} dims, "
+                               f"the embedder {dim}; re-run align_multilingual")
+        self.base, self.aligned, self.dim = base, aligned, dim
+
+    def encode(self, texts, batch_size: int = 32, **kw: Any) -> np.ndarray:
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        native = [i for i, t in enumerate(texts) if is_indic(t)]
+        if not native:
+            out = self.base.encode(texts, batch_size=batch_size, **kw)
+            return out[0] if single else out
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        out[native] = self.aligned.encode([texts[i] for i in native], batch_size=batch_size)
+        rest = [i for i in range(len(texts)) if not is_indic(texts[i])]
+        if rest:
+            out[rest] = self.base.encode([texts[i] for i in rest], batch_size=batch_size, **kw)
+        return out[0] if single else out
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def __getattr__(self, name):   # max_seq_length etc. of the index's embedder
+        return getattr(self.base, name)
+
+# ---------- Fit (build machine) ----------
+# The same questions in English and each language; the cross-lingual check compares
+# the mapped native question with the index embedder's English one.
+CHECK_PAIRS = [
+    {"en": "when to sow wheat in punjab", "hi": "पंजाब में गेहूं की बुवाई कब करें",
+     "ta": "பஞ்சாபில் கோதுமை எப்போது விதைக்க வேண்டும்", "bn": "পাঞ্জাবে গম কখন বপন করব"},
+    {"en": "mandi price of onion in maharashtra", "hi": "महाराष्ट्र में प्याज का मंडी भाव",
+     "ta": "மகாராஷ்டிராவில் வெங்காயத்தின் சந்தை விலை", "bn": "মহারাষ্ট্রে পেঁয়াজের বাজার দর"},
+    {"en": "rainfall in tamil nadu in july", "hi": "जुलाई में तमिलनाडु में बारिश",
+     "ta": "ஜூலையில் தமிழ்நாட்டில் மழை அளவு", "bn": "জুলাই মাসে তামিলনাড়ুতে বৃষ্টিপাত"},
+    {"en": "how much fertilizer for paddy", "hi": "धान के लिए कितनी खाद डालें",
+     "ta": "நெல்லுக்கு எவ்வளவு உரம் இட வேண்டும்", "bn": "ধানের জন্য কতটা সার দিতে হবে"},
+    {"en": "pm kisan scheme eligibility", "hi": "पीएम किसान योजना की पात्रता",
+     "ta": "பிஎம் கிசான் திட்டத்திற்கான தகுதி", "bn": "পিএম কিষাণ প্রকল্পের যোগ্যতা"},
+    {"en": "cotton yield in gujarat", "hi": "गुजरात में कपास की उपज",
+     "ta": "குஜராத்தில் பருத்தி மகசூல்", "bn": "গুজরাটে তুলার ফলন"},
+]
+
+def fit(model, embedder, texts: List[str], holdout: float = 0.1, ridge: float = RIDGE
+        ) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Map multilingual → embedder vectors (ridge least squares) and its held-out check."""
+    enc = dict(batch_size=64, normalize_embeddings=True, convert_to_numpy=True)
+    X = np.asarray(model.encode(texts, **enc), dtype=np.float64)
+    Y = np.asarray(embedder.encode(texts, **enc), dtype=np.float64)
+    order = np.random.default_rng(0).permutation(len(texts))
+    n_test = max(1, int(len(texts) * holdout))
+    test, train = order[:n_test], order[n_test:]
+    A = X[train].T @ X[train] + ridge * len(train) * np.eye(X.shape[1])
+    W = np.linalg.solve(A, X[train].T @ Y[train]).astype(np.float32)
+
+    P = _normalize(X[test] @ W)
+    cos = np.sum(P * Y[test], axis=1)
+    # Retrieval agreement: top-10 over the training texts, mapped query vs embedder query
+    k = min(10, len(train))
+    ref = np.argsort(-(Y[test] @ Y[train].T), axis=1)[:, :k]
+    got = np.argsort(-(P @ Y[train].T), axis=1)[:, :k]
+    recall = float(np.mean([len(set(r) & set(g)) / k for r, g in zip(ref, got)])) if k else 0.0
+    return W, {"mean_cosine": float(cos.mean()), "min_cosine": float(cos.min()), "recall_at_10": recall,
+               "train": int(len(train)), "test": int(n_test)}
+
+def crosslingual_check(aligned: AlignedEncoder, embedder, pairs=CHECK_PAIRS) -> Dict[str, Dict[str, float]]:
+    """Per language: cosine of the mapped native question to the English one, and the embedder's own."""
+    en = embedder.encode([p["en"] for p in pairs], normalize_embeddings=True, convert_to_numpy=True)
+    out = {}
+    for lang in LANGUAGES:
+        native = [p[lang] for p in pairs]
+        mapped = aligned.encode(native)
+        plain = embedder.encode(native, normalize_embeddings=True, convert_to_numpy=True)
+        out[lang] = {"cosine": float(np.mean(np.sum(mapped * en, axis=1))),
+                     "embedder_cosine": float(np.mean(np.sum(plain * en, axis=1)))}
+    return out
+
+def build(root: str, model_name: str, emb_model: str, model, embedder, texts: List[str],
+          min_cosine: float = MIN_COSINE, holdout: float = 0.1) -> Dict[str, Any]:
+    """Fit, check and write the map under root; raises (leaving no meta.json) below min_cosine."""
+    out_dir = align_dir(root, model_name, emb_model)
+    os.makedirs(out_dir, exist_ok=True)
+    meta_path = os.path.join(out_dir, META)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)   # not servable until the new map passes the check
+    W, check = fit(model, embedder, texts, holdout)
+    print(f"Held-out cosine over {check['test']} texts: mean {check['mean_cosine']:.4f}, "
+          f"min {check['min_cosine']:.4f}; top-10 agreement {check['recall_at_10']:.3f}")
+    np.save(os.path.join(out_dir, MAP_FILE), W)
+    meta = {"model": model_name, "emb_model": emb_model, "dim_in": int(W.shape[0]), "dim": int(W.shape[1]),
+            "languages": sorted(LANGUAGES), "check": dict(check, min_cosine_required=min_cosine)}
+    if check["mean_cosine"] < min_cosine:
+        raise RuntimeError(f"mapped vectors are too far from {emb_model}'s (mean cosine {check['mean_cosine']:.4f} "
+                           f"< {min_cosine}); not enabling the multilingual path. Try more --texts.")
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    aligned = AlignedEncoder(out_dir, model)
+    meta["crosslingual"] = crosslingual_check(aligned, embedder)
+    for lang, c in meta["crosslingual"].items():
+        print(f"  {LANGUAGES[lang]}: cosine to the English question {c['cosine']:.3f} "
+              f"(index embedder alone {c['embedder_cosine']:.3f})")
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
@@ -0,0 +1,190 @@
+# partitions.py
+# -----------------------------------------------------------------------------
+# Index partitions for scatter-gather search (index_builder.py --partitions N):
+#   <version>/partitions/partitions.json   key (hash | state | metric), per part: docs + key values
+#   <version>/partitions/<i>/              complete artifact set for part i (corpus.jsonl, store/,
+#                                          index and side files, same codec), servable by an Engine
+# Each part is served by a retrieval daemon started with --partition i (one per process or
+# machine). It holds only that part in memory and answers OP_PART_SEARCH. The coordinator
+# (PARTITION_NODES=addr,addr,… in the web workers or in a front retrieval daemon) parses and
+# encodes each query once. It sends (query, signals, vector) in parallel to the parts that can
+# hold matches, merges their top-k and reranks as usual.
+# Merge: every part runs the same filter_pool over its docs and reports which soft filters found
+# nothing there (utils.miss_mask: earliest filter = highest bit). filter_pool applies its filters
+# in order, so an earlier one (the intent's metric) outranks a later one (state): only the parts
+# with the lowest mask compete. A part that kept the metric but not the state beats one that kept
+# the state but not the metric, as the metric filter narrows the unpartitioned pool before the
+# state filter does. Dense hits (by score) and BM25 hits (by score) are then merged and RRF-fused
+# as in _fuse_candidates. BM25 statistics (idf, avgdl) are per part, so BM25 scores are
+# approximate across parts.
+# -----------------------------------------------------------------------------
+
+import json
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+try:
+    from agriadvisor import retrieval_proto
+except ImportError:  # running next to retrieval_proto.py as a script
+    import retrieval_proto
+
+PARTITIONS_SUBDIR = "partitions"
+MAP_FILE = "partitions.json"
+KEYS = ("hash", "state", "metric")
+
+def part_dir(art_dir: str, i: int) -> str:
+    return os.path.join(art_dir, PARTITIONS_SUBDIR, str(i))
+
+def load_map(art_dir: str) -> Dict[str, Any] | None:
+    try:
+        with open(os.path.join(art_dir, PARTITIONS_SUBDIR, MAP_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def assign(counts: Dict[Any, int], n: int) -> Dict[Any, int]:
+    """Key value → part: biggest values first, each to the part with the fewest docs so far."""
+    load = [0] * n
+    out = {}
+    for v, c in sorted(counts.items(), key=lambda x: (-x[1], str(x[0]))):
+        p = load.index(min(load))
+        out[v] = p
+        load[p] += c
+    return out
+
+# ---------- Coordinator ----------
+def merge_hits(per_part: List[Tuple[int, Tuple[int, List, List]]], k_fusion: int):
+    """
+    per_part: (part, (miss_mask, dense, bm25)) for one query, hits as (doc, score).
+    Returns the global dense and BM25 rankings over (part, doc) keys, k_fusion each.
+    """
+    live = [(p, r) for p, r in per_part if r[1] or r[2]]
+    if not live:
+        return [], []
+    best = min(r[0] for _, r in live)   # misses compared in filter order, not counted
+    dense = [(s, (p, d)) for p, r in live if r[0] == best for d, s in r[1]]
+    bm = [(s, (p, d)) for p, r in live if r[0] == best for d, s in r[2]]
+    dense.sort(key=lambda x: -x[0])
+    bm.sort(key=lambda x: -x[0])
+    return [key for _, key in dense[:k_fusion]], [key for _, key in bm[:k_fusion]]
+
+class Docs:
+    """Merged candidates with the Engine's row accessors, for make_evidence / _majority_crop."""
+
+    def __init__(self, docs: List[Tuple[str, str | None, str | None]]):
+        self.docs = docs
+
+    def text(self, i: int) -> str:
+        return self.docs[i][0]
+
+    def value(self, field: str, i: int) -> str | None:
+        return {"source": self.docs[i][1], "crop": self.docs[i][2]}.get(field)
+
+class PartitionSet:
+    """Clients for the partition nodes; searches them in parallel and routes by partition key."""
+
+    INFO_TTL = 300.0   # refetch now and then so a node reload (new version, new map) is picked up
+    RETRY_SECONDS = 10.0   # while a node is down
+
+    def __init__(self, addresses: List[str], timeout: float = 30.0):
+        self.addresses = addresses
+        self.clients = [retrieval_proto.RetrievalClient(a, timeout) for a in addresses]
+        self.pool = ThreadPoolExecutor(max_workers=len(addresses), thread_name_prefix="partition")
+        self._lock = threading.Lock()
+        self._infos: List[Dict[str, Any] | None] = []
+        self._gaz: retrieval_proto.Gazetteer | None = None
+        self._at = 0.0
+        self._ttl = 0.0
+        self._turn = 0
+
+    def _refresh(self):
+        with self._lock:
+            if self._infos and time.monotonic() - self._at < self._ttl:
+                return
+            infos = list(self.pool.map(self._safe, [c.part_info for c in self.clients]))
+            gazes = list(self.pool.map(self._safe, [c.gazetteer for c in self.clients]))
+            if not any(infos):
+                raise retrieval_proto.RetrievalError(f"no partition node reachable ({', '.join(self.addresses)})")
+            crops = set().union(*(g.known_crops for g in gazes if g))
+            districts = set().union(*(g.known_districts for g in gazes if g))
+            self._infos, self._gaz = infos, retrieval_proto.Gazetteer(sorted(crops), sorted(districts))
+            self._at = time.monotonic()
+            self._ttl = self.INFO_TTL if all(infos) else self.RETRY_SECONDS
+            parts = sorted(i["partition"] for i in infos if i)
+            print(f"Partition nodes: {len(parts)}/{len(self.clients)} up, parts {parts} "
+                  f"of {next(i for i in infos if i)['n']} ({next(i for i in infos if i)['by']})")
+
+    def _safe(self, fn):
+        try:
+            return fn()
+        except (OSError, retrieval_proto.RetrievalError) as e:
+            print(f"Partition node unavailable: {e}")
+            return None
+
+    def gazetteer(self) -> retrieval_proto.Gazetteer:
+        self._refresh()
+        return self._gaz
+
+    def ping(self) -> List[bool]:
+        return list(self.pool.map(lambda c: c.ping(), self.clients))
+
+    def route(self, wanted: set | None) -> List[int]:
+        """
+        One node per part (round robin over nodes serving the same part) for the parts that
+        hold one of the wanted key values; every part when wanted is None or none holds one.
+        """
+        self._refresh()
+        by_part: Dict[int, List[int]] = {}
+        for n, info in enumerate(self._infos):
+            if info:
+                by_part.setdefault(info["partition"], []).append(n)
+        parts = sorted(by_part)
+        if wanted is not None and self.key() != "hash":
+            parts = [p for p in parts if wanted & set(self._infos[by_part[p][0]]["values"])] or parts
+        self._turn += 1
+        return [by_part[p][self._turn % len(by_part[p])] for p in parts]
+
+    def key(self) -> str:
+        self._refresh()
+        return next(i for i in self._infos if i)["by"]
+
+    def search(self, items: List[Tuple[str, Dict[str, Any], bytes]], dim: int, k_fusion: int,
+               routes: List[List[int]]):
+        """
+        items[j] goes to the nodes in routes[j]; one request per node for all of its queries.
+        Returns, per query, the (dense, bm25) rankings over merged doc keys, and the Docs they index.
+        """
+        asked: Dict[int, List[int]] = {}
+        for j, nodes in enumerate(routes):
+            for n in nodes:
+                asked.setdefault(n, []).append(j)
+
+        def call(n):
+            try:
+                return n, self.clients[n].part_search(k_fusion, dim, [items[j] for j in asked[n]])
+            except (OSError, retrieval_proto.RetrievalError) as e:
+                print(f"Partition node {self.addresses[n]} failed, answering without it: {e}")
+                self._ttl = 0.0   # re-check which nodes are up on the next call
+                return n, None
+
+        replies = dict(self.pool.map(call, list(asked)))
+        if asked and not any(replies.values()):
+            raise retrieval_proto.RetrievalError("every partition node failed")
+        per_query: List[List[Tuple[int, Any]]] = [[] for _ in items]
+        for n, reply in replies.items():
+            if reply is not None:
+                for j, res in zip(asked[n], reply[0]):
+                    per_query[j].append((n, res))
+        docs, rows = [], {}
+        out = []
+        for j, per_part in enumerate(per_query):
+            dense, bm = merge_hits(per_part, k_fusion)
+            for key in dense + bm:
+                if key not in rows:
+                    rows[key] = len(docs)
+                    docs.append(replies[key[0]][1][key[1]])
+            out.append(([rows[k] for k in dense], [rows[k] for k in bm]))
+        return out, Docs(docs)
@@ -0,0 +1,173 @@
+# query_encoder.py
+# -----------------------------------------------------------------------------
+# CPU query encoder without PyTorch at serving time: the SentenceTransformer
+# exported to ONNX with mean pooling and L2 normalisation inside the graph,
+# int8 weights by default (dynamic quantization), run by onnxruntime with the
+# HF fast (Rust) tokenizer.
+#   <root>/<model-slug>/model.onnx        fp32 graph
+#   <root>/<model-slug>/model.int8.onnx   int8 weights
+#   <root>/<model-slug>/tokenizer.json
+#   <root>/<model-slug>/meta.json         model, max_seq_len, graph file, cosine check
+# export() only writes meta.json once every check text's vector is within
+# MIN_COSINE of the PyTorch model's, and OnnxQueryEncoder refuses a directory
+# without it, so the engine never serves an untested graph against the index.
+# Build with `python manage.py export_query_encoder` (needs torch + onnx once).
+# -----------------------------------------------------------------------------
+
+import os
+import re
+import json
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+META = "meta.json"
+MIN_COSINE = 0.99        # worst check text, int8 graph vs PyTorch fp32 (same index)
+WARMUP_PASSES = 3
+OPSET = 18
+
+def encoder_dir(root: str, model: str) -> str:
+    return os.path.join(root, re.sub(r"[^A-Za-z0-9._-]+", "_", model))
+
+def is_exported(root: str, model: str) -> bool:
+    return os.path.exists(os.path.join(encoder_dir(root, model), META))
+
+# ---------- Serving ----------
+class OnnxQueryEncoder:
+    """The parts of SentenceTransformer's interface the engine uses (encode → normalized float32)."""
+
+    def __init__(self, path: str, threads: int | None = None, warmup: int = WARMUP_PASSES):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        with open(os.path.join(path, META), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.max_seq_length = int(self.meta["max_seq_len"])
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.max_seq_length)
+        pad = self.meta.get("pad_token", "[PAD]")
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad), pad_token=pad)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(os.path.join(path, self.meta["file"]), opts,
+                                            providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+        self.warm_up(warmup)
+
+    def encode(self, texts, batch_size: int = 32, **_: Any) -> np.ndarray:
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        out = []
+        for s in range(0, len(texts), batch_size):
+            enc = self.tokenizer.encode_batch(texts[s:s + batch_size])
+            feeds = {"input_ids": np.array([e.ids for e in enc], dtype=np.int64),
+                     "attention_mask": np.array([e.attention_mask for e in enc], dtype=np.int64),
+                     "token_type_ids": np.array([e.type_ids for e in enc], dtype=np.int64)}
+            out.append(self.session.run(None, {k: v for k, v in feeds.items() if k in self._inputs})[0])
+        vecs = np.concatenate(out).astype(np.float32) if out else np.zeros((0, self.meta["dim"]), np.float32)
+        return vecs[0] if single else vecs
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self.meta["dim"])
+
+    def warm_up(self, passes: int = WARMUP_PASSES):
+        """Run short, medium and full-length batches so the first real queries don't pay for allocation."""
+        t0 = time.perf_counter()
+        for _ in range(passes):
+            for n in (4, 32, self.max_seq_length):
+                self.encode([" ".join(["wheat"] * n)] * 2)
+        if passes:
+            print(f"Query encoder warm-up: {passes} passes in {time.perf_counter() - t0:.2f}s")
+
+# ---------- Export (build machine; needs torch, onnx, onnxruntime) ----------
+def export(model: str, root: str, check_texts: List[str], int8: bool = True, max_seq_len: int = 128,
+           min_cosine: float = MIN_COSINE, source: str | None = None) -> Dict[str, Any]:
+    """Export model (loaded from source, e.g. its bundle directory, if given) under root."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(source or model, device="cpu")
+    st.max_seq_length = max_seq_len
+    modes = [type(m).__name__ for m in st]
+    if modes[:2] != ["Transformer", "Pooling"] or not _mean_pooling(st[1].get_config_dict()):
+        raise RuntimeError(f"{model}: expected Transformer + mean Pooling (+ Normalize), got {modes}")
+
+    class Pooled(torch.nn.Module):
+        """Transformer → masked mean over tokens → L2 normalize, as SentenceTransformer does."""
+
+        def __init__(self, hf):
+            super().__init__()
+            self.hf = hf
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            tokens = self.hf(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)[0]
+            mask = attention_mask.unsqueeze(-1).to(tokens.dtype)
+            mean = (tokens * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+            return torch.nn.functional.normalize(mean, p=2, dim=1)
+
+    out_dir = encoder_dir(root, model)
+    os.makedirs(out_dir, exist_ok=True)
+    meta_path = os.path.join(out_dir, META)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)   # not servable until the new graph passes the check
+    fp32 = os.path.join(out_dir, "model.onnx")
+    sample = st.tokenizer(["warm up query"], return_tensors="pt", padding=True, truncation=True, max_length=max_seq_len)
+    args = tuple(sample[k] for k in ("input_ids", "attention_mask", "token_type_ids"))
+    axes = {0: "batch", 1: "tokens"}
+    print(f"Exporting {model} → {fp32}")
+    with torch.no_grad():
+        torch.onnx.export(Pooled(st[0].auto_model).eval(), args, fp32, opset_version=OPSET, do_constant_folding=True,
+                          input_names=["input_ids", "attention_mask", "token_type_ids"], output_names=["sentence_embedding"],
+                          dynamic_axes={"input_ids": axes, "attention_mask": axes, "token_type_ids": axes,
+                                        "sentence_embedding": {0: "batch"}})
+    st.tokenizer.save_pretrained(out_dir)   # writes tokenizer.json (fast tokenizer)
+    graph = "model.onnx"
+    if int8:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        graph = "model.int8.onnx"
+        quantize_dynamic(fp32, os.path.join(out_dir, graph), weight_type=QuantType.QInt8)
+
+    meta = {"model": model, "max_seq_len": max_seq_len, "file": graph, "int8": int8,
+            "dim": st.get_sentence_embedding_dimension(), "pad_token": st.tokenizer.pad_token or "[PAD]"}
+    # Provisional meta so the encoder can load; removed again if the check fails
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    try:
+        enc = OnnxQueryEncoder(out_dir, warmup=1)
+        check = compare(st, enc, check_texts)
+    except Exception:
+        os.remove(meta_path)
+        raise
+    meta["check"] = dict(check, min_cosine_required=min_cosine, texts=len(check_texts))
+    print(f"Cosine vs PyTorch over {len(check_texts)} texts: min {check['min_cosine']:.5f}, "
+          f"mean {check['mean_cosine']:.5f}; latency {check['torch_ms']:.1f} → {check['onnx_ms']:.1f} ms/query")
+    if check["min_cosine"] < min_cosine:
+        os.remove(meta_path)
+        raise RuntimeError(f"{graph} is off by more than the tolerance (min cosine {check['min_cosine']:.5f} < "
+                           f"{min_cosine}); not enabling it. Try --no-int8.")
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+def _mean_pooling(cfg: Dict[str, Any]) -> bool:
+    if "pooling_mode" in cfg:   # sentence-transformers ≥ 6
+        return cfg["pooling_mode"] == "mean"
+    return bool(cfg.get("pooling_mode_mean_tokens")) and not any(
+        v for k, v in cfg.items() if k.startswith("pooling_mode_") and k != "pooling_mode_mean_tokens")
+
+def compare(reference, enc: OnnxQueryEncoder, texts: List[str]) -> Dict[str, float]:
+    """Cosine between the reference model's and enc's vectors, and one-query latency of each."""
+    ref = reference.encode(texts, batch_size=64, normalize_embeddings=True, convert_to_numpy=True)
+    got = enc.encode(texts, batch_size=64)
+    cos = np.sum(ref * got, axis=1) / (np.linalg.norm(ref, axis=1) * np.linalg.norm(got, axis=1))
+
+    def per_query(fn):
+        t0 = time.perf_counter()
+        for t in texts[:50]:
+            fn([t])
+        return (time.perf_counter() - t0) / max(1, min(50, len(texts))) * 1000
+    return {"min_cosine": float(cos.min()), "mean_cosine": float(cos.mean()),
+            "torch_ms": per_query(lambda q: reference.encode(q, normalize_embeddings=True, convert_to_numpy=True)),
+            "onnx_ms": per_query(enc.encode)}
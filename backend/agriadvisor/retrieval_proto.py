@@ -0,0 +1,288 @@
+# retrieval_proto.py
+# -----------------------------------------------------------------------------
+# Wire format + thin client for the retrieval daemon (retrieval_server.py).
+# Pure stdlib so web workers that use it never import numpy/torch/faiss.
+#
+# Frame   : u32 length | payload                     (big-endian throughout)
+# Request : b"AGR1" | u8 op | body
+#   OP_RETRIEVE  body = u16 k_fusion | u16 k_rerank | str32 query
+#   OP_GAZETTEER body = (empty)
+#   OP_PING      body = (empty)
+#   OP_RELOAD    body = u8 force                      (swap to artifacts/CURRENT)
+#   OP_INGEST    body = str32 jsonl                   (add docs to the live delta)
+#   OP_COMPACT   body = (empty)                       (fold the delta into a new version)
+#   OP_PART_SEARCH body = u16 k_fusion | u16 dim | u16 n | n × (str32 query | signals | dim × f32 vector)
+#   OP_PART_INFO   body = (empty)                     (partition nodes, see partitions.py)
+# Response: u8 status (0 ok / 1 error) | body
+#   retrieve  → signals | u16 n | n × (str32 snippet, str16 source) | str16 majority_crop
+#   gazetteer → u32 n | n × str16 crop | u32 m | m × str16 district
+#   reload    → (empty)
+#   ingest    → u32 added | u32 delta_rows | u32 main_rows
+#   compact   → (empty)
+#   part search → u16 n | n × (u16 miss_mask | u16 nd | nd × (u32 doc, f32 score) | u16 nb | nb × (u32 doc, f32 score))
+#                 | u32 m | m × (str32 text, str16 source, str16 crop)   doc = row of that table
+#                 miss_mask = soft filters that matched nothing (utils.miss_mask, filter order)
+#   part info → str32 json
+#   error     → str32 message
+# signals = str16 intent,state,district,month,crop | i32 year | str32 raw
+# str16/str32: u16/u32 byte length + utf-8, length all-ones = None
+# Address: a Unix socket path, or host:port for TCP (nodes on other machines).
+# -----------------------------------------------------------------------------
+
+import json
+import time
+import socket
+import struct
+import threading
+from typing import Any, Dict, List, Tuple
+
+MAGIC = b"AGR1"
+OP_RETRIEVE, OP_GAZETTEER, OP_PING, OP_RELOAD, OP_INGEST, OP_COMPACT = 1, 2, 3, 4, 5, 6
+OP_PART_SEARCH, OP_PART_INFO = 7, 8
+# Safe to resend after the daemon may have read the frame (ingest / compact are not)
+IDEMPOTENT_OPS = frozenset({OP_RETRIEVE, OP_GAZETTEER, OP_PING, OP_RELOAD, OP_PART_SEARCH, OP_PART_INFO})
+ST_OK, ST_ERROR = 0, 1
+
+_U16_NONE = 0xFFFF
+_U32_NONE = 0xFFFFFFFF
+_I32_NONE = -(2 ** 31)
+_SIGNAL_STRS = ("intent", "state", "district", "month", "crop")
+
+# ---------- Encoding ----------
+def pack_str(s: str | None, wide: bool = False) -> bytes:
+    fmt, none = (">I", _U32_NONE) if wide else (">H", _U16_NONE)
+    if s is None:
+        return struct.pack(fmt, none)
+    b = s.encode("utf-8")
+    if not wide:
+        b = b[:_U16_NONE - 1]
+    return struct.pack(fmt, len(b)) + b
+
+class Reader:
+    def __init__(self, buf: bytes):
+        self.buf = memoryview(buf)
+        self.pos = 0
+
+    def unpack(self, fmt: str):
+        vals = struct.unpack_from(fmt, self.buf, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return vals if len(vals) > 1 else vals[0]
+
+    def str(self, wide: bool = False) -> str | None:
+        n = self.unpack(">I" if wide else ">H")
+        if n == (_U32_NONE if wide else _U16_NONE):
+            return None
+        s = bytes(self.buf[self.pos:self.pos + n]).decode("utf-8")
+        self.pos += n
+        return s
+
+def pack_signals(sig: Dict[str, Any]) -> bytes:
+    out = [pack_str(sig.get(k)) for k in _SIGNAL_STRS]
+    year = sig.get("year")
+    out.append(struct.pack(">i", _I32_NONE if year is None else int(year)))
+    out.append(pack_str(sig.get("raw"), wide=True))
+    return b"".join(out)
+
+def read_signals(r: Reader) -> Dict[str, Any]:
+    sig = {k: r.str() for k in _SIGNAL_STRS}
+    year = r.unpack(">i")
+    sig["year"] = None if year == _I32_NONE else year
+    sig["raw"] = r.str(wide=True)
+    return sig
+
+def pack_retrieval(signals, evidence, maj) -> bytes:
+    out = [struct.pack(">B", ST_OK), pack_signals(signals), struct.pack(">H", len(evidence))]
+    for e in evidence:
+        out.append(pack_str(e["snippet"], wide=True))
+        out.append(pack_str(e["source"]))
+    out.append(pack_str(maj))
+    return b"".join(out)
+
+def read_retrieval(r: Reader):
+    signals = read_signals(r)
+    n = r.unpack(">H")
+    evidence = [{"snippet": r.str(wide=True), "source": r.str()} for _ in range(n)]
+    return signals, evidence, r.str()
+
+def pack_gazetteer(crops: List[str], districts: List[str]) -> bytes:
+    out = [struct.pack(">B", ST_OK), struct.pack(">I", len(crops))]
+    out += [pack_str(c) for c in crops]
+    out.append(struct.pack(">I", len(districts)))
+    out += [pack_str(d) for d in districts]
+    return b"".join(out)
+
+def pack_part_search(k_fusion: int, dim: int, items: List[Tuple[str, Dict[str, Any], bytes]]) -> bytes:
+    """items: (query, signals, big-endian float32 vector bytes)."""
+    out = [struct.pack(">HHH", k_fusion, dim, len(items))]
+    for q, sig, vec in items:
+        out += [pack_str(q, wide=True), pack_signals(sig), vec]
+    return b"".join(out)
+
+def read_part_search(r: Reader):
+    k_fusion, dim, n = r.unpack(">HHH")
+    items = []
+    for _ in range(n):
+        q, sig = r.str(wide=True) or "", read_signals(r)
+        items.append((q, sig, bytes(r.buf[r.pos:r.pos + 4 * dim])))
+        r.pos += 4 * dim
+    return k_fusion, dim, items
+
+def pack_part_hits(results, docs) -> bytes:
+    """results: (miss_mask, dense, bm25) per query, hits as (doc, score); docs: (text, source, crop)."""
+    out = [struct.pack(">BH", ST_OK, len(results))]
+    for mask, dense, bm in results:
+        out.append(struct.pack(">H", mask))
+        for hits in (dense, bm):
+            out.append(struct.pack(">H", len(hits)))
+            out += [struct.pack(">If", d, s) for d, s in hits]
+    out.append(struct.pack(">I", len(docs)))
+    for text, source, crop in docs:
+        out += [pack_str(text, wide=True), pack_str(source), pack_str(crop)]
+    return b"".join(out)
+
+def read_part_hits(r: Reader):
+    results = []
+    for _ in range(r.unpack(">H")):
+        mask = r.unpack(">H")
+        dense = [r.unpack(">If") for _ in range(r.unpack(">H"))]
+        bm = [r.unpack(">If") for _ in range(r.unpack(">H"))]
+        results.append((mask, dense, bm))
+    docs = [(r.str(wide=True), r.str(), r.str()) for _ in range(r.unpack(">I"))]
+    return results, docs
+
+def pack_error(msg: str) -> bytes:
+    return struct.pack(">B", ST_ERROR) + pack_str(msg, wide=True)
+
+# ---------- Framing ----------
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("retrieval socket closed")
+        buf += chunk
+    return bytes(buf)
+
+def send_frame(sock: socket.socket, payload: bytes):
+    sock.sendall(struct.pack(">I", len(payload)) + payload)
+
+def recv_frame(sock: socket.socket) -> bytes:
+    (n,) = struct.unpack(">I", _recv_exact(sock, 4))
+    return _recv_exact(sock, n)
+
+# ---------- Client ----------
+class RetrievalError(RuntimeError):
+    pass
+
+class Gazetteer:
+    """Just what parse_query needs from an Engine."""
+
+    def __init__(self, crops: List[str], districts: List[str]):
+        self.known_crops = set(crops)
+        self.known_districts = set(districts)
+        self.crops_by_len = sorted(self.known_crops, key=len, reverse=True)
+
+def is_tcp(address: str) -> bool:
+    return not address.startswith("/") and ":" in address
+
+def connect(address: str, timeout: float) -> socket.socket:
+    if is_tcp(address):
+        host, port = address.rsplit(":", 1)
+        s = socket.create_connection((host, int(port)), timeout=timeout)
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return s
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(timeout)
+    s.connect(address)
+    return s
+
+class RetrievalClient:
+    """
+    One persistent connection per thread; reconnects once when a reused socket turns
+    out to be dead. A request is resent only if its frame never went out, or if the op
+    is idempotent and the daemon closed the connection: never after a timeout, when
+    the daemon may still be working on it.
+    """
+
+    GAZETTEER_TTL = 300.0   # refetch now and then so a daemon reload reaches every worker
+
+    def __init__(self, path: str, timeout: float = 60.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._gaz: Gazetteer | None = None
+        self._gaz_at = 0.0
+
+    def _sock(self) -> socket.socket:
+        s = getattr(self._local, "sock", None)
+        if s is None:
+            s = connect(self.path, self.timeout)
+            self._local.sock = s
+        return s
+
+    def _drop(self):
+        s = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if s is not None:
+            try:
+                s.close()
+            except OSError:
+                pass
+
+    def _call(self, op: int, body: bytes = b"") -> Reader:
+        payload = MAGIC + struct.pack(">B", op) + body
+        for attempt in (0, 1):
+            reused, sent = getattr(self._local, "sock", None) is not None, False
+            try:
+                sock = self._sock()
+                send_frame(sock, payload)
+                sent = True
+                resp = recv_frame(sock)
+                break
+            except (ConnectionError, OSError) as e:
+                self._drop()
+                if attempt or not reused or (sent and not (op in IDEMPOTENT_OPS and isinstance(e, ConnectionError))):
+                    raise
+        r = Reader(resp)
+        if r.unpack(">B") != ST_OK:
+            raise RetrievalError(r.str(wide=True))
+        return r
+
+    def retrieve(self, q: str, k_fusion: int, k_rerank: int) -> Tuple[Dict[str, Any], List[Dict[str, str]], str | None]:
+        return read_retrieval(self._call(OP_RETRIEVE, struct.pack(">HH", k_fusion, k_rerank) + pack_str(q, wide=True)))
+
+    def gazetteer(self) -> Gazetteer:
+        if self._gaz is None or time.monotonic() - self._gaz_at > self.GAZETTEER_TTL:
+            r = self._call(OP_GAZETTEER)
+            crops = [r.str() for _ in range(r.unpack(">I"))]
+            districts = [r.str() for _ in range(r.unpack(">I"))]
+            self._gaz = Gazetteer(crops, districts)
+            self._gaz_at = time.monotonic()
+        return self._gaz
+
+    def reload(self, force: bool = False):
+        """Ask the daemon to start a background reload of artifacts/CURRENT."""
+        self._call(OP_RELOAD, struct.pack(">B", int(force)))
+        self._gaz = None
+
+    def ingest(self, docs: List[Dict[str, Any]]) -> Dict[str, int]:
+        body = "\n".join(json.dumps(d, ensure_ascii=False) for d in docs)
+        added, delta_rows, main_rows = self._call(OP_INGEST, pack_str(body, wide=True)).unpack(">III")
+        self._gaz = None   # ingested docs may name new crops / districts
+        return {"added": added, "delta_rows": delta_rows, "main_rows": main_rows}
+
+    def compact(self):
+        self._call(OP_COMPACT)
+
+    def part_search(self, k_fusion: int, dim: int, items: List[Tuple[str, Dict[str, Any], bytes]]):
+        return read_part_hits(self._call(OP_PART_SEARCH, pack_part_search(k_fusion, dim, items)))
+
+    def part_info(self) -> Dict[str, Any]:
+        return json.loads(self._call(OP_PART_INFO).str(wide=True))
+
+    def ping(self) -> bool:
+        try:
+            self._call(OP_PING)
+            return True
+        except (OSError, RetrievalError):
+            return False
@@ -0,0 +1,210 @@
+# retrieval_server.py
+# -----------------------------------------------------------------------------
+# Long-running retrieval daemon: holds the corpus store, BM25, embedder, FAISS
+# index and cross-encoder once, and serves parse → filter → search → rerank →
+# make_evidence over a Unix domain socket (protocol in retrieval_proto.py).
+# Concurrent requests are batched: one embedder call, one FAISS search and one
+# cross-encoder call per batch.
+#
+# Web workers point at it with RETRIEVAL_SOCKET=/path/to.sock and stay light;
+# retrieval capacity is sized here (--workers, --max-batch) independently.
+#
+# Partitioned index (index_builder.py --partitions N, see partitions.py): one daemon per
+# part with --partition i holds just that part and answers OP_PART_SEARCH; the front daemon
+# (or the web workers) get PARTITION_NODES=<their addresses> and scatter-gather over them.
+#
+# Usage (from backend/):
+#   python -m agriadvisor.retrieval_server --socket /tmp/agri-retrieval.sock
+#   python -m agriadvisor.retrieval_server --partition 0 --listen 0.0.0.0:7400   # part 0 over TCP
+#   kill -HUP <pid>     # swap to a new artifacts/CURRENT without dropping requests
+# -----------------------------------------------------------------------------
+
+import os
+import json
+import time
+import signal
+import queue
+import struct
+import argparse
+import threading
+import socketserver
+from concurrent.futures import Future
+
+from agriadvisor import delta, utils
+from agriadvisor.retrieval_proto import (
+    MAGIC, OP_COMPACT, OP_GAZETTEER, OP_INGEST, OP_PART_INFO, OP_PART_SEARCH, OP_PING, OP_RELOAD, OP_RETRIEVE,
+    ST_OK, Reader, pack_error, pack_gazetteer, pack_part_hits, pack_retrieval, pack_str, read_part_search,
+    recv_frame, send_frame,
+)
+
+DEFAULT_SOCKET = "/tmp/agri-retrieval.sock"
+
+class _Job:
+    __slots__ = ("q", "k_fusion", "k_rerank", "fut")
+
+    def __init__(self, q, k_fusion, k_rerank):
+        self.q, self.k_fusion, self.k_rerank = q, k_fusion, k_rerank
+        self.fut = Future()
+
+class Batcher:
+    """Collects requests for up to `wait_ms` (or `max_batch` of them) and runs them together."""
+
+    def __init__(self, max_batch: int = 16, wait_ms: float = 5.0, workers: int = 1):
+        self.max_batch = max_batch
+        self.wait = wait_ms / 1000.0
+        self.jobs: "queue.Queue[_Job]" = queue.Queue()
+        self.batches = 0
+        self.requests = 0
+        for i in range(workers):
+            threading.Thread(target=self._loop, name=f"retrieval-batch-{i}", daemon=True).start()
+
+    def submit(self, q: str, k_fusion: int, k_rerank: int) -> Future:
+        job = _Job(q, k_fusion, k_rerank)
+        self.jobs.put(job)
+        return job.fut
+
+    def _take_batch(self):
+        batch = [self.jobs.get()]
+        deadline = time.monotonic() + self.wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.jobs.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._take_batch()
+            groups = {}
+            for job in batch:
+                groups.setdefault((job.k_fusion, job.k_rerank), []).append(job)
+            for (kf, kr), jobs in groups.items():
+                try:
+                    results = utils.retrieve_batch([j.q for j in jobs], kf, kr)
+                except Exception as e:
+                    for j in jobs:
+                        j.fut.set_exception(e)
+                    continue
+                for j, res in zip(jobs, results):
+                    j.fut.set_result(res)
+            self.batches += 1
+            self.requests += len(batch)
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                payload = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                resp = self.server.dispatch(payload)
+            except Exception as e:
+                resp = pack_error(f"{type(e).__name__}: {e}")
+            send_frame(self.request, resp)
+
+class _Dispatch:
+    batcher: Batcher
+
+    def dispatch(self, payload: bytes) -> bytes:
+        if payload[:4] != MAGIC:
+            return pack_error("bad magic")
+        op = payload[4]
+        r = Reader(payload[5:])
+        if op == OP_RETRIEVE:
+            k_fusion, k_rerank = r.unpack(">HH")
+            q = r.str(wide=True) or ""
+            signals, evidence, maj = self.batcher.submit(q, k_fusion, k_rerank).result()
+            return pack_retrieval(signals, evidence, maj)
+        if op == OP_GAZETTEER:
+            gaz = utils.get_gazetteer()
+            return pack_gazetteer(sorted(gaz.known_crops), sorted(gaz.known_districts))
+        if op == OP_PING:
+            return struct.pack(">B", ST_OK)
+        if op == OP_RELOAD:
+            utils.reload_engine(force=bool(r.unpack(">B")))
+            return struct.pack(">B", ST_OK)
+        if op == OP_INGEST:
+            res = utils.ingest_docs(delta.parse_jsonl(r.str(wide=True) or ""))
+            return struct.pack(">BIII", ST_OK, res["added"], res["delta_rows"], res["main_rows"])
+        if op == OP_COMPACT:
+            utils.compact_delta()
+            return struct.pack(">B", ST_OK)
+        if op == OP_PART_SEARCH:
+            k_fusion, _, items = read_part_search(r)
+            return pack_part_hits(*utils.partition_search_batch(items, k_fusion))
+        if op == OP_PART_INFO:
+            return struct.pack(">B", ST_OK) + pack_str(json.dumps(utils.partition_info()), wide=True)
+        return pack_error(f"unknown op {op}")
+
+class RetrievalServer(_Dispatch, socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, batcher: Batcher):
+        self.batcher = batcher
+        super().__init__(path, _Handler)
+
+class TcpRetrievalServer(_Dispatch, socketserver.ThreadingTCPServer):
+    """Same protocol over TCP, for nodes on other machines (no auth: keep it on a private network)."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: str, batcher: Batcher):
+        self.batcher = batcher
+        host, port = address.rsplit(":", 1)
+        super().__init__((host, int(port)), _Handler)
+
+def main():
+    ap = argparse.ArgumentParser(description="Agri Advisor retrieval daemon")
+    ap.add_argument("--socket", default=os.getenv("RETRIEVAL_SOCKET", DEFAULT_SOCKET))
+    ap.add_argument("--max-batch", type=int, default=16, help="max queries per batch")
+    ap.add_argument("--batch-wait-ms", type=float, default=5.0, help="how long to wait to fill a batch")
+    ap.add_argument("--workers", type=int, default=1, help="batches processed in parallel")
+    ap.add_argument("--listen", metavar="HOST:PORT", help="serve over TCP instead of the Unix socket")
+    ap.add_argument("--partition", type=int, default=None, metavar="I",
+                    help="serve part I of a partitioned index (index_builder.py --partitions)")
+    args = ap.parse_args()
+
+    utils.RETRIEVAL_SOCKET = None   # this process *is* the retrieval backend
+    if args.partition is not None:
+        utils.PARTITION = args.partition
+        utils.PARTITION_NODES = []
+        print(f"Loading partition {args.partition}…")
+        utils.get_engine()
+        utils.partition_info()   # fails now if CURRENT has no such part
+    elif utils.PARTITION_NODES:
+        print(f"Coordinating {len(utils.PARTITION_NODES)} partition nodes…")
+        utils.warm_up(background=False)
+    else:
+        print("Loading retrieval engine…")
+        utils.get_engine()
+        utils._get_reranker()
+
+    batcher = Batcher(args.max_batch, args.batch_wait_ms, args.workers)
+    if args.listen:
+        server = TcpRetrievalServer(args.listen, batcher)
+    else:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = RetrievalServer(args.socket, batcher)
+        os.chmod(args.socket, 0o660)
+    signal.signal(signal.SIGHUP, lambda *_: utils.reload_engine())
+    print(f"Retrieval daemon listening on {args.listen or args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if not args.listen and os.path.exists(args.socket):
+            os.remove(args.socket)
+        if batcher.batches:
+            print(f"Served {batcher.requests} requests in {batcher.batches} batches "
+                  f"(avg {batcher.requests / batcher.batches:.1f}/batch)")
+
+if __name__ == "__main__":
+    main()
@@ -111,6 +111,50 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Shared cache: rate-limit and admission state must be visible to every worker.
+# Uses Redis when REDIS_URL is set, else a DB table (`python manage.py createcachetable`).
+# "translations" holds translated sentences (chat/translation.py): no expiry, and its
+# own table so culling rate-limit keys never evicts them.
+# Admission leases (chat/throttling.py) use the same Redis, else the chat_admissionlease table.
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'translations': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'TIMEOUT': None,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'agri_cache',
+        },
+        'translations': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'agri_translation_cache',
+            'TIMEOUT': None,
+            'OPTIONS': {'MAX_ENTRIES': 500000},
+        },
+    }
+
+# Token buckets per endpoint class (chat/throttling.py): (burst, requests per minute)
+RATE_LIMITS = {
+    'chat':       {'user': (5, 20), 'ip': (10, 60)},
+    'transcribe': {'user': (3, 10), 'ip': (6, 30)},
+}
+
+# Global concurrency caps with a bounded wait queue; seconds for max_wait / lease
+ADMISSION = {
+    'chat':       {'max_concurrent': 16, 'max_queue': 64, 'max_wait': 15, 'lease': 180},
+    'transcribe': {'max_concurrent': 2,  'max_queue': 8,  'max_wait': 10, 'lease': 120},
+}
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'AUTH_HEADER_TYPES': ('Bearer',),
@@ -0,0 +1,200 @@
+# singleflight.py
+# -----------------------------------------------------------------------------
+# Request coalescing for identical in-flight questions.
+# - Callers that share a key while one computation is running wait for it and
+#   get the same result instead of running their own retrieval + Gemini call.
+# - SingleFlight      → threads inside one process
+# - FileSingleFlight  → adds a per-key file lock so several worker processes on
+#                       the same box coalesce too (result handed over on disk)
+# - AsyncSingleFlight → coroutines on one event loop (ASGI path)
+# -----------------------------------------------------------------------------
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Run fn() once per key among concurrent callers in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.leaders = 0      # computations actually run
+        self.coalesced = 0    # callers served by someone else's computation
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run(key, fn)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result
+
+    def _run(self, key: str, fn: Callable[[], Any]) -> Any:
+        return fn()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
+
+
+class FileSingleFlight(SingleFlight):
+    """
+    Cross-process variant. Threads are still coalesced in memory first; the
+    thread that leads in this process then takes a per-key file lock. If another
+    process finished the same key while we waited on the lock, its result is
+    reused instead of recomputed. Results must be JSON-serialisable.
+    """
+
+    SWEEP_EVERY = 100        # leader runs between sweeps of old result files
+    RESULT_MAX_AGE = 300     # seconds a result file is kept around
+
+    def __init__(self, lock_dir: str):
+        super().__init__()
+        from filelock import FileLock  # only needed in cross-process mode
+        self._FileLock = FileLock
+        self.lock_dir = lock_dir
+        os.makedirs(lock_dir, exist_ok=True)
+        self.cross_process_coalesced = 0
+
+    def _paths(self, key: str):
+        base = os.path.join(self.lock_dir, key)
+        return base + ".lock", base + ".json"
+
+    def _run(self, key: str, fn: Callable[[], Any]) -> Any:
+        lock_path, result_path = self._paths(key)
+        arrived = time.time()
+        with self._FileLock(lock_path):
+            # Someone finished this key after we showed up → that was the in-flight call.
+            try:
+                with open(result_path, "r", encoding="utf-8") as f:
+                    payload = json.load(f)
+                if payload.get("ts", 0) >= arrived:
+                    with self._lock:
+                        self.coalesced += 1
+                        self.cross_process_coalesced += 1
+                    return payload["result"]
+            except (OSError, ValueError, KeyError):
+                pass
+
+            result = fn()
+            tmp = f"{result_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"ts": time.time(), "result": result}, f, ensure_ascii=False)
+            os.replace(tmp, result_path)
+
+        if self.leaders % self.SWEEP_EVERY == 0:
+            self._sweep()
+        return result
+
+    def _sweep(self):
+        cutoff = time.time() - self.RESULT_MAX_AGE
+        try:
+            names = os.listdir(self.lock_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
+
+    def stats(self) -> Dict[str, int]:
+        s = super().stats()
+        s["cross_process_coalesced"] = self.cross_process_coalesced
+        return s
+
+
+class AsyncSingleFlight:
+    """
+    Event-loop variant. The shared computation runs as its own task so one
+    caller disconnecting doesn't cancel it for the others; it is cancelled
+    only when every waiter has gone away.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, list] = {}   # key -> [task, waiters]
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, coro_fn: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(coro_fn())
+            entry = self._entries[key] = [task, 0]
+            task.add_done_callback(lambda _t, k=key, e=entry: self._forget(k, e))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        except asyncio.CancelledError:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                entry[0].cancel()
+            raise
+
+    def _forget(self, key: str, entry: list):
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._entries),
+        }
+
+
+def make_key(signals: Dict[str, Any], text: str) -> str:
+    """Stable key from canonical query signals + normalized question text."""
+    canon = {k: v for k, v in signals.items() if k != "raw"}
+    blob = json.dumps({"s": canon, "q": text}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
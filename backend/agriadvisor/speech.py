@@ -0,0 +1,24 @@
+# speech.py
+# Lazily loaded Whisper model for /api/transcribe/ (importing whisper pulls in torch).
+
+import threading
+
+WHISPER_MODEL = "medium"
+
+_model = None
+_lock = threading.Lock()
+
+def get_whisper_model():
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                import whisper
+                from agriadvisor import model_bundle, utils
+                print(f"Loading Whisper ({WHISPER_MODEL})…")
+                path = utils.model_path(WHISPER_MODEL)
+                _model = whisper.load_model(WHISPER_MODEL) if path == WHISPER_MODEL else model_bundle.load_whisper(path)
+    return _model
+
+def is_loaded() -> bool:
+    return _model is not None
@@ -0,0 +1,66 @@
+# fixtures.py
+# -----------------------------------------------------------------------------
+# Tiny, randomly initialised models for tests (no hub download, CPU, seconds):
+# a BERT SentenceTransformer (Transformer + mean Pooling + Normalize, the layout
+# query_encoder.export expects) and a BERT CrossEncoder, over a small word-level
+# vocabulary of the corpus' agri words. Vectors are meaningless; what tests check
+# is that two code paths agree on them.
+# -----------------------------------------------------------------------------
+
+import os
+import importlib.util
+
+VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + """
+    what when which how is the best time of for in to and a price rainfall yield sowing variety
+    wheat rice paddy maize cotton mustard sugarcane soybean groundnut crop crops production area
+    punjab haryana rajasthan bihar assam gujarat maharashtra india state district
+    january february march april may june july august september october november december
+    mm tonnes hectare kg quintal rupees normal actual season kharif rabi market mandi scheme
+    sow seed rate fertilizer irrigation 2019 2020 2021 2022 2023 ##s ##ing ##ed
+""".split()
+HIDDEN = 32
+
+def has_modules(*names: str) -> bool:
+    return all(importlib.util.find_spec(n) is not None for n in names)
+
+def _tokenizer(out_dir: str):
+    from transformers import BertTokenizerFast
+    os.makedirs(out_dir, exist_ok=True)
+    vocab = os.path.join(out_dir, "vocab.txt")
+    with open(vocab, "w", encoding="utf-8") as f:
+        f.write("\n".join(VOCAB))
+    tok = BertTokenizerFast(vocab)
+    tok.save_pretrained(out_dir)
+    return tok
+
+def _config(**kw):
+    from transformers import BertConfig
+    return BertConfig(vocab_size=len(VOCAB), hidden_size=HIDDEN, num_hidden_layers=2, num_attention_heads=2,
+                      intermediate_size=2 * HIDDEN, max_position_embeddings=512, **kw)
+
+def tiny_sentence_transformer(out_dir: str, max_seq_len: int = 32, seed: int = 0) -> str:
+    """Save a tiny SentenceTransformer to out_dir; returns out_dir."""
+    import torch
+    from transformers import BertModel
+    from sentence_transformers import SentenceTransformer, models
+
+    torch.manual_seed(seed)
+    hf = os.path.join(out_dir, "hf")
+    _tokenizer(hf)
+    BertModel(_config()).save_pretrained(hf)
+    word = models.Transformer(hf, max_seq_length=max_seq_len)
+    st = SentenceTransformer(modules=[word, models.Pooling(HIDDEN, "mean"), models.Normalize()], device="cpu")
+    st.save(out_dir)
+    return out_dir
+
+def tiny_cross_encoder(out_dir: str, seed: int = 0) -> str:
+    """Save a tiny one-label CrossEncoder to out_dir; returns out_dir."""
+    import torch
+    from transformers import BertForSequenceClassification
+    from sentence_transformers import CrossEncoder
+
+    torch.manual_seed(seed)
+    _tokenizer(out_dir)
+    BertForSequenceClassification(_config(num_labels=1)).save_pretrained(out_dir)
+    CrossEncoder(out_dir, device="cpu").save(out_dir)
+    return out_dir
@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+
+import numpy as np
+
+from agriadvisor.tests import fixtures
+from agriadvisor.tests.test_partitions import BACKEND_DIR, INDEX_BUILDER, fixture_records
+
+LONG_TEXT = " ".join(["wheat sowing in punjab in november"] * 40)   # past the query encoder's 128 tokens
+
+
+@unittest.skipUnless(fixtures.has_modules("torch", "faiss", "sentence_transformers"),
+                     "needs torch, faiss and sentence-transformers")
+class LiveIngestTests(unittest.TestCase):
+    """Ingest into the live delta segment and compact it into a new version."""
+
+    @classmethod
+    def setUpClass(cls):
+        from agriadvisor import model_bundle, utils
+
+        cls.tmp = tempfile.mkdtemp(prefix="agri-delta-")
+        try:
+            models = os.path.join(cls.tmp, "models")
+            model_bundle.pack(os.path.join(cls.tmp, "artifacts", model_bundle.BUNDLE_SUBDIR), {
+                utils.EMB_MODEL: ("sentence-transformer", fixtures.tiny_sentence_transformer(os.path.join(models, "emb"))),
+                utils.RERANK_MODEL: ("cross-encoder", fixtures.tiny_cross_encoder(os.path.join(models, "rerank"))),
+            })
+            os.makedirs(os.path.join(cls.tmp, "data"))
+            with open(os.path.join(cls.tmp, "data", "fixture.jsonl"), "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(d) + "\n" for d in fixture_records())
+            env = {k: v for k, v in os.environ.items() if k not in ("PARTITION_NODES", "RETRIEVAL_SOCKET")}
+            env.update(PYTHONPATH=BACKEND_DIR)
+            build = subprocess.run([sys.executable, INDEX_BUILDER], cwd=cls.tmp, env=env, capture_output=True, text=True)
+            if build.returncode:
+                raise RuntimeError(f"index_builder.py failed:\n{build.stdout[-3000:]}\n{build.stderr[-3000:]}")
+        except BaseException:
+            shutil.rmtree(cls.tmp, ignore_errors=True)
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def setUp(self):
+        from agriadvisor import utils
+        patch = mock.patch.multiple(
+            utils, ART_DIR=os.path.join(self.tmp, "artifacts"), PARTITION_NODES=[], RETRIEVAL_SOCKET=None,
+            QUERY_ENCODER="torch", MULTILINGUAL="off", DELTA_COMPACT_ROWS=10 ** 6, _engine=None, _bundle={},
+            _reranker=None, _partition_set=None, _query_embedder=None, _doc_embedder=None)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_duplicates_compact_to_one_row(self):
+        from agriadvisor import utils
+        rec = {"text": "Scheme: soil health card. Free soil testing for farmers.", "source": "schemes.csv#row=7",
+               "metric": "scheme", "state": None}
+        utils.ingest_docs([rec])
+        utils.ingest_docs([dict(rec, state="punjab"), {"text": "Mandi price of mustard in Haryana.",
+                                                       "source": "mandi.csv#row=1"}])
+        self.assertEqual(utils.get_engine().delta.n, 3)
+        n_main = utils.get_engine().n_docs
+
+        utils.compact_delta(background=False)
+        eng = utils.get_engine()
+        self.assertIsNone(utils._COMPACT["last_error"])
+        self.assertEqual(eng.n_docs, n_main + 2)
+        self.assertEqual(eng.index.ntotal, eng.n_docs)
+        ids = np.asarray(eng.store.ids)
+        self.assertEqual(len(np.unique(ids)), len(ids))
+        with open(eng.corpus_path, "r", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if "schemes.csv#row=7" in line]
+        self.assertEqual(rows, [dict(rec, state="punjab")])   # the last copy wins
+
+        # Re-ingesting a row that is already in main doesn't add it a second time
+        utils.ingest_docs([dict(rec, state="punjab")])
+        utils.compact_delta(background=False)
+        eng = utils.get_engine()
+        self.assertIsNone(utils._COMPACT["last_error"])
+        self.assertEqual(eng.n_docs, n_main + 2)
+        self.assertEqual(len(np.unique(np.asarray(eng.store.ids))), eng.n_docs)
+
+    def test_rows_are_encoded_like_the_build(self):
+        from sentence_transformers import SentenceTransformer
+        from agriadvisor import utils
+        eng = utils.get_engine()
+        builder = SentenceTransformer(utils.model_path(utils.EMB_MODEL), device="cpu")
+        builder.max_seq_length = 256   # index_builder.MAX_SEQ_LEN
+        expected = builder.encode([LONG_TEXT], normalize_embeddings=True, convert_to_numpy=True)
+        np.testing.assert_allclose(eng.encode_docs([LONG_TEXT]), expected, atol=1e-5)
+        query = eng.embedder.encode([LONG_TEXT], normalize_embeddings=True, convert_to_numpy=True)
+        self.assertLess(float(query[0] @ expected[0]), 0.9999)
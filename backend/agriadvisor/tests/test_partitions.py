@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+
+from agriadvisor import partitions, retrieval_proto
+from agriadvisor.tests import fixtures
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+INDEX_BUILDER = os.path.join(os.path.dirname(BACKEND_DIR), "index_builder.py")
+NODE_START_SECONDS = 180
+
+STATES = ("Punjab", "Haryana", "Bihar")
+CROPS = ("wheat", "rice", "mustard", "maize")
+YEARS = (2019, 2020, 2021)
+# Filtered pools are at most MAX_CTX_SNIPPETS docs, so the evidence is the whole pool and
+# doesn't depend on per-part BM25 statistics or cross-encoder ties.
+QUERIES = [
+    "rainfall in punjab",                 # metric beats state: all-India rainfall, not Punjab yields
+    "rainfall in haryana",
+    "monsoon rainfall in july 2019",
+    "wheat yield in haryana",
+    "rice production in bihar in 2020",
+    "mustard yield in punjab",
+    "maize yield in 2021",
+    "temperature for cotton",
+]
+
+def fixture_records():
+    """All-India rainfall + crop_env docs (no state) and per-state crop_stats docs."""
+    recs = []
+    for year in (2019, 2020):
+        for month, mm in (("Jun", 160.2), ("Jul", 280.4), ("Aug", 255.1)):
+            recs.append({"text": f"Year: {year}. Month: {month}. Monsoon rainfall {mm + year % 10} mm "
+                                 f"(departure {year % 7 - 3:.1f}%).",
+                         "source": f"rainfall.csv#year={year}/month={month}", "state": None,
+                         "region": "all-india", "metric": "rainfall", "year": year, "months": [month]})
+    for crop, temp in (("rice", 25), ("wheat", 18), ("maize", 22), ("cotton", 27), ("mustard", 16), ("sugarcane", 30)):
+        for n in range(4):
+            recs.append({"text": f"Crop: {crop}. Conditions: temperature {temp + n} °C; humidity {60 + 5 * n} %.",
+                         "source": f"crop_env.csv#crop={crop}/row{n}", "state": None, "crop": crop,
+                         "metric": "crop_env", "year": None, "months": None})
+    for state in STATES:
+        for crop in CROPS:
+            for year in YEARS:
+                recs.append({"text": f"State: {state}. Year: {year}. Season: rabi. Crop: {crop}. "
+                                     f"Production: {len(state) * 100 + year % 100} (source units).",
+                             "source": f"crop_yield.csv#state={state}/year={year}/crop={crop}",
+                             "state": state.lower(), "crop": crop, "season": "rabi",
+                             "metric": "crop_stats", "year": year, "months": None})
+    return recs
+
+
+class MergeHitsTests(unittest.TestCase):
+
+    def test_earlier_filter_outranks_later(self):
+        from agriadvisor import utils
+        kept_metric = utils.miss_mask(["state", "region"])
+        kept_state = utils.miss_mask(["metric"])
+        self.assertLess(kept_metric, kept_state)
+        dense, bm = partitions.merge_hits([(0, (kept_state, [(0, 0.9)], [(0, 3.0)])),
+                                           (1, (kept_metric, [(0, 0.5)], [(0, 1.0)]))], k_fusion=10)
+        self.assertEqual(dense, [(1, 0)])
+        self.assertEqual(bm, [(1, 0)])
+
+    def test_equal_masks_merge(self):
+        dense, _ = partitions.merge_hits([(0, (0, [(0, 0.4)], [])), (1, (0, [(3, 0.8)], []))], k_fusion=10)
+        self.assertEqual(dense, [(1, 3), (0, 0)])
+
+
+@unittest.skipUnless(fixtures.has_modules("torch", "faiss", "sentence_transformers"),
+                     "needs torch, faiss and sentence-transformers")
+class PartitionedSearchTests(unittest.TestCase):
+    """Two --partition daemons on Unix sockets against the unpartitioned engine, same version."""
+
+    @classmethod
+    def setUpClass(cls):
+        from agriadvisor import model_bundle, utils
+
+        cls.tmp = tempfile.mkdtemp(prefix="agri-part-")
+        cls.nodes = []
+        try:
+            cls._build(model_bundle, utils)
+            cls._start_nodes()
+        except BaseException:
+            cls.tearDownClass()
+            raise
+        cls.patch = mock.patch.multiple(
+            utils, ART_DIR=os.path.join(cls.tmp, "artifacts"), PARTITION_NODES=[], RETRIEVAL_SOCKET=None,
+            QUERY_ENCODER="torch", MULTILINGUAL="off", _engine=None, _bundle={}, _reranker=None,
+            _partition_set=None, _query_embedder=None)
+        cls.patch.start()
+
+    @classmethod
+    def _env(cls):
+        env = {k: v for k, v in os.environ.items() if k not in ("PARTITION_NODES", "RETRIEVAL_SOCKET")}
+        env.update(PYTHONPATH=BACKEND_DIR, QUERY_ENCODER="torch", MULTILINGUAL="off", COALESCE_MODE="off")
+        return env
+
+    @classmethod
+    def _build(cls, model_bundle, utils):
+        models = os.path.join(cls.tmp, "models")
+        model_bundle.pack(os.path.join(cls.tmp, "artifacts", model_bundle.BUNDLE_SUBDIR), {
+            utils.EMB_MODEL: ("sentence-transformer", fixtures.tiny_sentence_transformer(os.path.join(models, "emb"))),
+            utils.RERANK_MODEL: ("cross-encoder", fixtures.tiny_cross_encoder(os.path.join(models, "rerank"))),
+        })
+        os.makedirs(os.path.join(cls.tmp, "data"))
+        with open(os.path.join(cls.tmp, "data", "fixture.jsonl"), "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(d) + "\n" for d in fixture_records())
+        build = subprocess.run([sys.executable, INDEX_BUILDER, "--partitions", "2", "--partition-by", "state"],
+                               cwd=cls.tmp, env=cls._env(), capture_output=True, text=True)
+        if build.returncode:
+            raise RuntimeError(f"index_builder.py failed:\n{build.stdout[-3000:]}\n{build.stderr[-3000:]}")
+
+    @classmethod
+    def _start_nodes(cls):
+        run_dir = os.path.join(cls.tmp, "backend")   # ART_DIR is ../artifacts from here
+        os.makedirs(run_dir)
+        cls.sockets = [os.path.join(cls.tmp, f"part{i}.sock") for i in range(2)]
+        for i, sock in enumerate(cls.sockets):
+            log = open(os.path.join(cls.tmp, f"part{i}.log"), "w")
+            cls.nodes.append((subprocess.Popen(
+                [sys.executable, "-m", "agriadvisor.retrieval_server", "--partition", str(i), "--socket", sock],
+                cwd=run_dir, env=cls._env(), stdout=log, stderr=subprocess.STDOUT), log))
+        deadline = time.monotonic() + NODE_START_SECONDS
+        for (proc, log), sock in zip(cls.nodes, cls.sockets):
+            client = retrieval_proto.RetrievalClient(sock, timeout=5.0)
+            while not (os.path.exists(sock) and client.ping()):
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    log.flush()
+                    with open(log.name, "r", encoding="utf-8") as f:
+                        raise RuntimeError(f"partition node {sock} did not come up:\n{f.read()[-3000:]}")
+                time.sleep(0.2)
+
+    @classmethod
+    def tearDownClass(cls):
+        if getattr(cls, "patch", None):
+            cls.patch.stop()
+        for proc, log in cls.nodes:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            log.close()
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def partitioned(self, qs):
+        from agriadvisor import utils
+        with mock.patch.object(utils, "PARTITION_NODES", self.sockets):
+            return utils._retrieve_batch_partitioned(qs, utils.TOP_K_FUSION, utils.RERANK_KEEP)
+
+    def test_build_split_by_state(self):
+        from agriadvisor import corpus_store
+        pmap = partitions.load_map(corpus_store.current_art_dir(os.path.join(self.tmp, "artifacts")))
+        self.assertEqual(pmap["by"], "state")
+        self.assertEqual(len(pmap["parts"]), 2)
+        infos = [retrieval_proto.RetrievalClient(s).part_info() for s in self.sockets]
+        self.assertEqual(sorted(i["partition"] for i in infos), [0, 1])
+        self.assertEqual(sum(i["docs"] for i in infos), len(fixture_records()))
+
+    def test_matches_unpartitioned_engine(self):
+        from agriadvisor import utils
+        single = utils.retrieve_batch(QUERIES)
+        parted = self.partitioned(QUERIES)
+        for q, (s1, ev1, maj1), (s2, ev2, maj2) in zip(QUERIES, single, parted):
+            with self.subTest(q=q):
+                self.assertEqual(s1, s2)
+                self.assertTrue(ev1)
+                self.assertEqual(sorted(e["source"] for e in ev1), sorted(e["source"] for e in ev2))
+                self.assertEqual(maj1, maj2)
+
+    def test_metric_filter_wins_over_state(self):
+        _, evidence, _ = self.partitioned(["rainfall in punjab"])[0]
+        self.assertEqual(len(evidence), 6)
+        self.assertTrue(all(e["source"].startswith("rainfall.csv") for e in evidence), evidence)
@@ -0,0 +1,91 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from agriadvisor import query_encoder
+from agriadvisor.tests import fixtures
+
+MAX_SEQ_LEN = 16
+CHECK_TEXTS = ["best sowing time for wheat in punjab", "rice price", "rainfall in bihar in july",
+               " ".join(["wheat"] * 40)]
+# Different lengths in one batch (padding) and longer than MAX_SEQ_LEN tokens (truncation)
+TEXTS = ["wheat", "what is the best variety of mustard for rajasthan",
+         "cotton yield", " ".join(["maize production in gujarat"] * 8), "kharif paddy"]
+
+
+@unittest.skipUnless(fixtures.has_modules("torch", "onnx", "onnxruntime", "sentence_transformers"),
+                     "needs torch, onnx, onnxruntime and sentence-transformers")
+class OnnxQueryEncoderTests(unittest.TestCase):
+    """The exported graph + fast tokenizer against SentenceTransformer on a tiny model."""
+
+    @classmethod
+    def setUpClass(cls):
+        from sentence_transformers import SentenceTransformer
+        cls.tmp = tempfile.mkdtemp(prefix="agri-qe-")
+        src = fixtures.tiny_sentence_transformer(os.path.join(cls.tmp, "model"), max_seq_len=MAX_SEQ_LEN)
+        cls.st = SentenceTransformer(src, device="cpu")
+        cls.st.max_seq_length = MAX_SEQ_LEN
+        cls.fp32_root, cls.int8_root = os.path.join(cls.tmp, "fp32"), os.path.join(cls.tmp, "int8")
+        cls.fp32_meta = query_encoder.export("tiny", cls.fp32_root, CHECK_TEXTS, int8=False,
+                                             max_seq_len=MAX_SEQ_LEN, source=src)
+        cls.int8_meta = query_encoder.export("tiny", cls.int8_root, CHECK_TEXTS, int8=True,
+                                             max_seq_len=MAX_SEQ_LEN, source=src)
+        cls.src = src
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def reference(self, texts):
+        return self.st.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+
+    def encoder(self, root):
+        return query_encoder.OnnxQueryEncoder(query_encoder.encoder_dir(root, "tiny"), warmup=0)
+
+    def test_fp32_matches_sentence_transformer(self):
+        got = self.encoder(self.fp32_root).encode(TEXTS)
+        self.assertEqual(got.dtype, np.float32)
+        self.assertEqual(got.shape, (len(TEXTS), fixtures.HIDDEN))
+        np.testing.assert_allclose(np.linalg.norm(got, axis=1), 1.0, atol=1e-5)
+        self.assertGreater(float(np.sum(got * self.reference(TEXTS), axis=1).min()), 0.9999)
+
+    def test_padding_does_not_change_vectors(self):
+        enc = self.encoder(self.fp32_root)
+        batched = enc.encode(TEXTS, batch_size=len(TEXTS))
+        alone = np.stack([enc.encode(t) for t in TEXTS])
+        np.testing.assert_allclose(batched, alone, atol=1e-5)
+
+    def test_truncates_like_sentence_transformer(self):
+        enc = self.encoder(self.fp32_root)
+        self.assertEqual(enc.max_seq_length, MAX_SEQ_LEN)
+        long = " ".join(["rice yield in assam"] * 10)
+        self.assertEqual(len(enc.tokenizer.encode(long).ids), MAX_SEQ_LEN)
+        # Words past the limit are cut off, as SentenceTransformer does
+        np.testing.assert_allclose(enc.encode(long), enc.encode(long + " cotton price in punjab"), atol=1e-6)
+        self.assertGreater(float(enc.encode(long) @ self.reference([long])[0]), 0.9999)
+
+    def test_int8_within_tolerance(self):
+        check = self.int8_meta["check"]
+        self.assertEqual(self.int8_meta["file"], "model.int8.onnx")
+        self.assertGreaterEqual(check["min_cosine"], query_encoder.MIN_COSINE)
+        got = self.encoder(self.int8_root).encode(TEXTS)
+        self.assertGreaterEqual(float(np.sum(got * self.reference(TEXTS), axis=1).min()), query_encoder.MIN_COSINE)
+
+    def test_meta_records_the_check(self):
+        path = os.path.join(query_encoder.encoder_dir(self.fp32_root, "tiny"), query_encoder.META)
+        with open(path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.assertEqual(meta["max_seq_len"], MAX_SEQ_LEN)
+        self.assertEqual(meta["dim"], fixtures.HIDDEN)
+        self.assertEqual(meta["check"]["texts"], len(CHECK_TEXTS))
+
+    def test_export_below_tolerance_is_not_servable(self):
+        root = os.path.join(self.tmp, "strict")
+        with self.assertRaises(RuntimeError):
+            query_encoder.export("tiny", root, CHECK_TEXTS, int8=True, max_seq_len=MAX_SEQ_LEN,
+                                 min_cosine=1.01, source=self.src)
+        self.assertFalse(query_encoder.is_exported(root, "tiny"))
@@ -0,0 +1,185 @@
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from agriadvisor.singleflight import AsyncSingleFlight, FileSingleFlight, SingleFlight, make_key
+
+WAITERS = 5
+
+
+class SingleFlightTests(unittest.TestCase):
+
+    def run_concurrently(self, flight, key, fn, n=WAITERS):
+        """n threads call flight.do(key, fn) once fn is known to be running; returns results / errors."""
+        out = [None] * n
+
+        def call(i):
+            try:
+                out[i] = flight.do(key, fn)
+            except Exception as e:
+                out[i] = e
+
+        first = threading.Thread(target=call, args=(0,))
+        first.start()
+        self.started.wait(5)
+        rest = [threading.Thread(target=call, args=(i,)) for i in range(1, n)]
+        for t in rest:
+            t.start()
+        while flight.stats()["coalesced"] < n - 1:   # everyone is waiting on the leader
+            time.sleep(0.005)
+        self.release.set()
+        for t in [first] + rest:
+            t.join(5)
+        return out
+
+    def setUp(self):
+        self.started, self.release = threading.Event(), threading.Event()
+        self.calls = 0
+
+    def slow(self, result=None, error=None):
+        def fn():
+            self.calls += 1
+            self.started.set()
+            self.release.wait(5)
+            if error is not None:
+                raise error
+            return result
+        return fn
+
+    def test_concurrent_callers_share_one_run(self):
+        flight = SingleFlight()
+        out = self.run_concurrently(flight, "k", self.slow(result={"answer": 42}))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(out, [{"answer": 42}] * WAITERS)
+        self.assertEqual(flight.stats(), {"leaders": 1, "coalesced": WAITERS - 1, "in_flight": 0})
+
+    def test_error_reaches_every_waiter(self):
+        flight = SingleFlight()
+        boom = RuntimeError("gemini down")
+        out = self.run_concurrently(flight, "k", self.slow(error=boom))
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(e is boom for e in out), out)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_finished_key_runs_again(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do("k", lambda: 1), 1)
+        self.assertEqual(flight.do("k", lambda: 2), 2)
+        self.assertEqual(flight.stats()["leaders"], 2)
+
+    def test_different_keys_do_not_wait(self):
+        flight = SingleFlight()
+        self.assertEqual([flight.do(k, lambda k=k: k) for k in "abc"], ["a", "b", "c"])
+        self.assertEqual(flight.stats()["coalesced"], 0)
+
+
+class FileSingleFlightTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="agri-sf-")
+        self.addCleanup(shutil.rmtree, self.dir, True)
+
+    def test_other_process_result_is_reused(self):
+        # Two instances over one lock dir stand in for two worker processes
+        a, b = FileSingleFlight(self.dir), FileSingleFlight(self.dir)
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def leader():
+            calls.append("a")
+            started.set()
+            release.wait(5)
+            return {"text": "answer"}
+
+        t = threading.Thread(target=lambda: a.do("k", leader))
+        t.start()
+        started.wait(5)
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(b.do("k", lambda: calls.append("b") or {"text": "again"})))
+        waiter.start()
+        time.sleep(0.2)   # b is blocked on the file lock
+        release.set()
+        t.join(5)
+        waiter.join(5)
+        self.assertEqual(calls, ["a"])
+        self.assertEqual(got, [{"text": "answer"}])
+        self.assertEqual(b.stats()["cross_process_coalesced"], 1)
+
+    def test_old_result_is_not_reused(self):
+        flight = FileSingleFlight(self.dir)
+        self.assertEqual(flight.do("k", lambda: "first"), "first")
+        self.assertEqual(flight.do("k", lambda: "second"), "second")
+
+
+class AsyncSingleFlightTests(unittest.TestCase):
+
+    def test_coalesces_and_survives_one_cancelled_waiter(self):
+        async def main():
+            flight = AsyncSingleFlight()
+            release = asyncio.Event()
+            calls = []
+
+            async def fn():
+                calls.append(1)
+                await release.wait()
+                return "answer"
+
+            tasks = [asyncio.ensure_future(flight.do("k", fn)) for _ in range(3)]
+            await asyncio.sleep(0)
+            tasks[0].cancel()   # one client disconnects
+            await asyncio.sleep(0)
+            release.set()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            return calls, results, flight.stats()
+
+        calls, results, stats = asyncio.run(main())
+        self.assertEqual(calls, [1])
+        self.assertIsInstance(results[0], asyncio.CancelledError)
+        self.assertEqual(results[1:], ["answer", "answer"])
+        self.assertEqual(stats, {"leaders": 1, "coalesced": 2, "in_flight": 0})
+
+    def test_cancelled_when_every_waiter_leaves(self):
+        async def main():
+            flight = AsyncSingleFlight()
+            cancelled = asyncio.Event()
+
+            async def fn():
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+
+            tasks = [asyncio.ensure_future(flight.do("k", fn)) for _ in range(2)]
+            await asyncio.sleep(0)
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.wait_for(cancelled.wait(), 1)
+            await asyncio.sleep(0)
+            return flight.stats()
+
+        self.assertEqual(asyncio.run(main())["in_flight"], 0)
+
+    def test_error_reaches_every_waiter(self):
+        async def main():
+            flight = AsyncSingleFlight()
+
+            async def fn():
+                await asyncio.sleep(0.01)
+                raise ValueError("bad")
+            return await asyncio.gather(*(flight.do("k", fn) for _ in range(3)), return_exceptions=True)
+
+        self.assertTrue(all(isinstance(e, ValueError) for e in asyncio.run(main())))
+
+
+class MakeKeyTests(unittest.TestCase):
+
+    def test_raw_text_is_ignored_and_order_is_stable(self):
+        a = make_key({"intent": "rainfall", "state": "punjab", "raw": "Rainfall in Punjab?"}, "rainfall in punjab")
+        b = make_key({"state": "punjab", "raw": "rainfall punjab", "intent": "rainfall"}, "rainfall in punjab")
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, make_key({"intent": "rainfall", "state": "bihar"}, "rainfall in punjab"))
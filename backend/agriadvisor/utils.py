@@ -8,22 +8,30 @@
 # - CLI loop for quick testing
 #
 # One-time: build the index with index_builder.py (creates ./artifacts/index_flatip.faiss + corpus.jsonl)
+#
+# Importing this module is cheap: the corpus, BM25, embedder, FAISS index and
+# Gemini client are loaded on first use (get_engine / get_gemini), so manage.py
+# commands never pay for them. Servers can warm up in the background (warm_up).
 # -----------------------------------------------------------------------------
 
 import os
 import re
 import json
 import time
+import threading
+from contextlib import contextmanager
 from typing import List, Dict, Any, Tuple
 
 import numpy as np
-import faiss
-import torch
 
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer, CrossEncoder
-from rank_bm25 import BM25Okapi
-from google import genai  # google-genai SDK
+
+try:
+    from agriadvisor.singleflight import SingleFlight, FileSingleFlight, make_key
+    from agriadvisor import corpus_store, delta, retrieval_proto, query_encoder, model_bundle, partitions, metric_index, multilingual
+except ImportError:  # running this file directly as a script
+    from singleflight import SingleFlight, FileSingleFlight, make_key
+    import corpus_store, delta, retrieval_proto, query_encoder, model_bundle, partitions, metric_index, multilingual
 
 # ---------- Config ----------
 EMB_MODEL = "all-MiniLM-L6-v2"
@@ -41,23 +49,91 @@ RESET_EVERY_QUERY = True          # ignore previous turns
 ASK_FOR_MISSING_SLOTS = False     # don't ask; answer best-effort instead
 REQUIRE_EVIDENCE_MIN = False      # allow unverified fallback when evidence is thin
 
-# Optional Python BM25 (slow for ~850k docs). Keep OFF unless needed.
+# Request coalescing for identical in-flight questions:
+#   "off"    → every request runs its own retrieval + Gemini call
+#   "thread" → coalesce across threads of this process
+#   "file"   → also coalesce across worker processes via per-key file locks
+COALESCE_MODE = os.getenv("COALESCE_MODE", "thread")
+COALESCE_DIR = os.getenv("COALESCE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".coalesce"))
+
+# Sparse BM25 over the memory-mapped store postings.
 USE_PY_BM25 = True
 
 # ---------- Artifacts ----------
 ART_DIR = "../artifacts/"
 CORPUS_PATH = os.path.join(ART_DIR, "corpus.jsonl")
 INDEX_PATH = os.path.join(ART_DIR, "index_flatip.faiss")
+STORE_DIR = os.path.join(ART_DIR, "store")          # written by index_builder.py
+# Startup always checks snapshot file sizes and the FAISS pairing; "1" also
+# re-hashes every file (slow on big indexes — use for debugging bad deploys).
+VERIFY_CHECKSUMS = os.getenv("VERIFY_CHECKSUMS", "0") == "1"
+# Inverted lists probed per query when the version was built with --low-memory (IVF on disk)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "32"))
+# Compressed versions (--compress fp16/sq8/pq): fetch k × this many candidates from the
+# index and re-rank them by exact dot products with the mmapped float32 vectors (0 = off)
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "4"))
+# Versions built with --binary: dense search takes the top BINARY_CANDIDATES by Hamming
+# distance over sign bits, then re-scores them exactly (0 = search the FAISS index instead)
+BINARY_CANDIDATES = int(os.getenv("BINARY_CANDIDATES", "256"))
+# Versions with metric sub-indexes (see metric_index.py): a query whose intent pins a metric
+# searches only that metric's docs ("0" = always search the full index)
+METRIC_INDEXES = os.getenv("METRIC_INDEXES", "1") == "1"
+# Query encoder: "onnx" = graph from `manage.py export_query_encoder` (onnxruntime, int8,
+# no PyTorch per query), "torch" = SentenceTransformer, "auto" = onnx once one is exported
+QUERY_ENCODER = os.getenv("QUERY_ENCODER", "auto")
+QUERY_ENCODER_SUBDIR = "query_encoder"   # under ART_DIR, shared by all versions
+QUERY_MAX_SEQ_LEN = 128   # short for speed; queries are short
+DOC_MAX_SEQ_LEN = 256     # index_builder.py's MAX_SEQ_LEN: ingested rows are encoded like built ones
+# Hindi / Tamil / Bengali without translation (see multilingual.py): Indic-script queries are
+# encoded by MULTILINGUAL_MODEL through the map from `manage.py align_multilingual`, and chat
+# answers in the user's language directly. "auto" = once a map is built, "on" = required, "off"
+MULTILINGUAL = os.getenv("MULTILINGUAL", "auto")
+MULTILINGUAL_MODEL = os.getenv("MULTILINGUAL_MODEL", multilingual.MODEL)
+MULTILINGUAL_SUBDIR = "multilingual"   # under ART_DIR, shared by all versions
+# Models come from the bundle written by `manage.py bundle_models` (ART_DIR/models unless
+# set) once it has a CURRENT version: local files only, hub offline; otherwise by name.
+MODEL_BUNDLE_DIR = os.getenv("MODEL_BUNDLE_DIR")
+
+# Set → parse/filter/search/rerank run in the retrieval daemon (retrieval_server.py)
+# and this process never loads the corpus or models; unset → everything in-process.
+RETRIEVAL_SOCKET = os.getenv("RETRIEVAL_SOCKET")
+# Partitioned index (index_builder.py --partitions N, see partitions.py):
+#   PARTITION        → this process is the node for part i (retrieval_server.py --partition i)
+#   PARTITION_NODES  → coordinator: encode + rerank here, scatter filter/search to these nodes
+#                      (comma-separated Unix socket paths or host:port)
+PARTITION: int | None = None
+PARTITION_NODES = [a.strip() for a in os.getenv("PARTITION_NODES", "").split(",") if a.strip()]
+
+def _vector_index():
+    # Imported on first use like faiss itself, so client-mode web workers never load faiss
+    try:
+        from agriadvisor import vector_index
+    except ImportError:  # running this file directly as a script
+        import vector_index
+    return vector_index
 
 # ---------- Device ----------
-DEVICE = "mps" if torch.backends.mps.is_available() else "cpu"
+_device = None
+def get_device() -> str:
+    global _device
+    if _device is None:
+        import torch
+        _device = "mps" if torch.backends.mps.is_available() else "cpu"
+    return _device
 
 # ---------- Env & Gemini ----------
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise RuntimeError("Set GEMINI_API_KEY in your .env or shell!")
-gemini = genai.Client(api_key=GEMINI_API_KEY)
+
+_gemini = None
+def get_gemini():
+    global _gemini
+    if _gemini is None:
+        if not GEMINI_API_KEY:
+            raise RuntimeError("Set GEMINI_API_KEY in your .env or shell!")
+        from google import genai  # google-genai SDK
+        _gemini = genai.Client(api_key=GEMINI_API_KEY)
+    return _gemini
 
 # ---------- Utilities ----------
 def _norm(s: str) -> str:
@@ -151,10 +227,6 @@ def detect_intent(q: str) -> str:
         return "scheme"
     return "general"
 
-# These reference globals filled after meta is built; fine because they run at query-time.
-KNOWN_CROPS: set = set()
-KNOWN_DISTRICTS: set = set()
-
 def find_state(q: str) -> str | None:
     qn = _norm(q)
     for k, v in STATE_SYNONYMS.items():
@@ -165,19 +237,18 @@ def find_state(q: str) -> str | None:
             return s
     return None
 
-def find_district(q: str) -> str | None:
+def find_district(q: str, known_districts) -> str | None:
     qn = _norm(q)
-    for d in KNOWN_DISTRICTS:
+    for d in known_districts:
         if d and _has_phrase(qn, d):
             return d
     return None
 
-def find_crop(q: str) -> str | None:
+def find_crop(q: str, known_crops: List[str]) -> str | None:
     qn = _norm(q)
 
-    # try known crops (multi-word first)
-    known = sorted(list(KNOWN_CROPS), key=len, reverse=True)
-    for c in known:
+    # try known crops (multi-word first; the engine keeps them sorted by length)
+    for c in known_crops:
         if c and _has_phrase(qn, c):
             return c
 
@@ -201,15 +272,17 @@ def expand_with_synonyms(q: str) -> str:
             extra.extend([s for s in syns if s not in ql])
     return q if not extra else f"{q} ({', '.join(set(extra))})"
 
-def parse_query(q: str) -> Dict[str, Any]:
-    q_exp = expand_with_synonyms(q)
+def parse_query(q: str, gaz=None) -> Dict[str, Any]:
+    """gaz: anything with known_districts / crops_by_len (an Engine, or the daemon's gazetteer)."""
+    gaz = gaz or get_gazetteer()
+    q_exp = expand_with_synonyms(multilingual.expand_native(q))
     return {
         "intent": detect_intent(q_exp),
         "state": find_state(q_exp),
-        "district": find_district(q_exp),
+        "district": find_district(q_exp, gaz.known_districts),
         "month": find_month(q_exp),
         "year": find_year(q_exp),
-        "crop": find_crop(q_exp),
+        "crop": find_crop(q_exp, gaz.crops_by_len),
         "raw": q_exp,
     }
 
@@ -222,9 +295,9 @@ def _merge_signals(prev: Dict[str,Any] | None, new: Dict[str,Any]) -> Dict[str,A
             merged[k] = v
     return merged
 
-def merged_parse_query(q: str) -> Dict[str, Any]:
+def merged_parse_query(q: str, gaz=None) -> Dict[str, Any]:
     global _LAST_SIGNALS
-    fresh = parse_query(q)
+    fresh = parse_query(q, gaz)
 
     if RESET_EVERY_QUERY:
         _LAST_SIGNALS = fresh.copy()
@@ -237,67 +310,693 @@ def merged_parse_query(q: str) -> Dict[str, Any]:
     _LAST_SIGNALS = cur.copy()
     return cur
 
-# ---------- Load docs from merged corpus ----------
-docs: List[Dict[str, Any]] = []
-if not os.path.exists(CORPUS_PATH):
-    raise RuntimeError(f"Missing {CORPUS_PATH}. Run index_builder.py first.")
+# ---------- Engine (lazy) ----------
+# Load stages → seconds since process start when they finished (for /ready).
+_T0 = time.time()
+_STATUS: Dict[str, Any] = {"loaded": {}, "loading": False, "error": None,
+                           "reloading": False, "reload_error": None}
 
-with open(CORPUS_PATH, "r", encoding="utf-8") as f:
-    for line in f:
-        line = line.strip()
-        if not line:
-            continue
-        try:
-            docs.append(json.loads(line))
-        except json.JSONDecodeError:
-            continue
+def _mark(stage: str):
+    _STATUS["loaded"][stage] = round(time.time() - _T0, 2)
 
-print(f"Loaded {len(docs)} documents from merged corpus.")
-
-# Helper arrays
-texts = [d.get("text", "") for d in docs]
-meta = [{
-    "source": d.get("source", "unknown"),
-    "state": (d.get("state") or "").lower() or None,
-    "district": (d.get("district") or "").lower() or None,
-    "crop": (d.get("crop") or "").lower() or None,
-    "season": (d.get("season") or "").lower() or None,
-    "months": (d.get("months") if isinstance(d.get("months"), list)
-               else ([d.get("months")] if d.get("months") else None)),
-} for d in docs]
-
-# Fill globals for detectors
-KNOWN_CROPS = {m["crop"] for m in meta if m.get("crop")}
-KNOWN_DISTRICTS = {m["district"] for m in meta if m.get("district")}
-
-# ---------- Optional BM25 ----------
-if USE_PY_BM25:
-    print("Building BM25… (slow on big corpora)")
-    tokenized_corpus = [t.split() for t in texts]
-    bm25 = BM25Okapi(tokenized_corpus)
-else:
-    bm25 = None
+class Engine:
+    """
+    Corpus columns, gazetteers, BM25, query embedder and FAISS index for one artifact set.
+    Corpus, metadata and BM25 postings come from the memory-mapped store and the
+    FAISS index is opened with the mmap IO flag, so server workers share those
+    pages through the OS page cache; per-worker memory is mostly model weights.
+    """
+
+    def __init__(self, art_dir: str | None = None):
+        art_dir = art_dir or current_art_dir()
+        self.art_dir = art_dir
+        self.version = os.path.basename(os.path.normpath(art_dir)) if art_dir != ART_DIR else None
+        if PARTITION is not None:   # <version>/partitions/<i>
+            self.version = f"{os.path.basename(os.path.dirname(os.path.dirname(art_dir)))}/part {PARTITION}"
+        self.corpus_path = os.path.join(art_dir, "corpus.jsonl")
+        self.index_path = os.path.join(art_dir, "index_flatip.faiss")
+        self.store_dir = os.path.join(art_dir, "store")
+        self.delta_log = os.path.join(art_dir, delta.LOG_FILE)
+        self.store: corpus_store.CorpusStore | None = None
+        self.n_docs = 0
+        self.known_crops: set = set()
+        self.known_districts: set = set()
+        self.crops_by_len: List[str] = []
+        self.bm25 = None
+        self.embedder = None
+        self.index = None
+        self.vectors = None   # exact vectors (store row order) for re-scoring a lossy index
+        self.projection = None   # --pca-dim builds: embedder dim × index dim
+        self.binary = None   # --binary builds: sign-bit first stage (rows = store rows)
+        self.groups: Dict[str, metric_index.Group] = {}   # metric sub-indexes by group
+        self.dim = 0
+        self.delta: delta.DeltaSegment | None = None
+        self._inflight = 0
+        self._idle = threading.Condition()
+
+    def load(self, previous: "Engine | None" = None) -> "Engine":
+        self._load_corpus()
+        _mark("corpus")
+        self._load_bm25()
+        _mark("bm25")
+        if PARTITION is not None:
+            pass   # partition node: the coordinator sends query vectors
+        elif previous is not None and previous.embedder is not None:
+            self.embedder = previous.embedder   # same EMB_MODEL: share weights across the swap
+        else:
+            self.embedder = load_query_embedder()
+        _mark("embedder")
+        self._load_index()
+        _mark("index")
+        self._load_delta()
+        return self
+
+    # ---------- Corpus store (mmap) ----------
+    def _load_corpus(self):
+        if corpus_store.store_format(self.store_dir) != corpus_store.FORMAT_VERSION:
+            self._build_private_store()
+        self.store = corpus_store.CorpusStore(self.store_dir)
+        problems = self.store.verify(deep=VERIFY_CHECKSUMS)
+        if problems:
+            raise RuntimeError(f"Corpus store {self.store_dir} is damaged: {'; '.join(problems)}")
+        self.n_docs = self.store.n_docs
+        print(f"Loaded {self.n_docs} documents from corpus store (snapshot {self.store.snapshot_id}).")
+
+        # Gazetteers for the detectors, precomputed by the builder
+        gaz = self.store.gazetteer()
+        self.crops_by_len = gaz["crops"]
+        self.known_crops = set(self.crops_by_len)
+        self.known_districts = set(gaz["districts"])
+
+    def _build_private_store(self):
+        # Older artifact sets only have corpus.jsonl: build a throwaway store for this process.
+        import atexit, shutil, tempfile
+        if not os.path.exists(self.corpus_path):
+            raise RuntimeError(f"Missing {self.corpus_path}. Run index_builder.py first.")
+        print(f"No current corpus store in {self.store_dir}; building a private one "
+              f"(run `python index_builder.py --store-only` to share it across workers)…")
+        tmp = tempfile.mkdtemp(prefix="agri-store-")
+        atexit.register(shutil.rmtree, tmp, True)
+        corpus_store.write_store(tmp, corpus_store.iter_corpus(self.corpus_path))
+        self.store_dir = tmp
+
+    def _load_bm25(self):
+        self.bm25 = self.store.bm25 if USE_PY_BM25 else None
+
+    # ---------- FAISS index ----------
+    def _load_index(self):
+        vector_index = _vector_index()
+        print("Reading FAISS index (mmap)…")
+        if not os.path.exists(self.index_path):
+            raise RuntimeError(f"Missing {self.index_path}. Run index_builder.py first.")
+        self.index = vector_index.read_index(self.index_path)
+        vector_index.set_nprobe(self.index, IVF_NPROBE)
+        print(f"Index: {vector_index.describe(self.index)}")
+        self.dim = self.index.d
+        problems = self.store.check_index(self.index_path, self.index.ntotal, self.dim, EMB_MODEL, deep=VERIFY_CHECKSUMS)
+        if problems:
+            raise RuntimeError(f"FAISS index does not match corpus store: {'; '.join(problems)}. "
+                               f"Rebuild with index_builder.py.")
+        self.projection = vector_index.load_projection(self.art_dir)
+        if self.projection is not None:
+            if self.projection.shape[1] != self.dim:
+                raise RuntimeError(f"{vector_index.PROJECTION_FILE} projects to {self.projection.shape[1]} dims, "
+                                   f"index has {self.dim}. Rebuild with index_builder.py.")
+            print(f"Projecting embeddings {self.projection.shape[0]} → {self.dim} dims")
+        vec_path = os.path.join(self.art_dir, vector_index.VECTORS_FILE)
+        bin_path = os.path.join(self.art_dir, vector_index.BINARY_FILE)
+        if os.path.exists(vec_path) and self.n_docs:
+            self.vectors = np.memmap(vec_path, dtype=np.float32, mode="r", shape=(self.n_docs, self.dim))
+        if BINARY_CANDIDATES > 0 and self.vectors is not None and os.path.exists(bin_path):
+            self.binary = vector_index.read_binary(bin_path)
+            if self.binary.ntotal != self.n_docs:
+                raise RuntimeError(f"{bin_path} has {self.binary.ntotal} codes, store has {self.n_docs} docs")
+            print(f"Dense search: Hamming top {BINARY_CANDIDATES} over {self.binary.d}-bit codes, exact re-score")
+        elif RESCORE_FACTOR > 0 and self.vectors is not None:
+            print(f"Re-scoring top {RESCORE_FACTOR}×k candidates with exact vectors from {vec_path}")
+        if METRIC_INDEXES:
+            self.groups = metric_index.load_groups(self.art_dir, self.store, IVF_NPROBE)
+
+    # ---------- Live delta segment ----------
+    def _load_delta(self):
+        self.delta = delta.DeltaSegment(self.store, self.dim, self.delta_log)
+        docs = delta.read_log(self.delta_log)
+        if docs:
+            print(f"Replaying {len(docs)} ingested documents from {self.delta_log}…")
+            self.delta.add(docs, self.encode_docs([d["text"] for d in docs]), log=False)
+            self._extend_gazetteers(docs)
+
+    def encode_docs(self, texts: List[str]) -> np.ndarray:
+        """Vectors for ingested rows from the document embedder, never the (shorter, maybe int8) query encoder."""
+        dv = _get_doc_embedder().encode(texts, batch_size=64, normalize_embeddings=True, convert_to_numpy=True)
+        return self._project(dv.astype("float32"))
+
+    def _project(self, v: np.ndarray) -> np.ndarray:
+        return v if self.projection is None else np.ascontiguousarray(v @ self.projection)
+
+    def _extend_gazetteers(self, docs: List[Dict[str, Any]]):
+        # Replace (never mutate) the sets so concurrent parse_query calls see old or new
+        crops = {d["crop"].lower() for d in docs if isinstance(d.get("crop"), str) and d["crop"]}
+        districts = {d["district"].lower() for d in docs if isinstance(d.get("district"), str) and d["district"]}
+        if not crops <= self.known_crops:
+            self.known_crops = self.known_crops | crops
+            self.crops_by_len = sorted(self.known_crops, key=lambda c: (-len(c), c))
+        if not districts <= self.known_districts:
+            self.known_districts = self.known_districts | districts
+
+    def view(self) -> "Engine | EngineView":
+        """Main index plus a snapshot of the delta rows (just the engine when there are none)."""
+        d = self.delta.view() if self.delta is not None else None
+        return self if d is None else EngineView(self, d)
+
+    def search(self, qv: np.ndarray, k: int, group: str | None = None):
+        """Top-k (D, store rows) over the full index, or over one metric sub-index."""
+        if group is not None:
+            return self.groups[group].search(qv, k, self.vectors, RESCORE_FACTOR)
+        k = min(k, self.n_docs)
+        vector_index = _vector_index()
+        if self.binary is not None:   # two-stage: Hamming shortlist (store rows), exact scores decide
+            _, I = self.binary.search(vector_index.binarize(qv), min(max(BINARY_CANDIDATES, k), self.n_docs))
+            return vector_index.rescore(qv, I, self.vectors, k)
+        rescore = self.vectors is not None and RESCORE_FACTOR > 0
+        D, I = self.index.search(qv, min(k * RESCORE_FACTOR, self.n_docs) if rescore else k)
+        if self.store.ids is not None:   # IndexIDMap2 build: stable doc ids → store rows
+            I = self.store.rows_for_ids(I)
+        if rescore:   # compressed codes only shortlist; exact scores decide
+            D, I = vector_index.rescore(qv, I, self.vectors, k)
+        return D, I
+
+    def encode_queries(self, qs: List[str]) -> np.ndarray:
+        qv = self.embedder.encode(qs, normalize_embeddings=True, convert_to_numpy=True)
+        return self._project(qv.astype("float32"))
+
+    def encode_query(self, q: str) -> np.ndarray:
+        return self.encode_queries([q])
+
+    def bm25_for(self, group: str | None = None):
+        """BM25 scorer over every doc, or over one metric group's postings (zero elsewhere)."""
+        return self.bm25 if group is None else self.groups[group].bm25
+
+    # ---------- Row accessors ----------
+    def text(self, i: int) -> str:
+        return self.store.text(i)
+
+    def value(self, field: str, i: int) -> str | None:
+        return self.store.value(field, i)
+
+    # ---------- In-flight tracking (for draining after a swap) ----------
+    def _enter(self):
+        with self._idle:
+            self._inflight += 1
+
+    def _exit(self):
+        with self._idle:
+            self._inflight -= 1
+            if self._inflight == 0:
+                self._idle.notify_all()
+
+    def wait_idle(self, timeout: float) -> bool:
+        with self._idle:
+            return self._idle.wait_for(lambda: self._inflight == 0, timeout)
+
+    def close(self):
+        """Drop the mmaps / index so their memory goes back to the OS."""
+        self.index = None
+        self.vectors = None
+        self.projection = None
+        self.binary = None
+        self.groups = {}
+        self.bm25 = None
+        self.store = None
+        self.embedder = None
+        self.delta = None
+
+class EngineView:
+    """Engine + delta snapshot with the Engine's read interface; ids >= main n_docs are delta rows."""
+
+    def __init__(self, eng: Engine, d: "delta.DeltaView"):
+        self.engine = eng
+        self.delta_view = d
+        self.store = delta.SegmentedStore(eng.store, d)
+        self.n_docs = self.store.n_docs
+        self.bm25 = delta.SegmentedBM25(eng.bm25, d) if eng.bm25 is not None else None
+        self.known_crops = eng.known_crops
+        self.known_districts = eng.known_districts
+        self.crops_by_len = eng.crops_by_len
+        self.version = eng.version
+        self.groups = eng.groups
+
+    def view(self) -> "EngineView":
+        return self
+
+    def search(self, qv: np.ndarray, k: int, group: str | None = None):
+        D, I = self.engine.search(qv, k, group)
+        dD, dI = self.delta_view.search(qv, k)
+        return delta.merge_hits(D, I, dD, dI, min(k, self.n_docs))
+
+    def bm25_for(self, group: str | None = None):
+        if group is None or self.bm25 is None:
+            return self.bm25
+        return delta.SegmentedBM25(self.engine.bm25, self.delta_view, self.groups[group].bm25)
+
+    def encode_queries(self, qs: List[str]) -> np.ndarray:
+        return self.engine.encode_queries(qs)
+
+    def text(self, i: int) -> str:
+        return self.store.text(i)
+
+    def value(self, field: str, i: int) -> str | None:
+        return self.store.value(field, i)
+
+_engine: Engine | None = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> Engine:
+    """Process-wide engine, loaded on first call (thread-safe)."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _STATUS["loading"] = True
+                try:
+                    _engine = Engine().load()
+                except Exception as e:
+                    _STATUS["error"] = str(e)
+                    raise
+                finally:
+                    _STATUS["loading"] = False
+    return _engine
+
+@contextmanager
+def use_engine():
+    """
+    Pin the current engine for one request. A reload that swaps engines
+    meanwhile waits for pinned requests before freeing the old one.
+    """
+    while True:
+        eng = get_engine()
+        eng._enter()
+        if eng is _engine:
+            break
+        eng._exit()   # swapped between the two lines: pin the new one instead
+    try:
+        yield eng
+    finally:
+        eng._exit()
+
+# ---------- Hot reload ----------
+# Build the new version with index_builder.py (it flips artifacts/CURRENT), then
+# SIGHUP the server / retrieval daemon or POST api/engine/reload/. The new engine
+# loads next to the old one; the reference is swapped between requests, the old
+# engine is drained and closed.
+DRAIN_TIMEOUT = float(os.getenv("ENGINE_DRAIN_TIMEOUT", "60"))
+_reload_lock = threading.Lock()
 
-# ---------- Embedding (query only) + FAISS index ----------
-print("Loading embedder (for query vectors only)…")
-embedder = SentenceTransformer(EMB_MODEL, device=DEVICE)
-embedder.max_seq_length = 128  # short for speed; queries are short
+_ingest_lock = threading.Lock()   # ingest vs. the delta hand-over at swap time
 
-print("Reading FAISS index…")
-if not os.path.exists(INDEX_PATH):
-    raise RuntimeError(f"Missing {INDEX_PATH}. Run index_builder.py first.")
-index = faiss.read_index(INDEX_PATH)
-dim = index.d
+def reload_engine(force: bool = False, background: bool = True, carry_from: int = 0):
+    """
+    Load artifacts/CURRENT and swap it in if it differs from the running engine.
+    Live delta rows from `carry_from` on move to the new engine (compaction passes
+    how many rows it already folded into the new main index).
+    """
+    def _run():
+        global _engine
+        if not _reload_lock.acquire(blocking=False):
+            print("Engine reload already in progress.")
+            return
+        try:
+            old = _engine
+            art_dir = current_art_dir()
+            if old is None:
+                return   # nothing loaded yet; the first request picks up CURRENT
+            if old.art_dir == art_dir and not force:
+                print(f"Engine already on {art_dir}; nothing to reload.")
+                return
+            _STATUS["reloading"], _STATUS["reload_error"] = True, None
+            print(f"Reloading engine from {art_dir}…")
+            new = Engine(art_dir).load(previous=old)
+            with _ingest_lock:
+                if old.delta is not None and new.art_dir != old.art_dir:
+                    carried = old.delta.docs(carry_from)
+                    new.delta.add(carried, old.delta._vecs[carry_from:old.delta.n])
+                    new._extend_gazetteers(carried)
+                with _engine_lock:
+                    _engine = new
+            print(f"Engine swapped to {new.version or art_dir} ({new.n_docs} docs + {new.delta.n} live).")
+            if old.wait_idle(DRAIN_TIMEOUT):
+                old.close()
+            else:
+                print(f"Old engine still busy after {DRAIN_TIMEOUT:.0f}s; freeing it when its last request ends.")
+            del old
+            import gc
+            gc.collect()
+        except Exception as e:
+            _STATUS["reload_error"] = str(e)
+            print(f"Engine reload failed, still serving the previous version: {e}")
+        finally:
+            _STATUS["reloading"] = False
+            _reload_lock.release()
+    if not background:
+        _run()
+        return None
+    t = threading.Thread(target=_run, name="engine-reload", daemon=True)
+    t.start()
+    return t
+
+# ---------- Live ingest + compaction ----------
+# Ingested docs are searchable as soon as ingest_docs returns (delta segment).
+# Once the delta reaches DELTA_COMPACT_ROWS (or on demand) compaction writes
+# main + delta as a new artifact version in the background and hot-swaps to it.
+DELTA_COMPACT_ROWS = int(os.getenv("DELTA_COMPACT_ROWS", "50000"))
+COMPACT_BUDGET_MB = 2048   # vectors in RAM at once while rebuilding metric sub-indexes
+_compact_lock = threading.Lock()
+_COMPACT: Dict[str, Any] = {"running": False, "last_error": None, "last_version": None}
+
+def _check_unpartitioned(art_dir: str | None = None):
+    """Live rows can't reach partitions: refuse on partition nodes / coordinators and on partitioned versions."""
+    if PARTITION is not None or PARTITION_NODES:
+        raise RuntimeError("live ingest and compaction need an unpartitioned engine; "
+                           "add the rows to data/ and rebuild the partitions")
+    art_dir = art_dir or corpus_store.current_art_dir(ART_DIR)
+    if partitions.load_map(art_dir) is not None:
+        # A compacted version would have no partitions/ and the partition nodes would fail to reload
+        raise RuntimeError(f"{art_dir} is partitioned; live ingest and compaction would drop its partitions. "
+                           f"Add the rows to data/ and rebuild with index_builder.py --partitions N")
+
+def ingest_docs(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Add validated records to the live delta segment; returns counts."""
+    _check_unpartitioned()
+    docs = delta.validate_records(records)
+    with _ingest_lock:
+        eng = get_engine()
+        n = eng.delta.add(docs, eng.encode_docs([d["text"] for d in docs]))
+        eng._extend_gazetteers(docs)
+    if n >= DELTA_COMPACT_ROWS:
+        compact_delta()
+    return {"added": len(docs), "delta_rows": n, "main_rows": eng.n_docs}
+
+def delta_status() -> Dict[str, Any]:
+    eng = _engine
+    return {"delta_rows": eng.delta.n if eng is not None and eng.delta is not None else 0,
+            "compact_at": DELTA_COMPACT_ROWS, **_COMPACT}
+
+def _unique_live_rows(docs: List[Dict[str, Any]], main_ids: np.ndarray | None = None):
+    """
+    (row numbers, ids) of the last copy of each live doc by doc_id, as parse_shard dedups
+    a shard; rows an earlier compaction already folded into main (same id) are dropped.
+    """
+    ids = np.array([corpus_store.doc_id(delta.LOG_FILE, d) for d in docs], dtype=np.int64)
+    last = {int(i): j for j, i in enumerate(ids)}
+    rows = np.array(sorted(last.values()), dtype=np.int64)
+    if main_ids is not None and len(rows):
+        rows = rows[~np.isin(ids[rows], main_ids)]
+    return rows, ids[rows]
+
+def compact_delta(background: bool = True):
+    """Fold the current delta rows into a new immutable main version and swap to it."""
+    _check_unpartitioned()
+
+    def _run():
+        if not _compact_lock.acquire(blocking=False):
+            return
+        import shutil
+        _COMPACT["running"], _COMPACT["last_error"] = True, None
+        try:
+            eng = get_engine()
+            snap = eng.delta.view()
+            if snap is None:
+                return
+            _check_unpartitioned(eng.art_dir)
+            n = snap.n
+            main_ids = np.asarray(eng.store.ids) if eng.store.ids is not None else None
+            docs = eng.delta.docs(0, n)
+            rows, live = _unique_live_rows(docs, main_ids)
+            docs = [docs[j] for j in rows]
+            vecs = np.ascontiguousarray(snap.vecs[rows])
+            name, out_dir = corpus_store.new_version_dir(ART_DIR)
+            print(f"Compacting {n} delta rows ({n - len(rows)} duplicates dropped) into version {name}…")
+
+            corpus_path = os.path.join(out_dir, "corpus.jsonl")
+            shutil.copyfile(eng.corpus_path, corpus_path)
+            shards = os.path.join(eng.art_dir, "shards.json")   # still valid: live rows go after the shards
+            if os.path.exists(shards):
+                shutil.copyfile(shards, os.path.join(out_dir, "shards.json"))
+            with open(corpus_path, "a", encoding="utf-8") as f:
+                for d in docs:
+                    f.write(json.dumps(d, ensure_ascii=False) + "\n")
+
+            index_path = os.path.join(out_dir, "index_flatip.faiss")
+            vector_index = _vector_index()
+            index = vector_index.writable_copy(eng.index_path)   # in RAM, on-disk lists included
+            ids = None
+            if main_ids is not None:   # id-mapped build: live rows get stable ids too
+                index.add_with_ids(vecs, live)
+                ids = np.concatenate([main_ids, live])
+            else:
+                index.add(vecs)
+            vector_index.write_index(index, index_path)
+            data_path = vector_index.ivf_data_path(index_path) if vector_index.is_ondisk(index_path) else None
+            vectors_path = None
+            src_vectors = os.path.join(eng.art_dir, vector_index.VECTORS_FILE)
+            if os.path.exists(src_vectors):   # lossy codec: exact vectors follow the store rows
+                vectors_path = os.path.join(out_dir, vector_index.VECTORS_FILE)
+                shutil.copyfile(src_vectors, vectors_path)
+                with open(vectors_path, "ab") as f:
+                    f.write(np.ascontiguousarray(vecs, dtype=np.float32).tobytes())
+            projection_path = None
+            if eng.projection is not None:   # delta vectors were projected on ingest already
+                projection_path = os.path.join(out_dir, vector_index.PROJECTION_FILE)
+                shutil.copyfile(os.path.join(eng.art_dir, vector_index.PROJECTION_FILE), projection_path)
+            binary_path = None
+            src_binary = os.path.join(eng.art_dir, vector_index.BINARY_FILE)
+            if os.path.exists(src_binary):   # sign bits of the live rows go after the main rows too
+                binary_path = os.path.join(out_dir, vector_index.BINARY_FILE)
+                bits = vector_index.read_binary(src_binary)
+                bits.add(vector_index.binarize(vecs))
+                vector_index.write_binary_index(bits, binary_path)
+            info = corpus_store.index_info(index_path, index.ntotal, index.d, EMB_MODEL, data_path, vectors_path,
+                                           vector_index.codec_of(index), projection_path, binary_path)
+            del index
+            corpus_store.write_store(os.path.join(out_dir, "store"), corpus_store.iter_corpus(corpus_path), {"index": info}, ids)
+            if eng.groups:   # live rows join their metric's sub-index too
+                metric_index.write_groups(out_dir, os.path.join(out_dir, "store"), COMPACT_BUDGET_MB)
+
+            corpus_store.set_current(ART_DIR, name)
+            reload_engine(background=False, carry_from=n)
+            if _engine.art_dir != out_dir:
+                raise RuntimeError(_STATUS["reload_error"] or "swap to the compacted version did not happen")
+            _COMPACT["last_version"] = name
+            print(f"Compaction done: version {name}, {_engine.delta.n} rows still live.")
+        except Exception as e:
+            _COMPACT["last_error"] = str(e)
+            print(f"Delta compaction failed (rows stay in the live segment): {e}")
+        finally:
+            _COMPACT["running"] = False
+            _compact_lock.release()
+    if not background:
+        _run()
+        return None
+    t = threading.Thread(target=_run, name="delta-compact", daemon=True)
+    t.start()
+    return t
+
+def request_ingest(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """ingest_docs wherever retrieval runs (daemon in client mode)."""
+    if RETRIEVAL_SOCKET:
+        return get_retrieval_client().ingest(delta.validate_records(records))
+    return ingest_docs(records)
+
+def request_compact():
+    if RETRIEVAL_SOCKET:
+        get_retrieval_client().compact()
+    else:
+        compact_delta()
+
+def request_reload(force: bool = False):
+    """Reload wherever retrieval runs: the daemon in client mode, else this process."""
+    if RETRIEVAL_SOCKET:
+        get_retrieval_client().reload(force)
+    else:
+        reload_engine(force=force)
+
+def watch_artifacts(interval: float):
+    """Poll artifacts/CURRENT and reload when it changes (lets every worker follow a flip)."""
+    def _run():
+        seen = corpus_store.current_version(ART_DIR)
+        while True:
+            time.sleep(interval)
+            now = corpus_store.current_version(ART_DIR)
+            if now != seen:
+                seen = now
+                reload_engine(background=False)
+    t = threading.Thread(target=_run, name="artifact-watch", daemon=True)
+    t.start()
+    return t
+
+_client = None
+def get_retrieval_client() -> "retrieval_proto.RetrievalClient":
+    global _client
+    if _client is None:
+        _client = retrieval_proto.RetrievalClient(RETRIEVAL_SOCKET)
+    return _client
+
+def get_gazetteer():
+    """Gazetteers for parse_query: the daemon's copy in client mode, else the local engine."""
+    if RETRIEVAL_SOCKET:
+        return get_retrieval_client().gazetteer()
+    if PARTITION_NODES:
+        return get_partition_set().gazetteer()
+    return get_engine()
+
+def current_art_dir() -> str:
+    """Artifacts this process serves: artifacts/CURRENT, or its part when it is a partition node."""
+    art_dir = corpus_store.current_art_dir(ART_DIR)
+    if PARTITION is None:
+        return art_dir
+    pmap = partitions.load_map(art_dir)
+    if pmap is None or not 0 <= PARTITION < len(pmap["parts"]):
+        have = f"has {len(pmap['parts'])} partitions" if pmap else "is not partitioned"
+        raise RuntimeError(f"{art_dir} {have}; can't serve partition {PARTITION} "
+                           f"(build with index_builder.py --partitions N)")
+    return partitions.part_dir(art_dir, PARTITION)
+
+# ---------- Model files ----------
+_bundle: Dict[str, Any] = {}
+_bundle_lock = threading.Lock()
+def model_path(model: str) -> str:
+    """What to hand the model loader: the model's directory in the active bundle, else its name."""
+    with _bundle_lock:
+        if "current" not in _bundle:
+            root = MODEL_BUNDLE_DIR or os.path.join(ART_DIR, model_bundle.BUNDLE_SUBDIR)
+            _bundle["current"] = model_bundle.open_current(root, deep=VERIFY_CHECKSUMS)
+            if _bundle["current"] is not None:
+                print(f"Loading models from bundle {_bundle['current'].dir} (hub offline)")
+    bundle = _bundle["current"]
+    return bundle.path(model) if bundle is not None else model
+
+def load_query_embedder():
+    """The index's query encoder, routing Indic-script queries to the multilingual one when enabled."""
+    embedder = _load_embedder()
+    if not multilingual_ready():
+        return embedder
+    path = multilingual.align_dir(os.path.join(ART_DIR, MULTILINGUAL_SUBDIR), MULTILINGUAL_MODEL, EMB_MODEL)
+    try:
+        from sentence_transformers import SentenceTransformer
+        print(f"Loading multilingual query encoder {MULTILINGUAL_MODEL} (map {path})…")
+        model = SentenceTransformer(model_path(MULTILINGUAL_MODEL), device=get_device())
+        model.max_seq_length = QUERY_MAX_SEQ_LEN
+        return multilingual.MixedEncoder(embedder, multilingual.AlignedEncoder(path, model))
+    except Exception as e:
+        if MULTILINGUAL == "on":
+            raise
+        print(f"Multilingual query encoder unavailable ({e}); Indic-script queries use the embedder.")
+        return embedder
+
+def multilingual_ready() -> bool:
+    if MULTILINGUAL == "off":
+        return False
+    return MULTILINGUAL == "on" or multilingual.is_aligned(
+        os.path.join(ART_DIR, MULTILINGUAL_SUBDIR), MULTILINGUAL_MODEL, EMB_MODEL)
+
+def answers_natively(language: str) -> bool:
+    """Whether chat can answer in language without translating (multilingual retrieval is on)."""
+    return language in multilingual.LANGUAGES and multilingual_ready()
+
+def _load_embedder():
+    """ONNX query encoder when exported (QUERY_ENCODER), else the SentenceTransformer."""
+    enc_dir = query_encoder.encoder_dir(os.path.join(ART_DIR, QUERY_ENCODER_SUBDIR), EMB_MODEL)
+    if QUERY_ENCODER == "onnx" or (QUERY_ENCODER == "auto" and os.path.exists(os.path.join(enc_dir, query_encoder.META))):
+        try:
+            print(f"Loading ONNX query encoder from {enc_dir}…")
+            return query_encoder.OnnxQueryEncoder(enc_dir)
+        except Exception as e:
+            if QUERY_ENCODER == "onnx":
+                raise
+            print(f"ONNX query encoder unavailable ({e}); using PyTorch.")
+    from sentence_transformers import SentenceTransformer
+    print("Loading embedder (for query vectors only)…")
+    embedder = SentenceTransformer(model_path(EMB_MODEL), device=get_device())
+    embedder.max_seq_length = QUERY_MAX_SEQ_LEN
+    return embedder
+
+_doc_embedder = None
+_doc_embedder_lock = threading.Lock()
+def _get_doc_embedder():
+    """fp32 SentenceTransformer set up as index_builder.load_embedder; loaded on the first ingest or replay."""
+    global _doc_embedder
+    if _doc_embedder is None:
+        with _doc_embedder_lock:
+            if _doc_embedder is None:
+                from sentence_transformers import SentenceTransformer
+                print("Loading document embedder (for ingested rows)…")
+                embedder = SentenceTransformer(model_path(EMB_MODEL), device=get_device())
+                embedder.max_seq_length = DOC_MAX_SEQ_LEN
+                _doc_embedder = embedder
+    return _doc_embedder
 
 # Lazy-load reranker to avoid NameError and heavy startup
 _reranker = None
+_reranker_lock = threading.Lock()
 def _get_reranker():
     global _reranker
     if _reranker is None:
-        print("Loading cross-encoder…")
-        _reranker = CrossEncoder(RERANK_MODEL, device=DEVICE)
+        with _reranker_lock:
+            if _reranker is None:
+                from sentence_transformers import CrossEncoder
+                print("Loading cross-encoder…")
+                _reranker = CrossEncoder(model_path(RERANK_MODEL), device=get_device())
+                _mark("reranker")
     return _reranker
 
+def engine_status() -> Dict[str, Any]:
+    """What has been loaded so far; `ready` once a request won't block on loading."""
+    if RETRIEVAL_SOCKET:
+        ok = get_retrieval_client().ping()
+        return {"ready": ok, "loading": False, "loaded": {"retrieval_daemon": ok},
+                "error": None if ok else f"retrieval daemon not reachable at {RETRIEVAL_SOCKET}"}
+    if PARTITION_NODES:
+        up = get_partition_set().ping()
+        down = [a for a, ok in zip(PARTITION_NODES, up) if not ok]
+        return {"ready": not down and _query_embedder is not None and _reranker is not None,
+                "loading": False, "loaded": dict(_STATUS["loaded"], partition_nodes=f"{sum(up)}/{len(up)}"),
+                "error": f"partition nodes not reachable: {', '.join(down)}" if down else None}
+    loaded = dict(_STATUS["loaded"])
+    return {
+        "ready": _engine is not None and _reranker is not None,
+        "loading": _STATUS["loading"],
+        "loaded": loaded,
+        "error": _STATUS["error"],
+        "version": _engine.version if _engine is not None else None,
+        "snapshot": _engine.store.snapshot_id if _engine is not None and _engine.store is not None else None,
+        "index": _vector_index().describe(_engine.index) if _engine is not None and _engine.index is not None else None,
+        "reloading": _STATUS["reloading"],
+        "reload_error": _STATUS["reload_error"],
+    }
+
+def warm_up(background: bool = True):
+    """Load the engine + reranker now instead of on the first request."""
+    def _run():
+        try:
+            if RETRIEVAL_SOCKET:
+                get_gazetteer()
+                return
+            if PARTITION_NODES:
+                get_gazetteer()
+                _get_query_embedder()
+                _get_reranker()
+                return
+            get_engine()
+            _get_reranker()
+        except Exception as e:
+            print(f"Engine warm-up failed: {e}")
+    if not background:
+        _run()
+        return None
+    t = threading.Thread(target=_run, name="engine-warmup", daemon=True)
+    t.start()
+    return t
+
 # ---------- Retrieval ----------
 def rrf_fuse(bm_ranked: List[int], dense_ranked: List[int], k: int = RRF_K) -> List[int]:
     scores: Dict[int, float] = {}
@@ -308,117 +1007,195 @@ def rrf_fuse(bm_ranked: List[int], dense_ranked: List[int], k: int = RRF_K) -> L
     fused = sorted(scores.items(), key=lambda x: x[1], reverse=True)
     return [i for i, _ in fused]
 
-def filter_pool(signals: Dict[str, Any]) -> List[int]:
-    pool = list(range(len(docs)))
+# Intent → the metrics filter_pool narrows to (also routes queries to metric partitions
+# and metric sub-indexes)
+INTENT_METRICS = {intent: metric_index.GROUPS[g] for intent, g in metric_index.INTENT_GROUP.items()}
+METRIC_STEPS = {"metric", "scheme", "market"}   # filter_pool misses that leave the intent's metric
+# filter_pool's soft filters in the order it applies them (an earlier one narrows the pool first)
+FILTER_STEPS = ("news", "metric", "scheme", "market", "year", "state", "region", "crop", "month")
+
+def miss_mask(misses: List[str]) -> int:
+    """Missed filters as a bitmask, earliest step = highest bit: a lower mask missed later filters."""
+    return sum(1 << (len(FILTER_STEPS) - 1 - FILTER_STEPS.index(m)) for m in set(misses))
+
+def _narrow(pool: np.ndarray, mask: np.ndarray, misses: List[str] | None = None, step: str = "") -> np.ndarray:
+    """Soft filter: keep the matching rows unless that would leave nothing (noted in misses)."""
+    sub = pool[mask]
+    if len(sub):
+        return sub
+    if misses is not None:
+        misses.append(step)
+    return pool
+
+def filter_pool(signals: Dict[str, Any], eng: Engine, misses: List[str] | None = None) -> np.ndarray:
+    """Candidate rows for the signals; misses (if given) collects the soft filters that matched nothing."""
+    st = eng.store
+    metric, meta_state = st.codes("metric"), st.codes("state")
+    pool = np.arange(eng.n_docs)
 
     # Deprioritize news by default
-    non_news = [i for i in pool if docs[i].get("metric") != "news"]
-    pool = non_news or pool
+    pool = _narrow(pool, metric[pool] != st.code("metric", "news"), misses, "news")
 
     # Intent → metric prefilter (soft)
     intent = signals.get("intent")
-    if intent == "rainfall":
-        pool2 = [i for i in pool if docs[i].get("metric") == "rainfall"]
-        pool = pool2 or pool
-    elif intent == "pop_practice":
-        pool2 = [i for i in pool if docs[i].get("metric") == "pop"]
-        pool = pool2 or pool
-    elif intent == "stats":
-        pool2 = [i for i in pool if docs[i].get("metric") == "crop_stats"]
-        pool = pool2 or pool
-    elif intent == "crop_env":
-        pool2 = [i for i in pool if docs[i].get("metric") == "crop_env"]
-        pool = pool2 or pool
+    if intent in ("rainfall", "pop_practice", "stats", "crop_env"):
+        pool = _narrow(pool, metric[pool] == st.code("metric", INTENT_METRICS[intent][0]), misses, "metric")
     elif intent == "scheme":
-        pool2 = [i for i in pool if docs[i].get("metric") == "scheme"]
+        level = st.codes("level")
+        pool2 = pool[metric[pool] == st.code("metric", "scheme")]
         ql = signals["raw"].lower()
         if "central" in ql:
-            pool2 = [i for i in pool2 if (docs[i].get("level") == "central")]
+            pool2 = pool2[level[pool2] == st.code("level", "central")]
         if "state" in ql and signals["state"]:
-            pool2 = [i for i in pool2 if (docs[i].get("level") == "state" and (docs[i].get("state") == signals["state"]))]
-        pool = pool2 or pool
+            pool2 = pool2[(level[pool2] == st.code("level", "state"))
+                          & (st.codes("state_raw")[pool2] == st.code("state_raw", signals["state"]))]
+        if len(pool2):
+            pool = pool2
+        elif misses is not None:
+            misses.append("scheme")
     elif intent == "market":
-        pool2 = [i for i in pool if docs[i].get("metric") in ("price", "price_weather", "market")]
+        codes = [st.code("metric", m) for m in INTENT_METRICS["market"]]
+        pool2 = pool[np.isin(metric[pool], codes)]
         if signals.get("district"):
-            d = signals["district"]
-            pool2 = [i for i in pool2 if meta[i]["district"] == d]
+            pool2 = pool2[st.codes("district")[pool2] == st.code("district", signals["district"])]
         if signals.get("state"):
-            s = signals["state"]
-            pool2 = [i for i in pool2 if meta[i]["state"] == s]
+            pool2 = pool2[meta_state[pool2] == st.code("state", signals["state"])]
         if signals.get("year"):
-            y = signals["year"]
-            pool2 = [i for i in pool2 if docs[i].get("year") == y]
-        pool = pool2 or pool
+            pool2 = pool2[st.year[pool2] == signals["year"]]
+        if len(pool2):
+            pool = pool2
+        elif misses is not None:
+            misses.append("market")
 
     # Year preference (soft)
     if signals.get("year") is not None:
-        y = signals["year"]
-        y_pool = [i for i in pool if docs[i].get("year") == y]
-        pool = y_pool or pool
+        pool = _narrow(pool, st.year[pool] == signals["year"], misses, "year")
 
     # State filter with rainfall fallback to all-India
     if signals.get("state"):
-        s = signals["state"]
-        by_state = [i for i in pool if meta[i]["state"] == s]
-        if by_state:
+        by_state = pool[meta_state[pool] == st.code("state", signals["state"])]
+        if len(by_state):
             pool = by_state
-        elif intent == "rainfall":
-            ai = [i for i in pool if (docs[i].get("region") == "all-india")]
-            pool = ai or pool
+        else:
+            if misses is not None:
+                misses.append("state")
+            if intent == "rainfall":
+                pool = _narrow(pool, st.codes("region")[pool] == st.code("region", "all-india"), misses, "region")
 
     # Crop filter (hard when we know the crop)
     if signals.get("crop"):
-        c = signals["crop"]
-        crop_pool = [i for i in pool if meta[i]["crop"] == c]
-        pool = crop_pool or pool
+        pool = _narrow(pool, st.codes("crop")[pool] == st.code("crop", signals["crop"]), misses, "crop")
 
     # Month filter
-    if signals.get("month"):
-        mo = signals["month"]
-        by_month = [i for i in pool if meta[i]["months"] and mo in meta[i]["months"]]
-        pool = by_month or pool
+    if signals.get("month") in corpus_store.MONTH_ABBR:
+        bit = 1 << corpus_store.MONTH_ABBR.index(signals["month"])
+        pool = _narrow(pool, (st.months[pool] & bit) != 0, misses, "month")
 
     return pool
 
-def hybrid_search(q: str, k_fusion: int = TOP_K_FUSION, k_rerank: int = RERANK_KEEP) -> Tuple[Dict[str, Any], List[int]]:
-    signals = merged_parse_query(q)
-    pool = filter_pool(signals)
-    if not pool:
-        pool = list(range(len(docs)))
-
-    # BM25 over full then select pool by top scores (optional)
-    if USE_PY_BM25 and bm25 is not None:
-        tokens = q.split()
-        bm_scores = bm25.get_scores(tokens)
-        bm_pairs = [(i, bm_scores[i]) for i in pool]
-        bm_ranked = [i for i, _ in sorted(bm_pairs, key=lambda x: x[1], reverse=True)[:k_fusion]]
+def _query_pool(signals: Dict[str, Any], eng: Engine) -> Tuple[np.ndarray, List[str], str | None]:
+    """
+    (candidate rows, soft filters that matched nothing, metric sub-index holding every candidate).
+    The sub-index is the intent's group unless its metric filter fell back to other docs.
+    """
+    misses: List[str] = []
+    pool = filter_pool(signals, eng, misses)
+    if not len(pool):
+        pool = np.arange(eng.n_docs)
+    group = metric_index.INTENT_GROUP.get(signals.get("intent"))
+    if group not in eng.groups or METRIC_STEPS.intersection(misses):
+        group = None
+    return pool, misses, group
+
+def _dense_batch(qv: np.ndarray, groups: List[str | None], eng: Engine, k: int):
+    """
+    Dense (D, I) per query: one search per metric sub-index for the queries routed to it, one
+    over the full index for the rest and for any sub-index search that came back short
+    (e.g. an IVF probe that reached fewer than k vectors).
+    """
+    out: List[Any] = [None] * len(qv)
+    routed: Dict[str | None, List[int]] = {}
+    for j, g in enumerate(groups):
+        routed.setdefault(g, []).append(j)
+    full = routed.pop(None, [])
+    for g, js in routed.items():
+        D, I = eng.search(qv[js], k, g)
+        want = min(k, eng.groups[g].n)
+        for n, j in enumerate(js):
+            if (I[n] >= 0).sum() < want:
+                full.append(j)
+            else:
+                out[j] = (D[n], I[n])
+    if full:
+        D, I = eng.search(qv[full], k)
+        for n, j in enumerate(full):
+            out[j] = (D[n], I[n])
+    return out
+
+def _pool_hits(q: str, pool: np.ndarray, group: str | None, dense_scores: np.ndarray, dense_ids: np.ndarray,
+               eng: Engine, k_fusion: int) -> Tuple[List[Tuple[int, float]], List[Tuple[int, float]]]:
+    """(dense hits in the pool, BM25 top k_fusion in the pool), hits as (row, score)."""
+    in_pool = np.zeros(eng.n_docs, dtype=bool)
+    in_pool[pool] = True
+
+    # BM25 over full (or the pool's metric group) then select pool by top scores (optional)
+    bm25 = eng.bm25_for(group) if USE_PY_BM25 else None
+    if bm25 is not None:
+        tokens = q.split() + " ".join(multilingual.native_terms(q)).split()
+        bm_scores = bm25.get_scores(tokens)[pool]
+        order = np.argsort(-bm_scores, kind="stable")[:k_fusion]
+        bm = [(int(pool[o]), float(bm_scores[o])) for o in order]
     else:
-        bm_ranked = []
+        bm = []
 
-    # Dense over FAISS then filter to pool
-    qv = embedder.encode([q], normalize_embeddings=True, convert_to_numpy=True)
-    _, I = index.search(qv.astype("float32"), min(k_fusion*2, len(docs)))
-    dense_filtered = [i for i in I[0] if i in pool][:k_fusion]
+    # Dense hits filtered to pool
+    dense = [(int(i), float(d)) for d, i in zip(dense_scores, dense_ids) if i >= 0 and in_pool[i]][:k_fusion]
+    return dense, bm
 
+def _fuse_candidates(q: str, pool: np.ndarray, group: str | None, dense_scores: np.ndarray, dense_ids: np.ndarray,
+                     eng: Engine, k_fusion: int, k_rerank: int) -> List[int]:
+    dense, bm = _pool_hits(q, pool, group, dense_scores, dense_ids, eng, k_fusion)
     # RRF fusion
-    fused = rrf_fuse(bm_ranked, dense_filtered)
-    fused = fused[:max(k_fusion, k_rerank)]
-
-    # Cross-encoder rerank
-    pairs = [[q, texts[i]] for i in fused]
-    if not pairs:
-        return signals, []
-    rr_scores = _get_reranker().predict(pairs)
-    reranked = [i for i, _ in sorted(zip(fused, rr_scores), key=lambda x: x[1], reverse=True)]
-    return signals, reranked[:k_rerank]
+    fused = rrf_fuse([i for i, _ in bm], [i for i, _ in dense])
+    return fused[:max(k_fusion, k_rerank)]
+
+def hybrid_search_batch(qs: List[str], k_fusion: int = TOP_K_FUSION, k_rerank: int = RERANK_KEEP,
+                        eng: Engine | None = None) -> List[Tuple[Dict[str, Any], List[int]]]:
+    """hybrid_search for several queries: one embedder call, one FAISS search per index used, one rerank call."""
+    eng = (eng or get_engine()).view()
+    signals = [merged_parse_query(q, eng) for q in qs]
+    pools = [_query_pool(s, eng) for s in signals]
+
+    # Dense over FAISS or the metric sub-index (+ live delta rows, batched), filtered to each query's pool
+    qv = eng.encode_queries(qs)
+    hits = _dense_batch(qv, [g for _, _, g in pools], eng, k_fusion*2)
+    fused = [_fuse_candidates(q, pool, g, D, I, eng, k_fusion, k_rerank)
+             for q, (pool, _, g), (D, I) in zip(qs, pools, hits)]
+    return [(s, r) for s, r in zip(signals, _rerank(qs, fused, eng, k_rerank))]
+
+def _rerank(qs: List[str], fused: List[List[int]], eng, k_rerank: int) -> List[List[int]]:
+    """Cross-encoder rerank of each query's candidates (rows of eng: an Engine or partitions.Docs)."""
+    pairs = [[q, eng.text(i)] for q, f in zip(qs, fused) for i in f]
+    rr_scores = _get_reranker().predict(pairs) if pairs else []
+    out, pos = [], 0
+    for f in fused:
+        scores = rr_scores[pos:pos + len(f)]
+        pos += len(f)
+        reranked = [i for i, _ in sorted(zip(f, scores), key=lambda x: x[1], reverse=True)]
+        out.append(reranked[:k_rerank])
+    return out
+
+def hybrid_search(q: str, k_fusion: int = TOP_K_FUSION, k_rerank: int = RERANK_KEEP,
+                  eng: Engine | None = None) -> Tuple[Dict[str, Any], List[int]]:
+    return hybrid_search_batch([q], k_fusion, k_rerank, eng)[0]
 
 # ---------- Prompting ----------
-def make_evidence(idxs: List[int], limit: int = MAX_CTX_SNIPPETS) -> List[Dict[str, str]]:
+def make_evidence(idxs: List[int], eng: Engine, limit: int = MAX_CTX_SNIPPETS) -> List[Dict[str, str]]:
     ev = []
     seen = set()
     for i in idxs[:limit]:
-        snip = texts[i].strip().replace("\n", " ")
-        src = meta[i]["source"] or "unknown"
+        snip = eng.text(i).strip().replace("\n", " ")
+        src = eng.value("source", i) or "unknown"
         key = (snip[:100], src)
         if key in seen:
             continue
@@ -426,7 +1203,7 @@ def make_evidence(idxs: List[int], limit: int = MAX_CTX_SNIPPETS) -> List[Dict[s
         ev.append({"snippet": snip[:800], "source": src})
     return ev
 
-def build_prompt(evidence, user_query, signals):
+def build_prompt(evidence, user_query, signals, language=None):
     ctx = "\n".join(
         [f"[S{i+1}] {e['snippet']}\n(Source: {e['source']})" for i, e in enumerate(evidence)]
     )
@@ -437,6 +1214,14 @@ def build_prompt(evidence, user_query, signals):
     if signals.get("month"): focus.append(f"Month: {signals['month']}")
     if signals.get("year"):  focus.append(f"Year: {signals['year']}")
     focus_line = ("Focus → " + ", ".join(focus)) if focus else "Focus only on the user's query."
+    if language in multilingual.LANGUAGES:
+        name = multilingual.LANGUAGES[language]
+        language_note = f"""- The USER QUESTION is in {name}; the EVIDENCE is in English. Understand both directly, then follow all the ROLE, CONSTRAINTS, and DECISION LOGIC above.
+        - Write the whole final OUTPUT in {name} (no translation step follows). Keep [S#] tags, numbers, units, the word “Sources” and the `source` strings exactly as they are."""
+    else:
+        language_note = """- The USER QUESTION may be in any Indian language (Hindi, Bengali, Tamil, English, etc.).
+        - Your job is to first interpret the USER QUESTION correctly in English internally, then follow all the ROLE, CONSTRAINTS, and DECISION LOGIC above.
+        - Always produce the final OUTPUT in the same language as the USER QUESTION, unless explicitly asked by the user to reply in their language."""
 
     return f"""
         You are an agriculture assistant for Indian farmers.
@@ -479,55 +1264,184 @@ def build_prompt(evidence, user_query, signals):
         {user_query}
 
         Note:
-        - The USER QUESTION may be in any Indian language (Hindi, Bengali, Tamil, English, etc.).
-        - Your job is to first interpret the USER QUESTION correctly in English internally, then follow all the ROLE, CONSTRAINTS, and DECISION LOGIC above.
-        - Always produce the final OUTPUT in the same language as the USER QUESTION, unless explicitly asked by the user to reply in their language.
+        {language_note}
     """
 
-def grounded_answer(q: str) -> str:
-    signals, idxs = hybrid_search(q)
+def _majority_crop(idxs: List[int], eng: Engine) -> str | None:
+    counts = {}
+    for i in idxs[:10]:
+        c = eng.value("crop", i)
+        if c:
+            counts[c] = counts.get(c, 0) + 1
+    if not counts: return None
+    return max(counts, key=counts.get)
+
+def retrieve_batch(qs: List[str], k_fusion: int = TOP_K_FUSION, k_rerank: int = RERANK_KEEP
+                   ) -> List[Tuple[Dict[str, Any], List[Dict[str, str]], str | None]]:
+    """
+    Retrieval half of the pipeline: parse, filter, search, rerank, make_evidence.
+    Returns (signals, evidence, majority_crop) per query. This is what the
+    retrieval daemon serves; everything after it needs no corpus or models.
+    """
+    if PARTITION_NODES:
+        return _retrieve_batch_partitioned(qs, k_fusion, k_rerank)
+    with use_engine() as pinned:   # one engine for the whole batch, even across a reload
+        eng = pinned.view()         # and one delta snapshot
+        return [(signals, make_evidence(idxs, eng), _majority_crop(idxs, eng))
+                for signals, idxs in hybrid_search_batch(qs, k_fusion, k_rerank, eng)]
+
+# ---------- Partitioned search (see partitions.py) ----------
+def partition_search_batch(items: List[Tuple[str, Dict[str, Any], bytes]], k_fusion: int):
+    """
+    Partition node side of OP_PART_SEARCH: for each (query, signals, query vector) the same
+    filter_pool, BM25 and dense search as _fuse_candidates, over this part only.
+    Returns per query (miss_mask, dense, bm25) with hits as (doc, score), and the docs they index.
+    """
+    with use_engine() as pinned:
+        eng = pinned.view()
+        qv = np.stack([np.frombuffer(v, dtype=">f4") for _, _, v in items]).astype(np.float32)
+        dim_in = pinned.projection.shape[0] if pinned.projection is not None else pinned.dim
+        if qv.shape[1] != dim_in:
+            raise ValueError(f"query vectors have {qv.shape[1]} dims, this part's index expects {dim_in}")
+        pools = [_query_pool(signals, eng) for _, signals, _ in items]
+        hits = _dense_batch(pinned._project(qv), [g for _, _, g in pools], eng, k_fusion*2)
+        rows: Dict[int, int] = {}
+        docs, results = [], []
+
+        def doc(i: int) -> int:
+            if i not in rows:
+                rows[i] = len(docs)
+                docs.append((eng.text(i), eng.value("source", i), eng.value("crop", i)))
+            return rows[i]
+
+        for (q, _, _), (pool, misses, g), (D, I) in zip(items, pools, hits):
+            dense, bm = _pool_hits(q, pool, g, D, I, eng, k_fusion)
+            results.append((miss_mask(misses), [(doc(i), sc) for i, sc in dense], [(doc(i), sc) for i, sc in bm]))
+        return results, docs
+
+def partition_info() -> Dict[str, Any]:
+    """What the coordinator needs to route to this node (OP_PART_INFO)."""
+    with use_engine() as eng:
+        pmap = partitions.load_map(os.path.dirname(os.path.dirname(eng.art_dir)))
+        return {"partition": PARTITION, "n": len(pmap["parts"]), "by": pmap["by"],
+                "values": pmap["parts"][PARTITION]["values"], "docs": eng.n_docs, "version": eng.version}
+
+_partition_set = None
+def get_partition_set() -> "partitions.PartitionSet":
+    global _partition_set
+    if _partition_set is None:
+        _partition_set = partitions.PartitionSet(PARTITION_NODES)
+    return _partition_set
+
+_query_embedder = None
+_query_embedder_lock = threading.Lock()
+def _get_query_embedder():
+    """Coordinator only: partition nodes get vectors, so the embedder lives here."""
+    global _query_embedder
+    if _query_embedder is None:
+        with _query_embedder_lock:
+            if _query_embedder is None:
+                _query_embedder = load_query_embedder()
+                _mark("embedder")
+    return _query_embedder
+
+def _partition_route(signals: Dict[str, Any], by: str) -> set | None:
+    """Key values a query's matches can have (None = any part may hold them)."""
+    if by == "metric":
+        metrics = INTENT_METRICS.get(signals.get("intent"))
+        return set(metrics) if metrics else None
+    if by == "state" and signals.get("state"):
+        return {signals["state"], None}   # plus docs without a state (all-India, central schemes)
+    return None
+
+def _retrieve_batch_partitioned(qs: List[str], k_fusion: int, k_rerank: int):
+    parts = get_partition_set()
+    gaz = parts.gazetteer()
+    signals = [merged_parse_query(q, gaz) for q in qs]
+    qv = _get_query_embedder().encode(qs, normalize_embeddings=True, convert_to_numpy=True).astype(">f4")
+    items = [(q, s, qv[j].tobytes()) for j, (q, s) in enumerate(zip(qs, signals))]
+    by = parts.key()
+    ranked, docs = parts.search(items, qv.shape[1], k_fusion, [parts.route(_partition_route(s, by)) for s in signals])
+    fused = [rrf_fuse(bm, dense)[:max(k_fusion, k_rerank)] for dense, bm in ranked]
+    return [(s, make_evidence(idxs, docs), _majority_crop(idxs, docs))
+            for s, idxs in zip(signals, _rerank(qs, fused, docs, k_rerank))]
+
+def retrieve(q: str) -> Tuple[Dict[str, Any], List[Dict[str, str]], str | None]:
+    if RETRIEVAL_SOCKET:
+        return get_retrieval_client().retrieve(q, TOP_K_FUSION, RERANK_KEEP)
+    return retrieve_batch([q])[0]
+
+def prepare_answer(q: str, language: str | None = None) -> Tuple[str | None, str | None, List[Dict[str, str]]]:
+    """
+    Retrieval + prompt building (no LLM call).
+    Returns (final_text, prompt, evidence): final_text is set when we can answer
+    without the LLM (clarification / no evidence); otherwise prompt is set.
+    language: answer in it directly (see multilingual.LANGUAGES) instead of the question's.
+    """
+    signals, evidence, maj = retrieve(q)
 
     if ASK_FOR_MISSING_SLOTS and signals["intent"] == "sowing_window" and (signals["state"] is None or signals["month"] is None):
         missing = []
         if signals["state"] is None: missing.append("state")
         if signals["month"] is None: missing.append("month")
-        ask = " and ".join(missing)
-        return f"I need your {ask} to be precise."
+        words = multilingual.MESSAGES.get(language or "", {})
+        ask = words.get("and", " and ").join(words.get(m, m) for m in missing)
+        return multilingual.message(language, "ask", "I need your {ask} to be precise.", ask=ask), None, []
 
-    evidence = make_evidence(idxs)
     if REQUIRE_EVIDENCE_MIN and len(evidence) < EVIDENCE_MIN:
-        return "No matching sources retrieved in corpus."
-
-    def _majority_crop(idxs: List[int]) -> str | None:
-        counts = {}
-        for i in idxs[:10]:
-            c = meta[i]["crop"]
-            if c:
-                counts[c] = counts.get(c, 0) + 1
-        if not counts: return None
-        return max(counts, key=counts.get)
-
-    maj = _majority_crop(idxs)
+        return multilingual.message(language, "no_evidence", "No matching sources retrieved in corpus."), None, evidence
+
     if signals.get("crop") and maj and maj != signals["crop"]:
-        return (f"I found evidence mainly for **{maj}**, but you seem to be asking about **{signals['crop']}**. "
-                f"Do you want info on {signals['crop']} or {maj}?")
+        return multilingual.message(
+            language, "crop_mismatch", "I found evidence mainly for **{maj}**, but you seem to be asking about "
+            "**{crop}**. Do you want info on {crop} or {maj}?", maj=maj, crop=signals["crop"]), None, evidence
 
-    prompt = build_prompt(evidence, q, signals)
-    try:
-        resp = gemini.models.generate_content(model=GEMINI_MODEL, contents=prompt)
-        text = (resp.text or "").strip()
-    except Exception as e:
-        text = f"(Model error: {e})\n\nHere are relevant sources:\n" + \
-               "\n".join(f"- {e['source']}" for e in evidence)
+    return None, build_prompt(evidence, q, signals, language), evidence
+
+def model_error_text(err: Exception, evidence: List[Dict[str, str]]) -> str:
+    return f"(Model error: {err})\n\nHere are relevant sources:\n" + \
+           "\n".join(f"- {e['source']}" for e in evidence)
 
+def finalize_answer(text: str, evidence: List[Dict[str, str]]) -> str:
     srcs = "\n".join([f"- {e['source']}" for e in evidence])
     if "Sources" not in text:
         text += "\n\nSources:\n" + srcs
     return text
 
+def grounded_answer(q: str, language: str | None = None) -> str:
+    final, prompt, evidence = prepare_answer(q, language)
+    if final is not None:
+        return final
+
+    try:
+        resp = get_gemini().models.generate_content(model=GEMINI_MODEL, contents=prompt)
+        text = (resp.text or "").strip()
+    except Exception as e:
+        text = model_error_text(e, evidence)
+    return finalize_answer(text, evidence)
+
+# ---------- Coalescing ----------
+if COALESCE_MODE == "file":
+    _flight = FileSingleFlight(COALESCE_DIR)
+elif COALESCE_MODE == "thread":
+    _flight = SingleFlight()
+else:
+    _flight = None
+
+def coalesce_key(q: str, language: str | None = None) -> str:
+    # _norm keeps only ASCII letters, which would make every Indic-script question look alike
+    text = " ".join(_norm(q).split()) if q.isascii() else " ".join(q.lower().split())
+    return make_key(parse_query(q), f"{language}:{text}" if language else text)
+
+def coalesce_stats() -> Dict[str, int]:
+    return _flight.stats() if _flight else {"leaders": 0, "coalesced": 0, "in_flight": 0}
+
 # ---------- Public API ----------
-def generate_answer(user_query: str) -> str:
-    return grounded_answer(user_query)
+def generate_answer(user_query: str, language: str | None = None) -> str:
+    """language: answer in it without translating (chat checks answers_natively first)."""
+    if _flight is None:
+        return grounded_answer(user_query, language)
+    return _flight.do(coalesce_key(user_query, language), lambda: grounded_answer(user_query, language))
 
 # ---------- CLI ----------
 if __name__ == "__main__":
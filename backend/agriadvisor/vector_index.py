@@ -0,0 +1,336 @@
+# vector_index.py
+# -----------------------------------------------------------------------------
+# FAISS index variants the builder writes and the engine serves:
+#   flat   IndexIDMap2(IndexFlatIP) in <version>/index_flatip.faiss (default build)
+#   ivf    IndexIVF* whose inverted lists live in <version>/index.ivfdata
+#          (OnDiskInvertedLists). Built by `index_builder.py --low-memory`
+#          within a fixed RAM budget; the server pages lists in through mmap.
+# Either one can store compressed codes (--compress fp16 | sq8 | pq):
+#   fp16   2 bytes a dim     sq8   1 byte a dim     pq<M>   M bytes a vector
+# Lossy versions also keep <version>/vectors.f32, the full-precision vectors in
+# store row order. The engine mmaps it and re-scores each query's top
+# candidates exactly (rescore()).
+# --binary adds <version>/index_binary.faiss: one sign bit a dim (IndexBinaryFlat,
+# store row order) for a Hamming-distance first stage, re-scored against
+# vectors.f32 (written for binary versions too).
+# --pca-dim N adds <version>/projection.npy (dim × N): every vector the index,
+# vectors.f32 and the delta segment hold is x @ P, and the engine applies P to
+# query vectors right after encoding.
+# The index file keeps its name whatever the variant. Every variant stores the
+# stable doc ids, so the engine maps hits to store rows the same way.
+# -----------------------------------------------------------------------------
+
+import os
+import re
+import math
+import shutil
+from typing import Callable, Dict, Iterator, Tuple
+
+import numpy as np
+import faiss
+
+IVF_DATA_FILE = "index.ivfdata"   # next to the index file; found via IO_FLAG_ONDISK_SAME_DIR
+VECTORS_FILE = "vectors.f32"      # full-precision rows for re-scoring lossy codecs
+BINARY_FILE = "index_binary.faiss"   # sign bits of every vector, row = store row
+PROJECTION_FILE = "projection.npy"   # float32 (embedder dim × reduced dim), see train_projection()
+TRAIN_PER_LIST = 39               # k-means training points per list / PQ centroid (FAISS warns below that)
+CODECS = {"flat": "Flat", "fp16": "SQfp16", "sq8": "SQ8"}   # + "pq<M>" → "PQ<M>" (M bytes, 8 bits each)
+
+def factory_string(codec: str, ivf_nlist: int | None = None) -> str:
+    if codec in CODECS:
+        body = CODECS[codec]
+    elif re.fullmatch(r"pq\d+", codec):
+        body = codec.upper()
+    else:
+        raise ValueError(f"unknown codec {codec!r} (flat, fp16, sq8, pq<M>)")
+    return f"IVF{ivf_nlist},{body}" if ivf_nlist else f"IDMap2,{body}"
+
+def new_index(codec: str, dim: int, ivf_nlist: int | None = None):
+    return faiss.index_factory(dim, factory_string(codec, ivf_nlist), faiss.METRIC_INNER_PRODUCT)
+
+def is_lossy(codec: str) -> bool:
+    return codec != "flat"
+
+def code_bytes(codec: str, dim: int) -> int:
+    """Bytes a vector in the index (ids and IVF overhead not counted)."""
+    return {"flat": 4 * dim, "fp16": 2 * dim, "sq8": dim}.get(codec) or int(codec[2:])
+
+def ivf_data_path(index_path: str) -> str:
+    return os.path.join(os.path.dirname(index_path), IVF_DATA_FILE)
+
+def is_ondisk(index_path: str) -> bool:
+    return os.path.exists(ivf_data_path(index_path))
+
+# ---------- Opening ----------
+def read_index(index_path: str):
+    """Read-only handle for serving: flat codes / inverted lists are mmapped, not loaded."""
+    if is_ondisk(index_path):
+        # OnDiskInvertedLists mmap their own file; the generic MMAP flags don't apply to them
+        return faiss.read_index(index_path, faiss.IO_FLAG_ONDISK_SAME_DIR | faiss.IO_FLAG_READ_ONLY)
+    # IO_FLAG_MMAP_IFC maps flat codes (IndexFlat*) on faiss builds that have it.
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    try:
+        return faiss.read_index(index_path, flags)
+    except RuntimeError as e:
+        print(f"mmap read not supported for this index ({e}); loading into memory.")
+        return faiss.read_index(index_path)
+
+def writable_copy(index_path: str):
+    """
+    The index at index_path loaded into RAM for add/remove (on-disk lists included: faiss'
+    OnDiskInvertedLists can't be updated in place reliably). Save it with write_index().
+    """
+    if not is_ondisk(index_path):
+        return faiss.read_index(index_path)
+    index = faiss.read_index(index_path, faiss.IO_FLAG_ONDISK_SAME_DIR | faiss.IO_FLAG_READ_ONLY)
+    ivf = faiss.extract_index_ivf(index)
+    src = ivf.invlists
+    lists = faiss.ArrayInvertedLists(ivf.nlist, ivf.code_size)
+    for l in range(ivf.nlist):
+        n = src.list_size(l)
+        if n:
+            lists.add_entries(l, n, src.get_ids(l), src.get_codes(l))
+    ivf.replace_invlists(lists, True)
+    lists.this.disown()
+    return index
+
+def write_index(index, index_path: str):
+    """Save an index; an IVF held in RAM goes back to on-disk lists (IVF_DATA_FILE) next to index_path."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None or isinstance(faiss.downcast_InvertedLists(ivf.invlists), faiss.OnDiskInvertedLists):
+        faiss.write_index(index, index_path)
+        return
+    from faiss.contrib.ondisk import merge_ondisk
+    tmp = index_path + ".lists.tmp"
+    faiss.write_index(index, tmp)
+    index.reset()   # frees the in-RAM lists; merge_ondisk wants an empty trained index
+    data_path = ivf_data_path(index_path)
+    if os.path.exists(data_path):
+        os.remove(data_path)
+    merge_ondisk(index, [tmp], data_path)
+    faiss.write_index(index, index_path)
+    os.remove(tmp)
+
+def set_nprobe(index, nprobe: int):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+
+def _codes_index(index):
+    """The index that holds the codes: the IVF itself, or the one wrapped by IDMap2."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.downcast_index(ivf)
+    return faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+
+def codec_of(index) -> str:
+    """Codec name (see CODECS) of a flat / IDMap2 / IVF index."""
+    inner = _codes_index(index)
+    if hasattr(inner, "pq"):
+        return f"pq{inner.pq.M}"
+    if hasattr(inner, "sq"):
+        return "fp16" if inner.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "flat"
+
+def describe(index) -> str:
+    ivf = faiss.try_extract_index_ivf(index)
+    codec = codec_of(index)
+    if ivf is None:
+        return f"flat, {codec} codes ({index.ntotal} × {index.d})"
+    where = "on disk" if isinstance(faiss.downcast_InvertedLists(ivf.invlists), faiss.OnDiskInvertedLists) else "in memory"
+    return f"ivf{ivf.nlist} {where}, {codec} codes, nprobe {ivf.nprobe} ({index.ntotal} × {index.d})"
+
+def rescore(qv: np.ndarray, rows: np.ndarray, vectors: np.ndarray, k: int):
+    """Exact inner products for candidate store rows (-1 = none) → top-k (D, rows) per query."""
+    D = np.full(rows.shape, -np.inf, dtype=np.float32)
+    for j in range(len(qv)):
+        ok = rows[j] >= 0
+        D[j, ok] = np.asarray(vectors[rows[j][ok]]) @ qv[j]   # memmap: reads only these rows
+    top = np.argsort(-D, axis=1, kind="stable")[:, :k]
+    D, rows = np.take_along_axis(D, top, axis=1), np.take_along_axis(rows, top, axis=1)
+    return D, np.where(np.isfinite(D), rows, -1)
+
+def reconstruct_ids(index, ids: np.ndarray) -> np.ndarray:
+    """Stored vectors for doc ids (flat IDMap2 or IVF)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)   # id → (list, offset); 16 bytes a vector
+    return index.reconstruct_batch(np.ascontiguousarray(ids, dtype=np.int64))
+
+def row_reader(art_dir: str, index, ids: np.ndarray | None, n_docs: int) -> Callable[[np.ndarray], np.ndarray]:
+    """rows → a version's vectors (index space): from VECTORS_FILE when it has one, else out of the index."""
+    vec_path = os.path.join(art_dir, VECTORS_FILE)
+    if os.path.exists(vec_path):
+        exact = np.memmap(vec_path, dtype=np.float32, mode="r", shape=(n_docs, index.d))
+        return lambda rows: np.asarray(exact[rows])
+    return lambda rows: reconstruct_ids(index, rows if ids is None else ids[rows])
+
+# ---------- Binary codes (--binary) ----------
+def binarize(vecs: np.ndarray) -> np.ndarray:
+    """Sign bits packed 8 to a byte: dim/8 bytes a vector, searched by Hamming distance (popcount)."""
+    return np.packbits(np.asarray(vecs) > 0, axis=1)
+
+def read_binary(path: str):
+    return faiss.read_index_binary(path)
+
+def write_binary_index(index, path: str):
+    faiss.write_index_binary(index, path)
+
+def write_binary(vectors: np.ndarray, path: str, chunk: int = 100000):
+    """IndexBinaryFlat over the sign bits of vectors (row i = store row i)."""
+    if vectors.shape[1] % 8:
+        raise ValueError(f"binary codes need a dim divisible by 8, got {vectors.shape[1]}")
+    index = faiss.IndexBinaryFlat(vectors.shape[1])
+    for s in range(0, len(vectors), chunk):
+        index.add(binarize(vectors[s:s + chunk]))
+    write_binary_index(index, path)
+    return index
+
+# ---------- Dimensionality reduction (--pca-dim) ----------
+def train_projection(sample: np.ndarray, dim_out: int) -> Tuple[np.ndarray, float]:
+    """
+    Uncentered PCA: the top dim_out eigenvectors of XᵀX, so (x @ P)·(q @ P) ≈ x·q.
+    (Mean-centred PCA would shift every inner product by a per-doc term.)
+    Returns P and the share of the sample's energy it keeps.
+    """
+    X = np.asarray(sample, dtype=np.float64)
+    w, V = np.linalg.eigh(X.T @ X / max(len(X), 1))
+    top = np.argsort(w)[::-1][:dim_out]
+    return np.ascontiguousarray(V[:, top], dtype=np.float32), float(w[top].sum() / max(w.sum(), 1e-12))
+
+def projection_recall(sample: np.ndarray, P: np.ndarray, ks=(10, 50), n_queries: int = 200) -> Dict[int, float]:
+    """Recall@k of search in the projected space vs full-dim search, queries held out of the sample."""
+    sample = np.ascontiguousarray(sample, dtype=np.float32)
+    n_queries = min(n_queries, len(sample) // 2)
+    q, db = sample[:n_queries], sample[n_queries:]
+    k_max = min(max(ks), len(db))
+    if not n_queries or not k_max:
+        return {}
+    full, red = faiss.IndexFlatIP(db.shape[1]), faiss.IndexFlatIP(P.shape[1])
+    full.add(db)
+    red.add(np.ascontiguousarray(db @ P))
+    _, truth = full.search(q, k_max)
+    _, found = red.search(np.ascontiguousarray(q @ P), k_max)
+    return {k: float(np.mean([len(set(f[:k]) & set(t[:k])) / k for f, t in zip(found, truth)]))
+            for k in ks if k <= k_max}
+
+def load_projection(art_dir: str) -> np.ndarray | None:
+    path = os.path.join(art_dir, PROJECTION_FILE)
+    return np.load(path) if os.path.exists(path) else None
+
+# ---------- Streamed builds (--low-memory, --compress, --pca-dim) ----------
+def strided_sample(blocks: Callable[[int], Iterator[Tuple[np.ndarray, np.ndarray]]], n: int, want: int,
+                   block_rows: int, dim: int) -> np.ndarray:
+    """About `want` vectors spread evenly over one pass of blocks()."""
+    stride, seen, sample = max(1, n // max(want, 1)), 0, []
+    for ids, vecs in blocks(block_rows):
+        take = np.arange((-seen) % stride, len(ids), stride)
+        sample.append(np.asarray(vecs[take], dtype=np.float32))
+        seen += len(ids)
+    return np.concatenate(sample)[:want] if sample else np.zeros((0, dim), dtype=np.float32)
+
+def default_nlist(n: int) -> int:
+    return int(min(65536, max(16, 4 * math.sqrt(n))))
+
+def build_streamed(index_path: str, blocks: Callable[[int], Iterator[Tuple[np.ndarray, np.ndarray]]],
+                   all_ids: np.ndarray, dim: int, budget_mb: int, codec: str = "flat",
+                   ivf: bool = False, nlist: int | None = None, binary: bool = False, keep_vectors: bool = True):
+    """
+    Index over every (ids, vecs) chunk of blocks(rows); all_ids are the store's doc ids in row order.
+    blocks() is read once for a strided training sample (IVF quantizer, SQ ranges, PQ codebooks)
+    and once to add. ivf: chunks go to small IVF files of ≤ budget/4 vectors, merged into
+    index.ivfdata next to index_path, so peak memory stays around budget_mb however large the
+    corpus. Lossy codecs and binary also get VECTORS_FILE, written row by row from the same chunks;
+    binary then gets BINARY_FILE from it. keep_vectors=False leaves VECTORS_FILE out, for an index
+    re-scored from another copy (metric sub-indexes use their version's).
+    """
+    n = len(all_ids)
+    budget, row = budget_mb << 20, dim * 4
+    nlist = (nlist or default_nlist(n)) if ivf else None
+    block_rows = max(1024, budget // 4 // row)
+    want = max(nlist * TRAIN_PER_LIST if ivf else 0, 256 * TRAIN_PER_LIST if codec.startswith("pq") else 0,
+               20000 if codec == "sq8" else 0)
+
+    # Pass 1: strided training sample
+    if want:
+        sample = strided_sample(blocks, n, max(1, min(n, want, budget // 2 // row)), block_rows, dim)
+        if ivf:
+            nlist = max(1, min(nlist, len(sample) // TRAIN_PER_LIST or 1))
+        if codec.startswith("pq") and len(sample) < 256:
+            raise RuntimeError(f"{codec} needs at least 256 vectors to train, have {len(sample)}")
+        print(f"[index] Training {factory_string(codec, nlist)} on {len(sample)} of {n} vectors "
+              f"(budget {budget_mb} MB)")
+        trained = new_index(codec, dim, nlist)
+        trained.train(sample)
+        del sample
+    else:
+        trained = new_index(codec, dim, nlist)
+
+    vectors = None
+    vec_path = os.path.join(os.path.dirname(index_path), VECTORS_FILE)
+    if (is_lossy(codec) and keep_vectors) or binary:   # exact vectors in store row order, for re-scoring
+        open(vec_path, "wb").close()
+        vectors = np.memmap(vec_path, dtype=np.float32, mode="w+", shape=(n, dim)) if n else None
+        order = np.argsort(all_ids, kind="stable")
+        sorted_ids = all_ids[order]
+
+    # Pass 2: add (straight into the index, or one small IVF file per ≤ block_rows vectors)
+    tmp_dir = os.path.join(os.path.dirname(index_path), ".index-blocks")
+    if ivf:
+        os.makedirs(tmp_dir, exist_ok=True)
+        trained_path = os.path.join(tmp_dir, "trained.faiss")
+        faiss.write_index(trained, trained_path)
+    files, buf_i, buf_v, held = [], [], [], 0
+
+    def flush():
+        part = faiss.read_index(trained_path)
+        part.add_with_ids(np.concatenate(buf_v), np.concatenate(buf_i))
+        files.append(os.path.join(tmp_dir, f"block{len(files):05d}.faiss"))
+        faiss.write_index(part, files[-1])
+        buf_i.clear()
+        buf_v.clear()
+
+    for ids, vecs in blocks(block_rows):
+        ids, vecs = np.asarray(ids, dtype=np.int64), np.ascontiguousarray(vecs, dtype=np.float32)
+        if vectors is not None:
+            vectors[order[np.searchsorted(sorted_ids, ids)]] = vecs
+        if not ivf:
+            trained.add_with_ids(vecs, ids)
+            continue
+        buf_i.append(ids)
+        buf_v.append(vecs)
+        held += len(ids)
+        if held >= block_rows:
+            flush()
+            held = 0
+    if buf_i:
+        flush()
+    if vectors is not None:
+        vectors.flush()
+        del vectors
+    if binary:
+        bits = write_binary(np.memmap(vec_path, dtype=np.float32, mode="r", shape=(n, dim)) if n
+                            else np.zeros((0, dim), dtype=np.float32), os.path.join(os.path.dirname(index_path), BINARY_FILE))
+        print(f"[index] {bits.ntotal} binary codes, {dim // 8} bytes each → {BINARY_FILE}")
+
+    if not ivf:
+        faiss.write_index(trained, index_path)
+        print(f"[index] {trained.ntotal} vectors, {factory_string(codec)} → {index_path}")
+        return trained
+
+    # Merge all blocks' lists into one mmapped file (blocks are read through mmap too)
+    from faiss.contrib.ondisk import merge_ondisk
+    data_path = ivf_data_path(index_path)
+    if os.path.exists(data_path):
+        os.remove(data_path)
+    index = faiss.read_index(trained_path)
+    if files:
+        merge_ondisk(index, files, data_path)
+    else:   # nothing to add: still an on-disk index, just empty
+        invlists = faiss.OnDiskInvertedLists(nlist, index.code_size, data_path)
+        index.replace_invlists(invlists, True)
+        invlists.this.disown()
+    faiss.write_index(index, index_path)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    print(f"[index] {index.ntotal} vectors in {len(files)} blocks, {factory_string(codec, nlist)} → {data_path}")
+    return index
@@ -0,0 +1,37 @@
+# warmup.py
+# Optional background warm-up, started by the server entrypoints (wsgi.py / asgi.py)
+# only, so manage.py commands never load models. Disable with AGRI_WARMUP=0.
+# Also hooks engine hot reload: SIGHUP, and (ARTIFACT_WATCH_SECONDS > 0) polling
+# artifacts/CURRENT so every worker follows a new index version.
+
+import os
+import signal
+import threading
+
+def install_reload_hooks():
+    from agriadvisor import utils
+    if threading.current_thread() is threading.main_thread() and hasattr(signal, "SIGHUP"):
+        try:
+            signal.signal(signal.SIGHUP, lambda *_: utils.request_reload())
+        except ValueError:
+            pass   # server owns signal handling
+    interval = float(os.getenv("ARTIFACT_WATCH_SECONDS", "0"))
+    if interval > 0 and not utils.RETRIEVAL_SOCKET:
+        utils.watch_artifacts(interval)
+
+def start_warmup():
+    install_reload_hooks()
+    if os.getenv("AGRI_WARMUP", "1") == "0":
+        return None
+
+    def _run():
+        from agriadvisor import speech, utils
+        utils.warm_up(background=False)
+        try:
+            speech.get_whisper_model()
+        except Exception as e:
+            print(f"Whisper warm-up failed: {e}")
+
+    t = threading.Thread(target=_run, name="agri-warmup", daemon=True)
+    t.start()
+    return t
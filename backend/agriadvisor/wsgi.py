@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agriadvisor.settings')
 
 application = get_wsgi_application()
+
+from agriadvisor.warmup import start_warmup  # noqa: E402
+
+start_warmup()
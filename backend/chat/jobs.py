@@ -0,0 +1,189 @@
+# jobs.py
+# -----------------------------------------------------------------------------
+# DB-backed answer-generation queue (no external broker).
+# - messages/ with "background": true creates a PENDING ChatMessage and returns
+# - `python manage.py run_answer_workers` claims jobs (highest priority first,
+#   SELECT ... FOR UPDATE SKIP LOCKED) and runs translation + RAG + Gemini
+# - clients poll messages/<id>/ until status is done/failed
+# - an idempotency key makes client retries return the existing message
+# - a running job's worker refreshes started_at (heartbeat); only the claim that is
+#   still current (status RUNNING, same attempt) may write the result
+# -----------------------------------------------------------------------------
+
+import time
+import hashlib
+import threading
+from datetime import timedelta
+
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from . import translation
+from .models import ChatMessage
+
+PRIORITY_MIN, PRIORITY_MAX = -10, 10
+MAX_ATTEMPTS = 3
+STALE_AFTER = timedelta(minutes=10)   # no heartbeat for this long → worker died, requeue (or fail)
+HEARTBEAT = STALE_AFTER / 4           # how often a running job refreshes started_at
+POLL_INTERVAL = 0.5
+
+ERROR_TEXT = "Sorry, I encountered an error. Please try again."
+
+def answer_prompt(prompt, input_language):
+    """Translate → generate_answer → translate back. Shared by the sync view and workers."""
+    from agriadvisor.utils import answers_natively, generate_answer  # lazy: keeps manage.py commands fast
+
+    language = translation.resolve_language(prompt, input_language)
+    if language != 'en' and answers_natively(language):
+        # Multilingual retrieval: search and answer in the user's language, no translation calls
+        return generate_answer(prompt, language=language)
+
+    # Cached per sentence; no call when the text is already in the target language
+    translator = translation.get_translator()
+    english_response = generate_answer(translator.translate(prompt, language, 'en'))
+    return translator.translate(english_response, 'en', language)
+
+# ---------- Producer side ----------
+def scoped_key(user, key):
+    """
+    Idempotency keys are per user so two clients can't collide. Stored as a sha256 of
+    "<user pk>:<key>" so keys of any length fit the column without truncation collisions.
+    """
+    return hashlib.sha256(f"{user.pk}:{key}".encode('utf-8')).hexdigest() if key else None
+
+def enqueue(chat, prompt, input_type, input_language, priority=0, idempotency_key=None):
+    """
+    Create a PENDING message. Returns (message, created).
+    An unsaved `chat` (a new conversation) is saved in the same transaction, so a retry
+    that loses to an earlier one with the same key leaves no empty chat behind.
+    """
+    priority = max(PRIORITY_MIN, min(PRIORITY_MAX, int(priority)))
+    if idempotency_key:
+        existing = ChatMessage.objects.filter(idempotency_key=idempotency_key).first()
+        if existing:
+            return existing, False
+    try:
+        with transaction.atomic():
+            if chat._state.adding:
+                chat.save()
+            msg = ChatMessage.objects.create(
+                chat=chat,
+                prompt_text=prompt,
+                input_type=input_type,
+                input_language=input_language,
+                status=ChatMessage.Status.PENDING,
+                priority=priority,
+                idempotency_key=idempotency_key,
+            )
+    except IntegrityError:
+        # Lost the race against a concurrent retry with the same key
+        return ChatMessage.objects.get(idempotency_key=idempotency_key), False
+    return msg, True
+
+def queue_metrics():
+    now = timezone.now()
+    counts = dict(
+        ChatMessage.objects.exclude(status=ChatMessage.Status.DONE)
+        .values_list('status').annotate(n=Count('id')).values_list('status', 'n')
+    )
+    oldest = ChatMessage.objects.filter(status=ChatMessage.Status.PENDING).aggregate(t=Min('created_at'))['t']
+    by_priority = dict(
+        ChatMessage.objects.filter(status=ChatMessage.Status.PENDING)
+        .values_list('priority').annotate(n=Count('id')).values_list('priority', 'n')
+    )
+    return {
+        'pending': counts.get(ChatMessage.Status.PENDING, 0),
+        'running': counts.get(ChatMessage.Status.RUNNING, 0),
+        'failed': counts.get(ChatMessage.Status.FAILED, 0),
+        'pending_by_priority': by_priority,
+        'oldest_pending_age_s': (now - oldest).total_seconds() if oldest else 0.0,
+    }
+
+# ---------- Worker side ----------
+def requeue_stale():
+    """Requeue RUNNING jobs whose worker died; fail those that were on their last attempt."""
+    now = timezone.now()
+    stale = ChatMessage.objects.filter(status=ChatMessage.Status.RUNNING, started_at__lt=now - STALE_AFTER)
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=ChatMessage.Status.FAILED, response_text=ERROR_TEXT, finished_at=now,
+    )
+    if failed:
+        print(f"Marked {failed} stale answer job(s) failed after {MAX_ATTEMPTS} attempts.")
+    return stale.filter(attempts__lt=MAX_ATTEMPTS).update(status=ChatMessage.Status.PENDING)
+
+def claim_next():
+    with transaction.atomic():
+        msg = (ChatMessage.objects
+               .select_for_update(skip_locked=True)
+               .filter(status=ChatMessage.Status.PENDING)
+               .order_by('-priority', 'created_at')
+               .first())
+        if msg is None:
+            return None
+        msg.status = ChatMessage.Status.RUNNING
+        msg.started_at = timezone.now()
+        msg.attempts += 1
+        msg.save(update_fields=['status', 'started_at', 'attempts'])
+    return msg
+
+def _this_claim(msg):
+    """The row while it is still this worker's claim (not requeued, failed or re-claimed since)."""
+    return ChatMessage.objects.filter(pk=msg.pk, status=ChatMessage.Status.RUNNING, attempts=msg.attempts)
+
+def _heartbeat(msg, stop):
+    """Keep started_at fresh while the job runs, so requeue_stale leaves a live job alone."""
+    try:
+        while not stop.wait(HEARTBEAT.total_seconds()):
+            _this_claim(msg).update(started_at=timezone.now())
+    finally:
+        connection.close()   # this thread's own connection
+
+def process(msg):
+    """Run one claimed job; returns False when the claim was lost and the result dropped."""
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(msg, stop), name=f"heartbeat-{msg.id}", daemon=True)
+    beat.start()
+    try:
+        msg.response_text = answer_prompt(msg.prompt_text, msg.input_language)
+        msg.status = ChatMessage.Status.DONE
+    except Exception as e:
+        print(f"Error during background generation for {msg.id}: {e}")
+        msg.response_text = ERROR_TEXT
+        msg.status = ChatMessage.Status.FAILED
+    finally:
+        stop.set()
+        beat.join()
+    msg.finished_at = timezone.now()
+    written = _this_claim(msg).update(
+        response_text=msg.response_text, status=msg.status, finished_at=msg.finished_at,
+    )
+    if not written:
+        print(f"Background job {msg.id} was requeued or finished elsewhere; dropped this attempt's result.")
+    return bool(written)
+
+def worker_loop(stop_event, poll_interval=POLL_INTERVAL):
+    while not stop_event.is_set():
+        close_old_connections()
+        msg = claim_next()
+        if msg is None:
+            stop_event.wait(poll_interval)
+            continue
+        process(msg)
+
+def run_workers(threads=2, poll_interval=POLL_INTERVAL):
+    """Run `threads` worker loops in this process until interrupted."""
+    stop = threading.Event()
+    requeue_stale()
+    pool = [threading.Thread(target=worker_loop, args=(stop, poll_interval), name=f"answer-worker-{i}", daemon=True)
+            for i in range(threads)]
+    for t in pool:
+        t.start()
+    try:
+        while any(t.is_alive() for t in pool):
+            time.sleep(STALE_AFTER.total_seconds() / 4)
+            requeue_stale()
+    except KeyboardInterrupt:
+        stop.set()
+        for t in pool:
+            t.join()
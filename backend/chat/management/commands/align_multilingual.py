@@ -0,0 +1,45 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ("Fit the map from the multilingual query encoder into the index's embedder space on corpus texts, "
+            "check it (held-out English + Hindi/Tamil/Bengali questions) and enable the no-translation chat path.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--texts', type=int, default=20000,
+                            help='Corpus texts (spread over the current store) to fit and check on.')
+        parser.add_argument('--holdout', type=float, default=0.1, help='Share of the texts kept out of the fit.')
+        parser.add_argument('--min-cosine', type=float, default=None,
+                            help='Lowest acceptable mean held-out cosine (default: multilingual.MIN_COSINE).')
+
+    def handle(self, *args, **options):
+        from sentence_transformers import SentenceTransformer
+        from agriadvisor import corpus_store, multilingual, utils
+
+        store_dir = os.path.join(corpus_store.current_art_dir(utils.ART_DIR), "store")
+        if corpus_store.store_format(store_dir) != corpus_store.FORMAT_VERSION:
+            raise CommandError(f"No corpus store under {utils.ART_DIR}; build the index first (index_builder.py).")
+        store = corpus_store.CorpusStore(store_dir)
+        step = max(1, store.n_docs // max(1, options['texts']))
+        texts = [store.text(i) for i in range(0, store.n_docs, step)][:options['texts']]
+        if len(texts) < 100:
+            raise CommandError(f"Only {len(texts)} corpus texts; too few to fit a {utils.EMB_MODEL} map.")
+
+        device = utils.get_device()
+        self.stdout.write(f"Encoding {len(texts)} texts with {utils.MULTILINGUAL_MODEL} and {utils.EMB_MODEL}…")
+        model = SentenceTransformer(utils.model_path(utils.MULTILINGUAL_MODEL), device=device)
+        embedder = SentenceTransformer(utils.model_path(utils.EMB_MODEL), device=device)
+        model.max_seq_length = embedder.max_seq_length
+        try:
+            meta = multilingual.build(
+                os.path.join(utils.ART_DIR, utils.MULTILINGUAL_SUBDIR), utils.MULTILINGUAL_MODEL, utils.EMB_MODEL,
+                model, embedder, texts, min_cosine=options['min_cosine'] or multilingual.MIN_COSINE,
+                holdout=options['holdout'])
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Multilingual map ready (held-out cosine {meta['check']['mean_cosine']:.4f}). "
+            f"{', '.join(multilingual.LANGUAGES.values())} chats skip translation once servers reload "
+            f"(MULTILINGUAL=auto); bundle the model with `bundle_models` if you serve from a bundle."))
@@ -0,0 +1,57 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ("Pack every model the backend and index builder load (embedder, cross-encoder, Whisper, "
+            "multilingual query encoder when aligned) "
+            "into a new versioned local bundle with checksums and make it current; servers then load "
+            "only from it, with hub lookups off.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', action='append', default=[], metavar='MODEL=PATH',
+                            help='Pack MODEL from a local directory/checkpoint instead of the hub (repeatable).')
+        parser.add_argument('--no-whisper', action='store_true', help='Leave the speech model out.')
+        parser.add_argument('--multilingual', action='store_true',
+                            help='Pack the multilingual query encoder (default: once align_multilingual has run).')
+        parser.add_argument('--no-activate', action='store_true', help='Write the bundle but leave CURRENT alone.')
+        parser.add_argument('--activate', metavar='VERSION', help='Point CURRENT at an existing bundle, no packing.')
+        parser.add_argument('--verify', action='store_true', help='Re-hash the current bundle against its manifest.')
+
+    def handle(self, *args, **options):
+        from agriadvisor import corpus_store, model_bundle, multilingual, speech, utils
+
+        root = utils.MODEL_BUNDLE_DIR or os.path.join(utils.ART_DIR, model_bundle.BUNDLE_SUBDIR)
+        if options['activate']:
+            try:
+                corpus_store.set_current(root, options['activate'])
+            except FileNotFoundError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"Model bundle {options['activate']} is current."))
+            return
+        if options['verify']:
+            name = corpus_store.current_version(root)
+            if not name:
+                raise CommandError(f"No model bundle under {root}.")
+            problems = model_bundle.verify(os.path.join(root, corpus_store.VERSIONS_DIR, name), deep=True)
+            if problems:
+                raise CommandError(f"Bundle {name}: " + "; ".join(problems))
+            self.stdout.write(self.style.SUCCESS(f"Bundle {name}: every file matches its checksum."))
+            return
+
+        models = {utils.EMB_MODEL: ("sentence-transformer", utils.EMB_MODEL),
+                  utils.RERANK_MODEL: ("cross-encoder", utils.RERANK_MODEL)}
+        if not options['no_whisper']:
+            models[speech.WHISPER_MODEL] = ("whisper", speech.WHISPER_MODEL)
+        if options['multilingual'] or (utils.MULTILINGUAL != "off" and multilingual.is_aligned(
+                os.path.join(utils.ART_DIR, utils.MULTILINGUAL_SUBDIR), utils.MULTILINGUAL_MODEL, utils.EMB_MODEL)):
+            models[utils.MULTILINGUAL_MODEL] = ("sentence-transformer", utils.MULTILINGUAL_MODEL)
+        for spec in options['source']:
+            model, sep, path = spec.partition('=')
+            if not sep or model not in models:
+                raise CommandError(f"--source {spec!r}: expected MODEL=PATH with MODEL one of {', '.join(models)}")
+            models[model] = (models[model][0], path)
+        name = model_bundle.pack(root, models, activate=not options['no_activate'])
+        state = "not activated" if options['no_activate'] else "now current; restart servers to load from it"
+        self.stdout.write(self.style.SUCCESS(f"Model bundle {name} written to {root} ({state})."))
@@ -0,0 +1,51 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Typical farmer questions; corpus texts are added from the current store
+CHECK_QUERIES = [
+    "wheat rust spray dose",
+    "when to sow paddy in punjab",
+    "mandi price of onion in nashik this week",
+    "rainfall in vidarbha in july 2019",
+    "how much urea per acre for maize",
+    "pm kisan scheme eligibility",
+    "cotton bollworm control organic",
+    "soil ph for groundnut",
+    "टमाटर में झुलसा रोग का इलाज",
+    "best variety of mustard for rajasthan",
+]
+
+
+class Command(BaseCommand):
+    help = ("Export the embedder to an ONNX query encoder (int8, mean pooling + normalize in the graph) "
+            "and enable it for the engine once it matches the PyTorch model within the cosine tolerance.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-int8', action='store_true', help='Keep fp32 weights.')
+        parser.add_argument('--check-docs', type=int, default=500,
+                            help='Corpus texts (spread over the current store) in the cosine check.')
+        parser.add_argument('--min-cosine', type=float, default=None,
+                            help='Worst acceptable cosine vs PyTorch (default: query_encoder.MIN_COSINE).')
+
+    def handle(self, *args, **options):
+        from agriadvisor import corpus_store, query_encoder, utils
+
+        texts = list(CHECK_QUERIES)
+        store_dir = os.path.join(corpus_store.current_art_dir(utils.ART_DIR), "store")
+        if corpus_store.store_format(store_dir) == corpus_store.FORMAT_VERSION:
+            store = corpus_store.CorpusStore(store_dir)
+            step = max(1, store.n_docs // max(1, options['check_docs']))
+            texts += [store.text(i) for i in range(0, store.n_docs, step)][:options['check_docs']]
+        else:
+            self.stdout.write("No corpus store found; checking with the built-in queries only.")
+        try:
+            meta = query_encoder.export(
+                utils.EMB_MODEL, os.path.join(utils.ART_DIR, utils.QUERY_ENCODER_SUBDIR), texts,
+                int8=not options['no_int8'], max_seq_len=utils.QUERY_MAX_SEQ_LEN,
+                min_cosine=options['min_cosine'] or query_encoder.MIN_COSINE, source=utils.model_path(utils.EMB_MODEL))
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Query encoder ready ({meta['file']}, min cosine {meta['check']['min_cosine']:.5f}). "
+            f"Servers use it on their next engine load (QUERY_ENCODER=auto)."))
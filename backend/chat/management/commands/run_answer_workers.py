@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from chat.jobs import POLL_INTERVAL, run_workers
+
+
+class Command(BaseCommand):
+    help = "Run background answer-generation workers for queued chat messages."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2,
+                            help='Worker threads in this process (they share one loaded engine).')
+        parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL,
+                            help='Seconds to sleep when the queue is empty.')
+
+    def handle(self, *args, **options):
+        from agriadvisor.utils import warm_up
+        warm_up()  # load the engine while the first jobs are being claimed
+        self.stdout.write(f"Starting {options['threads']} answer worker(s)… (Ctrl+C to stop)")
+        run_workers(threads=options['threads'], poll_interval=options['poll_interval'])
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2025-09-02 09:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_chatmessage_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdmissionLease',
+            fields=[
+                ('key', models.CharField(max_length=200, primary_key=True, serialize=False)),
+                ('token', models.CharField(max_length=32)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -32,14 +32,37 @@ class ChatMessage(models.Model):
     class InputType(models.TextChoices):
         TEXT = 'text', 'Text'
         AUDIO = 'audio', 'Audio'
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages')
     prompt_text = models.TextField(default='') 
     response_text = models.TextField(default='')
     input_type = models.CharField(max_length=5, choices=InputType.choices, default=InputType.TEXT)
     input_language = models.CharField(max_length=10, default='en')
+    # Background generation (see chat/jobs.py); synchronous turns are saved as DONE.
+    status = models.CharField(max_length=7, choices=Status.choices, default=Status.DONE)
+    priority = models.SmallIntegerField(default=0)
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True, unique=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', '-priority', 'created_at'], name='chatmessage_queue_idx'),
+        ]
     def __str__(self):
-        return f"Message in chat at {self.created_at}"
\ No newline at end of file
+        return f"Message in chat at {self.created_at}"
+
+class AdmissionLease(models.Model):
+    """A held admission slot or queue place (chat/throttling.py) when there is no Redis."""
+    key = models.CharField(max_length=200, primary_key=True)
+    token = models.CharField(max_length=32)
+    expires_at = models.DateTimeField()
+    def __str__(self):
+        return f"{self.key} until {self.expires_at}"
@@ -1,3 +1,430 @@
-from django.test import TestCase
+import time
+import asyncio
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from . import jobs, throttling, translation
+from .models import AdmissionLease, Chat, ChatMessage, CustomUser
+from .translation import GoogleBackend, StubBackend, TranslationCache, Translator
+
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'translations': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-translations',
+                     'TIMEOUT': None},
+}
+
+ANSWER = (
+    "Wheat is sown in November in Punjab. Use certified seed!\n"
+    "\n"
+    "Sources:\n"
+    "[S1] → crop_yield.csv#state=Punjab\n"
+    "- https://agricoop.gov.in/en/schemes\n"
+    "Sowing after 25 November lowers yield."
+)
+
+
+class LanguageDetectionTests(SimpleTestCase):
+
+    def test_detect(self):
+        self.assertEqual(translation.detect("गेहूं की बुवाई कब करें?"), 'hi')
+        self.assertEqual(translation.detect("பஞ்சாபில் நெல் விதைப்பு"), 'ta')
+        self.assertEqual(translation.detect("ধানের দাম কত"), 'bn')
+        self.assertEqual(translation.detect("What is the best time to sow wheat in Punjab?"), 'en')
+        self.assertIsNone(translation.detect("gehu ka bhav kya hai"))   # romanized Hindi
+        self.assertIsNone(translation.detect("2024 ₹ 1500 / qtl"))
+
+    def test_in_language(self):
+        self.assertTrue(translation.in_language("गेहूं का भाव", 'hi'))
+        self.assertTrue(translation.in_language("गहू दर", 'mr'))        # same script
+        self.assertFalse(translation.in_language("wheat price", 'hi'))
+        self.assertTrue(translation.in_language("What is the price of wheat?", 'en'))
+
+    def test_resolve_language(self):
+        self.assertEqual(translation.resolve_language("गेहूं की बुवाई कब करें?", 'en'), 'hi')
+        self.assertEqual(translation.resolve_language("ধানের দাম কত", 'hi'), 'bn')
+        self.assertEqual(translation.resolve_language("गहू पेरणी कधी करावी", 'mr'), 'mr')   # Devanagari, not Hindi
+        self.assertEqual(translation.resolve_language("when to sow wheat", 'hi'), 'hi')     # English typed in a Hindi chat
+        self.assertEqual(translation.resolve_language("gehu ka bhav", 'hi'), 'hi')
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class TranslatorTests(SimpleTestCase):
+
+    def setUp(self):
+        from django.core.cache import caches
+        caches['translations'].clear()
+        self.backend = StubBackend()
+        self.translator = Translator(self.backend, TranslationCache())
+
+    def test_segments_and_reassembles(self):
+        out = self.translator.translate(ANSWER, 'en', 'hi')
+        self.assertEqual(out, (
+            "[hi] Wheat is sown in November in Punjab. [hi] Use certified seed!\n"
+            "\n"
+            "[hi] Sources:\n"
+            "[S1] → crop_yield.csv#state=Punjab\n"
+            "- https://agricoop.gov.in/en/schemes\n"
+            "[hi] Sowing after 25 November lowers yield."
+        ))
+        self.assertEqual(self.backend.requests, 1)   # four segments, one batch
+        self.assertEqual(self.backend.texts, 4)
+
+    def test_text_in_target_language_is_kept(self):
+        text = "गेहूं की बुवाई नवंबर में करें।"
+        self.assertEqual(self.translator.translate(text, 'en', 'hi'), text)
+        self.assertEqual(self.translator.translate("Wheat price", 'en', 'en'), "Wheat price")
+        self.assertEqual(self.backend.requests, 0)
+
+    def test_second_call_is_cached(self):
+        first = self.translator.translate(ANSWER, 'en', 'hi')
+        requests = self.backend.requests
+        self.assertEqual(self.translator.translate(ANSWER, 'en', 'hi'), first)
+        self.assertEqual(self.backend.requests, requests)
+        self.assertEqual(self.translator.cache.hits['memory'], 4)
+
+    def test_shared_cache_across_translators(self):
+        first = self.translator.translate(ANSWER, 'en', 'hi')
+        other = Translator(StubBackend(), TranslationCache())   # e.g. another worker process
+        self.assertEqual(other.translate(ANSWER, 'en', 'hi'), first)
+        self.assertEqual(other.backend.requests, 0)
+        self.assertEqual(other.cache.hits['shared'], 4)
+
+    def test_only_new_segments_are_sent(self):
+        self.translator.translate(ANSWER, 'en', 'hi')
+        texts = self.backend.texts
+        self.translator.translate(ANSWER + "\nIrrigate at crown root initiation.", 'en', 'hi')
+        self.assertEqual(self.backend.texts, texts + 1)
+
+    def test_cache_is_per_language_pair(self):
+        self.translator.translate("Use certified seed.", 'en', 'hi')
+        self.assertEqual(self.translator.translate("Use certified seed.", 'en', 'ta'), "[ta] Use certified seed.")
+        self.assertEqual(self.backend.requests, 2)
+
+    def test_batches_by_size(self):
+        translator = Translator(self.backend, TranslationCache(), batch_chars=40)
+        translator.translate(ANSWER, 'en', 'hi')
+        self.assertEqual(self.backend.texts, 4)
+        self.assertGreater(self.backend.requests, 1)
+
+    def test_async_matches_sync(self):
+        expected = Translator(StubBackend(), TranslationCache(alias=None)).translate(ANSWER, 'en', 'hi')
+        self.assertEqual(asyncio.run(self.translator.atranslate(ANSWER, 'en', 'hi')), expected)
+        self.assertEqual(asyncio.run(self.translator.atranslate(ANSWER, 'en', 'hi')), expected)
+        self.assertEqual(self.backend.requests, 1)
+
+
+class GoogleBackendStubServerTests(SimpleTestCase):
+    """GoogleBackend over HTTP against the local stub server (python -m chat.translation --stub-server)."""
+
+    def serve(self, join_lines=False):
+        server = translation.stub_server(0, join_lines=join_lines)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return GoogleBackend(url=f"http://127.0.0.1:{server.server_address[1]}/m")
+
+    def test_batch_is_one_request(self):
+        backend = self.serve()
+        texts = ["Wheat is sown in November.", "Use <certified> seed & fertilizer.", "Irrigate twice."]
+        self.assertEqual(backend.translate_batch(texts, 'en', 'hi'), [f"[hi] {t}" for t in texts])
+        self.assertEqual(backend.requests, 1)
+
+    def test_line_count_mismatch_falls_back_to_one_per_request(self):
+        backend = self.serve(join_lines=True)
+        texts = ["Wheat is sown in November.", "Use certified seed.", "Irrigate twice."]
+        self.assertEqual(backend.translate_batch(texts, 'en', 'ta'), [f"[ta] {t}" for t in texts])
+        self.assertEqual(backend.requests, 1 + len(texts))
+
+    def test_async_line_count_fallback(self):
+        backend = self.serve(join_lines=True)
+        texts = ["Wheat is sown in November.", "Use certified seed."]
+        self.assertEqual(asyncio.run(backend.atranslate_batch(texts, 'en', 'bn')), [f"[bn] {t}" for t in texts])
+        self.assertEqual(backend.requests, 1 + len(texts))
+
+    def test_translator_over_http(self):
+        translator = Translator(self.serve(), TranslationCache(alias=None))
+        self.assertEqual(translator.translate(ANSWER, 'en', 'hi'),
+                         Translator(StubBackend(), TranslationCache(alias=None)).translate(ANSWER, 'en', 'hi'))
+        self.assertEqual(translator.backend.requests, 1)
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create(username='farmer', email='farmer@example.com')
+        self.chat = Chat.objects.create(user=self.user, title='Wheat')
+
+    def enqueue(self, prompt='When to sow wheat?', **kw):
+        return jobs.enqueue(self.chat, prompt, 'text', 'en', **kw)
+
+    def test_claims_highest_priority_first(self):
+        low, _ = self.enqueue('low', priority=-1)
+        high, _ = self.enqueue('high', priority=5)
+        first, _ = self.enqueue('first')
+        second, _ = self.enqueue('second')
+        self.assertEqual([jobs.claim_next().pk for _ in range(4)], [high.pk, first.pk, second.pk, low.pk])
+        self.assertIsNone(jobs.claim_next())
+        high.refresh_from_db()
+        self.assertEqual((high.status, high.attempts), (ChatMessage.Status.RUNNING, 1))
+        self.assertIsNotNone(high.started_at)
+
+    def test_priority_is_clamped(self):
+        msg, _ = self.enqueue(priority=100)
+        self.assertEqual(msg.priority, jobs.PRIORITY_MAX)
+
+    def test_retry_with_same_key_returns_existing_message(self):
+        key = jobs.scoped_key(self.user, 'retry-1')
+        msg, created = self.enqueue(idempotency_key=key)
+        self.assertTrue(created)
+        retry_chat = Chat(user=self.user, title='Wheat')   # a retried "new conversation" request
+        again, created = jobs.enqueue(retry_chat, 'When to sow wheat?', 'text', 'en', idempotency_key=key)
+        self.assertFalse(created)
+        self.assertEqual(again.pk, msg.pk)
+        self.assertEqual(ChatMessage.objects.count(), 1)
+        self.assertEqual(Chat.objects.filter(user=self.user).count(), 1)
+
+    def test_scoped_keys_do_not_collide(self):
+        prefix = 'x' * 200
+        a, b = jobs.scoped_key(self.user, prefix + 'a'), jobs.scoped_key(self.user, prefix + 'b')
+        self.assertNotEqual(a, b)
+        self.assertLessEqual(len(a), ChatMessage._meta.get_field('idempotency_key').max_length)
+        other = CustomUser.objects.create(username='other', email='other@example.com')
+        self.assertNotEqual(jobs.scoped_key(other, 'k'), jobs.scoped_key(self.user, 'k'))
+        self.assertIsNone(jobs.scoped_key(self.user, ''))
+
+    def test_requeue_stale(self):
+        retried, _ = self.enqueue('retried')
+        last, _ = self.enqueue('last attempt')
+        live, _ = self.enqueue('live')
+        for _ in range(3):
+            jobs.claim_next()
+        old = timezone.now() - jobs.STALE_AFTER - timedelta(seconds=1)
+        ChatMessage.objects.filter(pk__in=[retried.pk, last.pk]).update(started_at=old)
+        ChatMessage.objects.filter(pk=last.pk).update(attempts=jobs.MAX_ATTEMPTS)
+        self.assertEqual(jobs.requeue_stale(), 1)
+        for m in (retried, last, live):
+            m.refresh_from_db()
+        self.assertEqual(retried.status, ChatMessage.Status.PENDING)
+        self.assertEqual((last.status, last.response_text), (ChatMessage.Status.FAILED, jobs.ERROR_TEXT))
+        self.assertIsNotNone(last.finished_at)
+        self.assertEqual(live.status, ChatMessage.Status.RUNNING)
+
+    def test_process_writes_result(self):
+        self.enqueue()
+        msg = jobs.claim_next()
+        with mock.patch.object(jobs, 'answer_prompt', return_value='Sow in November.'):
+            self.assertTrue(jobs.process(msg))
+        msg.refresh_from_db()
+        self.assertEqual((msg.status, msg.response_text), (ChatMessage.Status.DONE, 'Sow in November.'))
+
+    def test_error_marks_failed(self):
+        self.enqueue()
+        msg = jobs.claim_next()
+        with mock.patch.object(jobs, 'answer_prompt', side_effect=RuntimeError('gemini down')):
+            self.assertTrue(jobs.process(msg))
+        msg.refresh_from_db()
+        self.assertEqual((msg.status, msg.response_text), (ChatMessage.Status.FAILED, jobs.ERROR_TEXT))
+
+    def test_requeued_worker_result_is_dropped(self):
+        self.enqueue()
+        slow = jobs.claim_next()
+        # The worker looked dead: requeued and claimed again by another worker, which finishes first
+        ChatMessage.objects.filter(pk=slow.pk).update(status=ChatMessage.Status.PENDING)
+        fast = jobs.claim_next()
+        self.assertEqual(fast.attempts, 2)
+        with mock.patch.object(jobs, 'answer_prompt', return_value='fresh answer'):
+            self.assertTrue(jobs.process(fast))
+        with mock.patch.object(jobs, 'answer_prompt', return_value='late answer'):
+            self.assertFalse(jobs.process(slow))
+        fast.refresh_from_db()
+        self.assertEqual((fast.status, fast.response_text), (ChatMessage.Status.DONE, 'fresh answer'))
+
+
+class JobWorkerConcurrencyTests(TransactionTestCase):
+    """Other threads use their own connections, so these need committed rows."""
+
+    def setUp(self):
+        user = CustomUser.objects.create(username='farmer', email='farmer@example.com')
+        self.chat = Chat.objects.create(user=user, title='Wheat')
+
+    @mock.patch.object(jobs, 'HEARTBEAT', timedelta(seconds=0.05))
+    def test_heartbeat_keeps_long_job_fresh(self):
+        jobs.enqueue(self.chat, 'When to sow wheat?', 'text', 'en')
+        msg = jobs.claim_next()
+        claimed_at = msg.started_at
+        seen = []
+
+        def slow_answer(prompt, language):
+            time.sleep(0.3)
+            seen.append(ChatMessage.objects.get(pk=msg.pk).started_at)
+            return 'Sow in November.'
+
+        with mock.patch.object(jobs, 'answer_prompt', side_effect=slow_answer):
+            self.assertTrue(jobs.process(msg))
+        self.assertGreater(seen[0], claimed_at)
+
+    @mock.patch.object(jobs, 'HEARTBEAT', timedelta(seconds=0.05))
+    def test_heartbeat_stops_after_requeue(self):
+        jobs.enqueue(self.chat, 'When to sow wheat?', 'text', 'en')
+        msg = jobs.claim_next()
+        old = timezone.now() - jobs.STALE_AFTER - timedelta(seconds=1)
+
+        def requeued_meanwhile(prompt, language):
+            ChatMessage.objects.filter(pk=msg.pk).update(started_at=old)
+            jobs.requeue_stale()
+            time.sleep(0.2)
+            return 'late answer'
+
+        with mock.patch.object(jobs, 'answer_prompt', side_effect=requeued_meanwhile):
+            self.assertFalse(jobs.process(msg))
+        msg.refresh_from_db()
+        self.assertEqual((msg.status, msg.started_at), (ChatMessage.Status.PENDING, old))
+
+    def test_locked_job_is_skipped(self):
+        if not connection.features.has_select_for_update_skip_locked:
+            self.skipTest("database has no SELECT ... FOR UPDATE SKIP LOCKED")
+        first, _ = jobs.enqueue(self.chat, 'first', 'text', 'en', priority=1)
+        second, _ = jobs.enqueue(self.chat, 'second', 'text', 'en')
+        locked, release, claimed = threading.Event(), threading.Event(), []
+
+        def hold_first():
+            try:
+                with transaction.atomic():
+                    ChatMessage.objects.select_for_update().get(pk=first.pk)
+                    locked.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        def claim():
+            try:
+                claimed.append(jobs.claim_next())
+            finally:
+                connection.close()
+
+        holder = threading.Thread(target=hold_first)
+        holder.start()
+        locked.wait(5)
+        worker = threading.Thread(target=claim)
+        worker.start()
+        worker.join(5)
+        release.set()
+        holder.join(5)
+        self.assertEqual(claimed[0].pk, second.pk)
+
+
+TEST_ADMISSION = {
+    'chat': {'max_concurrent': 1, 'max_queue': 1, 'max_wait': 0.3, 'lease': 60},
+    'full': {'max_concurrent': 1, 'max_queue': 0, 'max_wait': 5, 'lease': 60},
+}
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class TokenBucketTests(SimpleTestCase):
+
+    def setUp(self):
+        from django.core.cache import caches
+        caches['default'].clear()
+
+    def test_burst_then_steady_rate(self):
+        with mock.patch.object(throttling.time, 'time', return_value=1000.0) as now:
+            self.assertEqual([throttling.take_token('b', 2, 60) for _ in range(2)], [0.0, 0.0])
+            self.assertAlmostEqual(throttling.take_token('b', 2, 60), 1.0)
+            self.assertAlmostEqual(throttling.take_token('b', 2, 60), 1.0)   # refusals don't cost a token
+            now.return_value = 1001.0
+            self.assertEqual(throttling.take_token('b', 2, 60), 0.0)
+            self.assertAlmostEqual(throttling.take_token('b', 2, 60), 1.0)
+            self.assertEqual(throttling.take_token('other', 2, 60), 0.0)
+
+    def test_idle_bucket_refills_to_burst_only(self):
+        with mock.patch.object(throttling.time, 'time', return_value=1000.0) as now:
+            throttling.take_token('b', 3, 60)
+            now.return_value = 2000.0
+            self.assertEqual([throttling.take_token('b', 3, 60) for _ in range(3)], [0.0] * 3)
+            self.assertGreater(throttling.take_token('b', 3, 60), 0.0)
+
+
+@override_settings(ADMISSION=TEST_ADMISSION)
+class AdmissionTests(TestCase):
+
+    def test_slot_is_held_for_the_block(self):
+        with throttling.admission('chat'):
+            self.assertEqual(AdmissionLease.objects.count(), 1)
+            self.assertIsNone(throttling._try_lease('chat', 'slot', 1, 60))
+        self.assertEqual(AdmissionLease.objects.count(), 0)
+
+    def test_released_on_error(self):
+        with self.assertRaises(ValueError):
+            with throttling.admission('chat'):
+                raise ValueError
+        self.assertFalse(AdmissionLease.objects.exists())
+
+    def test_expired_lease_is_taken_over(self):
+        old = throttling._try_lease('chat', 'slot', 1, 60)
+        AdmissionLease.objects.filter(key=old[0]).update(expires_at=timezone.now() - timedelta(seconds=1))
+        new = throttling._try_lease('chat', 'slot', 1, 60)
+        self.assertEqual(new[0], old[0])
+        throttling._release(old)   # the late holder must not free the new holder's slot
+        self.assertEqual(AdmissionLease.objects.get(key=new[0]).token, new[1])
+        throttling._release(new)
+        self.assertFalse(AdmissionLease.objects.exists())
+
+    def test_waits_in_queue_then_busy(self):
+        slot = throttling._try_lease('chat', 'slot', 1, 60)
+        start = time.monotonic()
+        with self.assertRaises(throttling.ServiceBusy) as cm:
+            with throttling.admission('chat'):
+                pass
+        self.assertGreaterEqual(time.monotonic() - start, TEST_ADMISSION['chat']['max_wait'])
+        self.assertEqual(cm.exception.wait, TEST_ADMISSION['chat']['max_wait'])
+        self.assertEqual(list(AdmissionLease.objects.values_list('key', flat=True)), [slot[0]])   # ticket released
+
+    def test_full_queue_is_busy_at_once(self):
+        throttling._try_lease('full', 'slot', 1, 60)
+        with self.assertRaises(throttling.ServiceBusy):
+            with throttling.admission('full'):
+                pass
+
+    def test_async_admission(self):
+        async def main():
+            async with throttling.aadmission('chat'):
+                return await AdmissionLease.objects.acount()
+        self.assertEqual(asyncio.run(main()), 1)
+        self.assertFalse(AdmissionLease.objects.exists())
+
+
+@override_settings(CACHES=LOCAL_CACHES, ADMISSION=TEST_ADMISSION)
+class RetryAfterTests(TestCase):
+
+    def setUp(self):
+        from django.core.cache import caches
+        caches['default'].clear()
+        self.user = CustomUser.objects.create(username='farmer', email='farmer@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self):
+        return self.client.post('/api/messages/', {'prompt': 'When to sow wheat?'}, format='json')
+
+    def test_busy_is_503_with_retry_after(self):
+        with override_settings(ADMISSION={**TEST_ADMISSION, 'chat': TEST_ADMISSION['full']}):
+            throttling._try_lease('chat', 'slot', 1, 60)
+            resp = self.post()
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp['Retry-After'], str(TEST_ADMISSION['full']['max_wait']))
+        self.assertFalse(Chat.objects.exists())   # no empty chat left behind
+
+    @override_settings(RATE_LIMITS={'chat': {'user': (1, 1)}})
+    def test_rate_limited_is_429_with_retry_after(self):
+        with mock.patch.object(jobs, 'answer_prompt', return_value='Sow in November.'):
+            self.assertEqual(self.post().status_code, 201)
+            resp = self.post()
+        self.assertEqual(resp.status_code, 429)
+        self.assertGreaterEqual(int(resp['Retry-After']), 59)
@@ -0,0 +1,238 @@
+# throttling.py
+# -----------------------------------------------------------------------------
+# Rate limiting + admission control for the expensive endpoints (chat, transcribe).
+# - Token buckets per user and per IP (GCRA: one timestamp per bucket)
+# - Global concurrency cap per endpoint class with a bounded wait queue
+# Buckets live in the Django cache; admission leases in Redis (REDIS_URL) or the
+# AdmissionLease table, so every worker process sees the same limits.
+# A lease is released only by its holder (compare-and-delete on a random token), so a
+# request that outlives its lease can't free a slot someone else has since taken.
+# Limits over → 429 + Retry-After; server full → 503 + Retry-After.
+# -----------------------------------------------------------------------------
+
+import time
+import uuid
+import random
+import asyncio
+from datetime import timedelta
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+
+KEY_PREFIX = "agri:rl"
+POLL_INTERVAL = 0.1
+
+# ---------- Token buckets ----------
+def take_token(bucket, burst, per_minute):
+    """
+    Take one token from `bucket`. Returns 0.0 when allowed, else seconds until
+    a token is available. Read-modify-write on the cache: a few extra requests
+    can slip through under a perfect race, which is fine for abuse protection.
+    """
+    interval = 60.0 / per_minute
+    key = f"{KEY_PREFIX}:tb:{bucket}"
+    now = time.time()
+    tat = max(cache.get(key) or now, now)           # theoretical arrival time
+    new_tat = tat + interval
+    allow_at = new_tat - burst * interval
+    if allow_at > now:
+        return allow_at - now
+    cache.set(key, new_tat, timeout=int(burst * interval) + 1)
+    return 0.0
+
+def _limits(scope, kind):
+    return settings.RATE_LIMITS.get(scope, {}).get(kind)
+
+def client_ip(request):
+    """Same ident DRF throttles use (honours NUM_PROXIES / X-Forwarded-For)."""
+    return BaseThrottle().get_ident(request)
+
+def rate_limit_wait(scope, user, request):
+    """Check user + IP buckets; returns seconds to wait (0.0 = allowed). Used by non-DRF views."""
+    checks = []
+    if user is not None and getattr(user, 'is_authenticated', False):
+        checks.append(('user', user.pk))
+    checks.append(('ip', client_ip(request)))
+    for kind, ident in checks:
+        lim = _limits(scope, kind)
+        if lim:
+            wait = take_token(f"{scope}:{kind}:{ident}", *lim)
+            if wait:
+                return wait
+    return 0.0
+
+class _BucketThrottle(BaseThrottle):
+    """Reads `throttle_scope` off the view, like DRF's ScopedRateThrottle."""
+    kind = None
+
+    def get_bucket_ident(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        lim = _limits(scope, self.kind) if scope else None
+        ident = self.get_bucket_ident(request)
+        if not lim or ident is None:
+            return True
+        self._wait = take_token(f"{scope}:{self.kind}:{ident}", *lim)
+        return self._wait == 0.0
+
+    def wait(self):
+        return getattr(self, '_wait', None)
+
+class UserBucketThrottle(_BucketThrottle):
+    kind = 'user'
+
+    def get_bucket_ident(self, request):
+        user = getattr(request, 'user', None)
+        return user.pk if user is not None and user.is_authenticated else None
+
+class IPBucketThrottle(_BucketThrottle):
+    kind = 'ip'
+
+    def get_bucket_ident(self, request):
+        return self.get_ident(request)
+
+# ---------- Admission control ----------
+class ServiceBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Server is busy, please retry shortly.'
+    default_code = 'service_busy'
+
+    def __init__(self, wait, detail=None):
+        super().__init__(detail)
+        self.wait = wait  # DRF's exception handler turns this into Retry-After
+
+def _conf(scope):
+    return settings.ADMISSION[scope]
+
+# KEYS[1] = lease key, ARGV[1] = token
+_RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class RedisLeases:
+    """Lease keys in Redis: SET NX EX to take, a Lua compare-and-delete to release."""
+
+    def __init__(self, url):
+        import redis  # only needed with REDIS_URL
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self._release = self.client.register_script(_RELEASE_LUA)
+
+    def taken(self, keys):
+        return {k for k, v in zip(keys, self.client.mget(keys)) if v is not None}
+
+    def add(self, key, token, timeout):
+        return bool(self.client.set(key, token, nx=True, ex=timeout))
+
+    def release(self, key, token):
+        self._release(keys=[key], args=[token])
+
+class DatabaseLeases:
+    """Lease rows keyed by name: the primary key makes taking atomic, a filtered delete releases."""
+
+    def taken(self, keys):
+        from .models import AdmissionLease
+        return set(AdmissionLease.objects.filter(key__in=keys, expires_at__gt=timezone.now())
+                   .values_list('key', flat=True))
+
+    def add(self, key, token, timeout):
+        from .models import AdmissionLease
+        now = timezone.now()
+        AdmissionLease.objects.filter(key=key, expires_at__lte=now).delete()
+        try:
+            with transaction.atomic():
+                AdmissionLease.objects.create(key=key, token=token, expires_at=now + timedelta(seconds=timeout))
+        except IntegrityError:
+            return False
+        return True
+
+    def release(self, key, token):
+        from .models import AdmissionLease
+        AdmissionLease.objects.filter(key=key, token=token).delete()
+
+_leases = None
+
+def leases():
+    global _leases
+    if _leases is None:
+        _leases = RedisLeases(settings.REDIS_URL) if settings.REDIS_URL else DatabaseLeases()
+    return _leases
+
+def _try_lease(scope, kind, n, lease):
+    """Grab one of `n` lease keys; returns (key, token) or None."""
+    store = leases()
+    keys = [f"{KEY_PREFIX}:adm:{scope}:{kind}:{i}" for i in range(n)]
+    taken = store.taken(keys)
+    free = [k for k in keys if k not in taken]
+    random.shuffle(free)
+    token = uuid.uuid4().hex
+    for k in free:
+        if store.add(k, token, lease):
+            return k, token
+    return None
+
+def _release(lease):
+    """Delete the lease only if it still holds our token."""
+    if lease:
+        leases().release(*lease)
+
+def _enter_queue(scope):
+    """Returns (slot, ticket) leases; slot set = admitted now. Raises ServiceBusy if the queue is full."""
+    conf = _conf(scope)
+    slot = _try_lease(scope, 'slot', conf['max_concurrent'], conf['lease'])
+    if slot:
+        return slot, None
+    ticket = _try_lease(scope, 'queue', conf['max_queue'], int(conf['max_wait']) + 5)
+    if not ticket:
+        raise ServiceBusy(wait=conf['max_wait'])
+    return None, ticket
+
+@contextmanager
+def admission(scope):
+    """Hold one of the scope's global concurrency slots for the duration of the block."""
+    conf = _conf(scope)
+    slot, ticket = _enter_queue(scope)
+    try:
+        deadline = time.monotonic() + conf['max_wait']
+        while slot is None:
+            if time.monotonic() >= deadline:
+                raise ServiceBusy(wait=conf['max_wait'])
+            time.sleep(POLL_INTERVAL)
+            slot = _try_lease(scope, 'slot', conf['max_concurrent'], conf['lease'])
+    finally:
+        _release(ticket)
+    try:
+        yield
+    finally:
+        _release(slot)
+
+@asynccontextmanager
+async def aadmission(scope):
+    """Async admission(): waits with asyncio.sleep so the event loop keeps running."""
+    from asgiref.sync import sync_to_async
+
+    conf = _conf(scope)
+    slot, ticket = await sync_to_async(_enter_queue)(scope)
+    try:
+        deadline = time.monotonic() + conf['max_wait']
+        while slot is None:
+            if time.monotonic() >= deadline:
+                raise ServiceBusy(wait=conf['max_wait'])
+            await asyncio.sleep(POLL_INTERVAL)
+            slot = await sync_to_async(_try_lease)(scope, 'slot', conf['max_concurrent'], conf['lease'])
+    finally:
+        await sync_to_async(_release)(ticket)
+    try:
+        yield
+    finally:
+        await sync_to_async(_release)(slot)
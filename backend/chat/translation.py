@@ -0,0 +1,424 @@
+# translation.py
+# -----------------------------------------------------------------------------
+# Translation service for the chat path (sync view, queue workers, ASGI view).
+# - Texts are split into sentences / lines. Each segment is looked up by
+#   (source, target, sha1(segment)) in an in-process LRU, then in the Django cache
+#   alias "translations" (DB table or Redis, no expiry), so answer boilerplate
+#   (headings, "No matching sources…", caveats) is translated once per language.
+# - Misses go out newline-joined in batches of up to BATCH_CHARS, in parallel, over
+#   one pooled httpx client per process (per event loop for the async path).
+# - Local script-based language detection: no call when a text is already in the
+#   target language, and a question whose script contradicts the client's
+#   input_language is translated from the language it is written in.
+# TRANSLATOR=stub swaps Google for an in-process stub (no network; tags segments with
+# the target language). TRANSLATE_URL points the Google client elsewhere, e.g. at the
+# local stub server: `python -m chat.translation --stub-server 8765` (from backend/).
+# -----------------------------------------------------------------------------
+
+import os
+import re
+import html
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import httpx
+
+# ---------- Config ----------
+TRANSLATOR = os.getenv("TRANSLATOR", "google")   # google | stub
+TRANSLATE_URL = os.getenv("TRANSLATE_URL", "https://translate.google.com/m")
+TRANSLATE_TIMEOUT = 15.0
+CACHE_ALIAS = "translations"   # settings.CACHES; memory only when missing
+KEY_PREFIX = "agri:tr"
+MEMORY_ENTRIES = 20000         # segments kept in-process
+BATCH_CHARS = 1500             # segment chars per request (the query string is URL-encoded)
+MAX_PARALLEL = 8               # requests in flight per translate call
+
+# ---------- Language detection ----------
+# 128-codepoint Unicode blocks → script; Latin is ASCII letters
+_BLOCKS = {0x0600 >> 7: "Arab", 0x0680 >> 7: "Arab", 0x0900 >> 7: "Deva", 0x0980 >> 7: "Beng",
+           0x0A00 >> 7: "Guru", 0x0A80 >> 7: "Gujr", 0x0B00 >> 7: "Orya", 0x0B80 >> 7: "Taml",
+           0x0C00 >> 7: "Telu", 0x0C80 >> 7: "Knda", 0x0D00 >> 7: "Mlym"}
+LANGUAGE_SCRIPT = {"en": "Latn", "hi": "Deva", "mr": "Deva", "ne": "Deva", "bn": "Beng", "as": "Beng",
+                   "pa": "Guru", "gu": "Gujr", "or": "Orya", "ta": "Taml", "te": "Telu", "kn": "Knda",
+                   "ml": "Mlym", "ur": "Arab"}
+SCRIPT_LANGUAGE = {"Deva": "hi", "Beng": "bn", "Guru": "pa", "Gujr": "gu", "Orya": "or", "Taml": "ta",
+                   "Telu": "te", "Knda": "kn", "Mlym": "ml", "Arab": "ur"}
+# Latin text is English only with some of these (romanized Hindi "gehu ka bhav" is not)
+_EN_WORDS = frozenset("""a an the is are was were be to of in on for with from by at and or not no
+    what which when where why how much many can could should would do does did my our your it this that
+    there have has i we you me best time rate per""".split())
+_LATIN_WORD = re.compile(r"[a-z']+")
+
+def script_of(text: str) -> str | None:
+    """Script of most of text's letters (≥ 60%), None for mixed or letterless text."""
+    counts: Dict[str, int] = {}
+    for ch in text:
+        if ch.isascii():
+            if ch.isalpha():
+                counts["Latn"] = counts.get("Latn", 0) + 1
+        else:
+            s = _BLOCKS.get(ord(ch) >> 7)
+            if s:
+                counts[s] = counts.get(s, 0) + 1
+    if not counts:
+        return None
+    script, n = max(counts.items(), key=lambda x: x[1])
+    return script if n >= 0.6 * sum(counts.values()) else None
+
+def detect(text: str) -> str | None:
+    """Language code from the script (its main language), "en" for English-looking Latin, else None."""
+    script = script_of(text)
+    if script != "Latn":
+        return SCRIPT_LANGUAGE.get(script)
+    words = _LATIN_WORD.findall(text.lower())
+    return "en" if words and sum(w in _EN_WORDS for w in words) >= max(1, 0.15 * len(words)) else None
+
+def in_language(text: str, language: str) -> bool:
+    if language == "en":
+        return detect(text) == "en"
+    script = script_of(text)
+    return script is not None and script == LANGUAGE_SCRIPT.get(language)
+
+def resolve_language(text: str, claimed: str) -> str:
+    """The client's input_language unless text is plainly written in another script's language."""
+    found = detect(text)
+    if found is None or found == "en" or LANGUAGE_SCRIPT.get(claimed) == LANGUAGE_SCRIPT[found]:
+        return claimed
+    return found
+
+# ---------- Segmentation ----------
+# Split after sentence ends and at line breaks; separators are kept for reassembly
+_SPLIT = re.compile(r"((?<=[.!?।॥])[ \t]+|[ \t]*\n\s*)")
+_URL = re.compile(r"\W*(https?://|www\.)\S+\W*")
+_SOURCE_LINE = re.compile(r"[-*•\s]*\[S\d+\]\s*(→|->)")   # "[S1] → <source>": kept verbatim
+
+def _translatable(segment: str, target: str) -> bool:
+    return (any(c.isalpha() for c in segment) and not _URL.fullmatch(segment)
+            and not _SOURCE_LINE.match(segment) and not in_language(segment, target))
+
+def _batches(segments: List[str], limit: int) -> List[List[str]]:
+    out, cur, size = [], [], 0
+    for s in segments:
+        if cur and size + len(s) > limit:
+            out.append(cur)
+            cur, size = [], 0
+        cur.append(s)
+        size += len(s) + 1
+    return out + [cur] if cur else out
+
+# ---------- Cache ----------
+class TranslationCache:
+    """(source, target, sha1(text)) → translation: in-process LRU over a Django cache alias."""
+
+    def __init__(self, alias: str | None = CACHE_ALIAS, entries: int = MEMORY_ENTRIES):
+        self.alias = alias
+        self.entries = entries
+        self._mem: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = {"memory": 0, "shared": 0, "miss": 0}
+
+    @staticmethod
+    def key(source: str, target: str, text: str) -> str:
+        return f"{KEY_PREFIX}:{source}:{target}:{hashlib.sha1(text.encode('utf-8')).hexdigest()}"
+
+    def _shared(self):
+        if self.alias is None:
+            return None
+        try:
+            from django.core.cache import caches
+            return caches[self.alias]
+        except Exception as e:   # no settings / alias not configured
+            print(f"Translation cache {self.alias!r} unavailable ({e}); caching in memory only.")
+            self.alias = None
+            return None
+
+    def _from_memory(self, keys: List[str]) -> Dict[str, str]:
+        found = {}
+        with self._lock:
+            for k in keys:
+                if k in self._mem:
+                    self._mem.move_to_end(k)
+                    found[k] = self._mem[k]
+        self.hits["memory"] += len(found)
+        return found
+
+    def _remember(self, items: Dict[str, str]):
+        with self._lock:
+            self._mem.update(items)
+            for k in items:
+                self._mem.move_to_end(k)
+            while len(self._mem) > self.entries:
+                self._mem.popitem(last=False)
+
+    def _count(self, keys: List[str], shared: Dict[str, str]):
+        self.hits["shared"] += len(shared)
+        self.hits["miss"] += len(keys) - len(shared)
+        self._remember(shared)
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        found = self._from_memory(keys)
+        rest = [k for k in keys if k not in found]
+        store = self._shared() if rest else None
+        shared = {}
+        if store is not None:
+            try:
+                shared = store.get_many(rest)
+            except Exception as e:
+                print(f"Translation cache read failed: {e}")
+        self._count(rest, shared)
+        return {**found, **shared}
+
+    def set_many(self, items: Dict[str, str]):
+        self._remember(items)
+        store = self._shared() if items else None
+        if store is not None:
+            try:
+                store.set_many(items, timeout=None)
+            except Exception as e:
+                print(f"Translation cache write failed: {e}")
+
+    async def aget_many(self, keys: List[str]) -> Dict[str, str]:
+        found = self._from_memory(keys)
+        rest = [k for k in keys if k not in found]
+        store = self._shared() if rest else None
+        shared = {}
+        if store is not None:
+            try:
+                shared = await store.aget_many(rest)
+            except Exception as e:
+                print(f"Translation cache read failed: {e}")
+        self._count(rest, shared)
+        return {**found, **shared}
+
+    async def aset_many(self, items: Dict[str, str]):
+        self._remember(items)
+        store = self._shared() if items else None
+        if store is not None:
+            try:
+                await store.aset_many(items, timeout=None)
+            except Exception as e:
+                print(f"Translation cache write failed: {e}")
+
+# ---------- Backends ----------
+class GoogleBackend:
+    """
+    The Google Translate page deep_translator scrapes, over pooled httpx clients.
+    A batch is one request with the texts on separate lines; if the lines don't come
+    back one for one, its texts are sent one per request instead.
+    Falls back to deep_translator on a worker thread if the page layout changes.
+    """
+
+    _RESULT_RE = re.compile(r'<div[^>]*class="(?:result-container|t0)"[^>]*>(.*?)</div>', re.S)
+    _BR_RE = re.compile(r"<br\s*/?>", re.I)
+
+    def __init__(self, url: str = TRANSLATE_URL, timeout: float = TRANSLATE_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self.requests = 0
+        self._client: httpx.Client | None = None
+        self._aclient: httpx.AsyncClient | None = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _options(self):
+        return dict(timeout=self.timeout, headers={"User-Agent": "Mozilla/5.0"},
+                    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20))
+
+    def _get_client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(**self._options())
+            return self._client
+
+    def _get_aclient(self) -> httpx.AsyncClient:
+        # Clients are bound to an event loop; runserver (WSGI) spins a loop per request.
+        loop = asyncio.get_running_loop()
+        if self._aclient is None or self._loop is not loop:
+            self._aclient = httpx.AsyncClient(**self._options())
+            self._loop = loop
+        return self._aclient
+
+    def _params(self, texts: List[str], source: str, target: str):
+        self.requests += 1
+        return {"sl": source, "tl": target, "q": "\n".join(texts)}
+
+    def _parse(self, page: str) -> str | None:
+        m = self._RESULT_RE.search(page)
+        return html.unescape(self._BR_RE.sub("\n", m.group(1))).strip() if m else None
+
+    @staticmethod
+    def _lines(out: str, texts: List[str]) -> List[str] | None:
+        lines = out.split("\n")
+        return lines if len(lines) == len(texts) else None
+
+    def translate_batch(self, texts: List[str], source: str, target: str) -> List[str]:
+        resp = self._get_client().get(self.url, params=self._params(texts, source, target))
+        resp.raise_for_status()
+        out = self._parse(resp.text)
+        if out is None:
+            out = self._fallback("\n".join(texts), source, target)
+        lines = self._lines(out, texts)
+        if lines is None:
+            return [t for text in texts for t in self.translate_batch([text], source, target)] \
+                if len(texts) > 1 else [out]
+        return lines
+
+    async def atranslate_batch(self, texts: List[str], source: str, target: str) -> List[str]:
+        resp = await self._get_aclient().get(self.url, params=self._params(texts, source, target))
+        resp.raise_for_status()
+        out = self._parse(resp.text)
+        if out is None:
+            out = await asyncio.to_thread(self._fallback, "\n".join(texts), source, target)
+        lines = self._lines(out, texts)
+        if lines is None:
+            if len(texts) == 1:
+                return [out]
+            parts = await asyncio.gather(*(self.atranslate_batch([t], source, target) for t in texts))
+            return [p[0] for p in parts]
+        return lines
+
+    @staticmethod
+    def _fallback(text: str, source: str, target: str) -> str:
+        from deep_translator import GoogleTranslator
+        return GoogleTranslator(source=source, target=target).translate(text)
+
+class StubBackend:
+    """No network: every text comes back tagged with the target language. Counts requests."""
+
+    def __init__(self):
+        self.requests = 0
+        self.texts = 0
+
+    def translate_batch(self, texts: List[str], source: str, target: str) -> List[str]:
+        self.requests += 1
+        self.texts += len(texts)
+        return [f"[{target}] {t}" for t in texts]
+
+    async def atranslate_batch(self, texts: List[str], source: str, target: str) -> List[str]:
+        return self.translate_batch(texts, source, target)
+
+# ---------- Translator ----------
+_pool = ThreadPoolExecutor(max_workers=MAX_PARALLEL, thread_name_prefix="translate")
+
+class Translator:
+    """Segment → cache → batched backend calls → reassemble; sync and async entry points."""
+
+    def __init__(self, backend=None, cache: TranslationCache | None = None, batch_chars: int = BATCH_CHARS):
+        self.backend = backend or GoogleBackend()
+        self.cache = cache or TranslationCache()
+        self.batch_chars = batch_chars
+
+    def _plan(self, texts: List[str], source: str, target: str) -> Tuple[List[List[str] | None], Dict[str, str]]:
+        """Per text its parts (segments at even indexes) or None to keep it; segment → cache key."""
+        plans, wanted = [], {}
+        for text in texts:
+            if not text or source == target or in_language(text, target):
+                plans.append(None)
+                continue
+            parts = _SPLIT.split(text)
+            plans.append(parts)
+            for seg in parts[::2]:
+                if seg not in wanted and _translatable(seg, target):
+                    wanted[seg] = self.cache.key(source, target, seg)
+        return plans, wanted
+
+    @staticmethod
+    def _assemble(texts: List[str], plans, done: Dict[str, str]) -> List[str]:
+        return [text if parts is None else
+                "".join(done.get(p, p) if i % 2 == 0 else p for i, p in enumerate(parts))
+                for text, parts in zip(texts, plans)]
+
+    def translate_many(self, texts: List[str], source: str, target: str) -> List[str]:
+        plans, wanted = self._plan(texts, source, target)
+        cached = self.cache.get_many(list(wanted.values())) if wanted else {}
+        done = {seg: cached[k] for seg, k in wanted.items() if k in cached}
+        missing = [seg for seg in wanted if seg not in done]
+        if missing:
+            batches = _batches(missing, self.batch_chars)
+            results = _pool.map(lambda b: self.backend.translate_batch(b, source, target), batches)
+            fresh = {seg: out for b, outs in zip(batches, results) for seg, out in zip(b, outs)}
+            self.cache.set_many({wanted[seg]: out for seg, out in fresh.items()})
+            done.update(fresh)
+        return self._assemble(texts, plans, done)
+
+    def translate(self, text: str, source: str, target: str) -> str:
+        return self.translate_many([text], source, target)[0]
+
+    async def atranslate_many(self, texts: List[str], source: str, target: str) -> List[str]:
+        plans, wanted = self._plan(texts, source, target)
+        cached = await self.cache.aget_many(list(wanted.values())) if wanted else {}
+        done = {seg: cached[k] for seg, k in wanted.items() if k in cached}
+        missing = [seg for seg in wanted if seg not in done]
+        if missing:
+            batches = _batches(missing, self.batch_chars)
+            slots = asyncio.Semaphore(MAX_PARALLEL)
+
+            async def one(b):
+                async with slots:
+                    return await self.backend.atranslate_batch(b, source, target)
+            results = await asyncio.gather(*(one(b) for b in batches))
+            fresh = {seg: out for b, outs in zip(batches, results) for seg, out in zip(b, outs)}
+            await self.cache.aset_many({wanted[seg]: out for seg, out in fresh.items()})
+            done.update(fresh)
+        return self._assemble(texts, plans, done)
+
+    async def atranslate(self, text: str, source: str, target: str) -> str:
+        return (await self.atranslate_many([text], source, target))[0]
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.cache.hits, requests=self.backend.requests)
+
+_translator: Translator | None = None
+_translator_lock = threading.Lock()
+def get_translator() -> Translator:
+    global _translator
+    if _translator is None:
+        with _translator_lock:
+            if _translator is None:
+                _translator = Translator(StubBackend() if TRANSLATOR == "stub" else GoogleBackend())
+    return _translator
+
+# ---------- Local stub server ----------
+def stub_server(port: int, host: str = "127.0.0.1", join_lines: bool = False):
+    """
+    Stand-in for TRANSLATE_URL: tags each line of q with tl, in the page layout the client parses.
+    join_lines: answer a batch as one line, as the real page sometimes does (exercises the fallback).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive, as the real endpoint
+
+        def do_GET(self):
+            q = parse_qs(urlparse(self.path).query)
+            lines = [f"[{q.get('tl', ['?'])[0]}] {line}" for line in q.get("q", [""])[0].split("\n")]
+            text = (" " if join_lines else "\n").join(lines)
+            body = f'<html><div class="result-container">{html.escape(text)}</div></html>'.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+def serve_stub(port: int, host: str = "127.0.0.1", join_lines: bool = False):
+    server = stub_server(port, host, join_lines)
+    print(f"Stub translator on http://{host}:{port}/m (TRANSLATE_URL=http://{host}:{port}/m)")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Run the local stub translator.")
+    ap.add_argument("--stub-server", type=int, metavar="PORT", required=True)
+    ap.add_argument("--join-lines", action="store_true", help="answer each batch as one line")
+    args = ap.parse_args()
+    serve_stub(args.stub_server, join_lines=args.join_lines)
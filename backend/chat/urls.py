@@ -5,6 +5,12 @@ from .views import (
     ChatListView,
     ChatDetailView,
     MessageCreateView,
+    AsyncMessageCreateView,
+    MessageStatusView,
+    QueueMetricsView,
+    EngineReloadView,
+    IngestView,
+    CompactView,
     TranscribeAudioView,
     UserProfileUpdateView
     )
@@ -22,6 +28,12 @@ urlpatterns = [
 
     # --- Message & Agent Interaction Endpoint ---
     path('messages/', MessageCreateView.as_view(), name='create-message'),
+    path('messages/async/', AsyncMessageCreateView.as_view(), name='create-message-async'),
+    path('messages/queue/', QueueMetricsView.as_view(), name='message-queue'),
+    path('messages/<uuid:pk>/', MessageStatusView.as_view(), name='message-status'),
+    path('engine/reload/', EngineReloadView.as_view(), name='engine-reload'),
+    path('engine/ingest/', IngestView.as_view(), name='engine-ingest'),
+    path('engine/compact/', CompactView.as_view(), name='engine-compact'),
 
     # --- Audio Transcription Endpoint ---
     path('transcribe/', TranscribeAudioView.as_view(), name='transcribe-audio'),
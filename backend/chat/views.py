@@ -1,21 +1,33 @@
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
-from .serializers import UserSerializer, RegisterSerializer, ChatListSerializer, ChatDetailSerializer, UserProfileSerializer
+from .serializers import UserSerializer, RegisterSerializer, ChatListSerializer, ChatDetailSerializer, ChatMessageSerializer, UserProfileSerializer
 from .models import CustomUser, Chat, ChatMessage
+from . import jobs, translation
+from .throttling import UserBucketThrottle, IPBucketThrottle, ServiceBusy, admission, aadmission, rate_limit_wait
 from rest_framework.views import APIView
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
 
 import os
+import json
+import asyncio
 import tempfile
-import whisper
 import requests
 
-from deep_translator import GoogleTranslator
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
 
-from agriadvisor.utils import generate_answer
+from agriadvisor import speech
 
-_whisper_model = whisper.load_model("medium")
+def _chat_title(prompt):
+    title = ' '.join(prompt.split()[:5])
+    if len(prompt.split()) > 5:
+        title += '...'
+    return title
 
 class RegisterView(generics.CreateAPIView):
     queryset = CustomUser.objects.all()
@@ -78,6 +90,8 @@ class ChatDetailView(generics.RetrieveDestroyAPIView):
     
 class MessageCreateView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [UserBucketThrottle, IPBucketThrottle]
+    throttle_scope = 'chat'
 
     def post(self, request, *args, **kwargs):
         user = request.user
@@ -89,6 +103,16 @@ class MessageCreateView(generics.GenericAPIView):
         if not prompt:
             return Response({'error': 'Prompt is required.'}, status=status.HTTP_400_BAD_REQUEST)
 
+        background = bool(request.data.get('background'))
+        idem_key = None
+        if background:
+            idem_key = jobs.scoped_key(user, request.headers.get('Idempotency-Key') or request.data.get('idempotency_key'))
+            # A client retry gets the message we already queued, not a second generation
+            existing = ChatMessage.objects.filter(idempotency_key=idem_key).first() if idem_key else None
+            if existing:
+                return Response({'chat_id': str(existing.chat_id), 'message': ChatMessageSerializer(existing).data},
+                                status=status.HTTP_200_OK)
+
         # 1. Find or Create the Chat Session
         if chat_id:
             try:
@@ -96,29 +120,39 @@ class MessageCreateView(generics.GenericAPIView):
             except Chat.DoesNotExist:
                 return Response({'error': 'Chat not found or access denied.'}, status=status.HTTP_404_NOT_FOUND)
         else:
-            # Create a new chat and generate a title from the first prompt
-            title = ' '.join(prompt.split()[:5])
-            if len(prompt.split()) > 5:
-                title += '...'
-            chat = Chat.objects.create(user=user, title=title)
-
-        # 2. Get the answer from RAG agent, with translation
-        try:
-            prompt_for_model = prompt
-            if input_language != 'en':
-                prompt_for_model = GoogleTranslator(source=input_language, target='en').translate(prompt)
+            # Create a new chat and generate a title from the first prompt. It is saved with its
+            # first message: in enqueue's transaction (a lost retry race leaves no empty chat) or
+            # after the answer (a 503 from admission leaves none either).
+            chat = Chat(user=user, title=_chat_title(prompt))
 
-            english_response = generate_answer(prompt_for_model)
-
-            response_text = english_response
-            if input_language != 'en':
-                response_text = GoogleTranslator(source='en', target=input_language).translate(english_response)
+        # 2a. Background mode: queue the work and return the pending message at once
+        if background:
+            try:
+                priority = int(request.data.get('priority', 0))
+            except (TypeError, ValueError):
+                priority = 0
+            msg, created = jobs.enqueue(
+                chat, prompt, input_type, input_language,
+                priority=priority, idempotency_key=idem_key,
+            )
+            return Response(
+                {'chat_id': str(msg.chat_id), 'message': ChatMessageSerializer(msg).data},
+                status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK,
+            )
 
+        # 2b. Get the answer from RAG agent, with translation
+        try:
+            with admission('chat'):
+                response_text = jobs.answer_prompt(prompt, input_language)
+        except ServiceBusy:
+            raise
         except Exception as e:
             print(f"Error during translation or RAG agent call: {e}")
-            response_text = "Sorry, I encountered an error. Please try again."
+            response_text = jobs.ERROR_TEXT
 
-        # 3. Save the new message to the database
+        # 3. Save the new message (and a new chat) to the database
+        if chat._state.adding:
+            chat.save()
         ChatMessage.objects.create(
             chat=chat,
             prompt_text=prompt,
@@ -133,9 +167,118 @@ class MessageCreateView(generics.GenericAPIView):
 
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+class MessageStatusView(generics.RetrieveAPIView):
+    """Poll a (possibly background) message until status is done/failed."""
+    serializer_class = ChatMessageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return ChatMessage.objects.filter(chat__user=self.request.user)
+
+class QueueMetricsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(jobs.queue_metrics())
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncMessageCreateView(View):
+    """
+    ASGI variant of MessageCreateView. ORM, translation and Gemini calls are awaited
+    and retrieval runs on a bounded thread pool, so a waiting chat doesn't hold a worker.
+    Serve with an ASGI server (e.g. `uvicorn agriadvisor.asgi:application`).
+    """
+
+    async def _authenticate(self, request):
+        try:
+            result = await sync_to_async(JWTAuthentication().authenticate)(request)
+        except AuthenticationFailed:
+            return None
+        return result[0] if result else None
+
+    @staticmethod
+    def _retry_later(body, code, wait):
+        resp = JsonResponse(body, status=code)
+        resp['Retry-After'] = str(max(1, int(wait + 0.999)))
+        return resp
+
+    async def post(self, request, *args, **kwargs):
+        from agriadvisor.aio import agenerate_answer
+        from agriadvisor.utils import answers_natively
+
+        user = await self._authenticate(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        wait = await sync_to_async(rate_limit_wait)('chat', user, request)
+        if wait:
+            return self._retry_later({'detail': 'Request was throttled.'}, status.HTTP_429_TOO_MANY_REQUESTS, wait)
+
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON body.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        prompt = data.get('prompt')
+        chat_id = data.get('chat_id')
+        input_type = data.get('input_type', 'text')
+        input_language = data.get('input_language', 'en')
+
+        if not prompt:
+            return JsonResponse({'error': 'Prompt is required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 1. Find or Create the Chat Session
+        if chat_id:
+            try:
+                chat = await Chat.objects.aget(id=chat_id, user=user)
+            except (Chat.DoesNotExist, ValidationError):
+                return JsonResponse({'error': 'Chat not found or access denied.'}, status=status.HTTP_404_NOT_FOUND)
+        else:
+            # Saved with its first message, so a 503 from admission leaves no empty chat
+            chat = Chat(user=user, title=_chat_title(prompt))
+
+        # 2. Get the answer from RAG agent, with translation
+        try:
+            async with aadmission('chat'):
+                language = translation.resolve_language(prompt, input_language)
+                if language != 'en' and answers_natively(language):
+                    # Multilingual retrieval: no translation calls (see jobs.answer_prompt)
+                    response_text = await agenerate_answer(prompt, language)
+                else:
+                    translator = translation.get_translator()
+                    english_response = await agenerate_answer(await translator.atranslate(prompt, language, 'en'))
+                    response_text = await translator.atranslate(english_response, 'en', language)
+
+        except ServiceBusy as e:
+            return self._retry_later({'detail': str(e.detail)}, e.status_code, e.wait)
+        except asyncio.CancelledError:
+            # Client went away: stop waiting upstream and don't store a half-finished turn.
+            print(f"Client disconnected; abandoned message for chat {chat.id}")
+            raise
+        except Exception as e:
+            print(f"Error during translation or RAG agent call: {e}")
+            response_text = jobs.ERROR_TEXT
+
+        # 3. Save the new message (and a new chat) to the database
+        if chat._state.adding:
+            await chat.asave()
+        await ChatMessage.objects.acreate(
+            chat=chat,
+            prompt_text=prompt,
+            response_text=response_text,
+            input_type=input_type,
+            input_language=input_language
+        )
+
+        # 4. Return the complete, updated chat object
+        payload = await sync_to_async(lambda: ChatDetailSerializer(chat).data)()
+        return JsonResponse(payload, status=status.HTTP_201_CREATED)
+
 @method_decorator(csrf_exempt, name='dispatch')
 class TranscribeAudioView(generics.GenericAPIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [UserBucketThrottle, IPBucketThrottle]
+    throttle_scope = 'transcribe'
 
     def post(self, request, *args, **kwargs):
         if 'audio' not in request.FILES:
@@ -153,12 +296,15 @@ class TranscribeAudioView(generics.GenericAPIView):
             tmp_path = tmp.name
 
         try:
-            result = _whisper_model.transcribe(tmp_path, language=language, fp16=False)
+            with admission('transcribe'):
+                result = speech.get_whisper_model().transcribe(tmp_path, language=language, fp16=False)
             text = result.get("text", "").strip()            
             detected_language = result.get("language", "en")
 
             return Response({'text': text, 'language': detected_language})
 
+        except ServiceBusy:
+            raise
         except Exception as e:
             print(f"Error during Whisper transcription: {e}")
             return Response({'error': 'Failed to process audio.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -169,6 +315,83 @@ class TranscribeAudioView(generics.GenericAPIView):
                 os.remove(tmp_path)
 
     
+class ReadyView(APIView):
+    """Readiness probe: 200 once the retrieval engine and speech model are loaded, else 503."""
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    throttle_classes = []
+
+    def get(self, request, *args, **kwargs):
+        from agriadvisor.utils import engine_status
+        body = engine_status()
+        body['loaded']['whisper'] = speech.is_loaded()
+        body['ready'] = body['ready'] and body['loaded']['whisper']
+        return Response(body, status=status.HTTP_200_OK if body['ready'] else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+class EngineReloadView(APIView):
+    """
+    GET: engine version/status. POST: load artifacts/CURRENT in the background and
+    swap it in between requests (`{"force": true}` reloads even the same version).
+    Reaches this worker (or the retrieval daemon); SIGHUP / ARTIFACT_WATCH_SECONDS cover the rest.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        from agriadvisor.utils import engine_status
+        return Response(engine_status())
+
+    def post(self, request, *args, **kwargs):
+        from agriadvisor.utils import engine_status, request_reload
+        try:
+            request_reload(force=bool(request.data.get('force', False)))
+        except Exception as e:
+            return Response({'error': f'Reload failed: {e}'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(engine_status(), status=status.HTTP_202_ACCEPTED)
+
+class IngestView(APIView):
+    """
+    POST documents in the scripts/*_to_jsonl.py schema: a JSON list (or {"records": [...]})
+    or a JSONL body (Content-Type: application/x-ndjson). Searchable on return;
+    folded into a new index version by background compaction.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        from agriadvisor.utils import delta_status
+        return Response(delta_status())
+
+    def post(self, request, *args, **kwargs):
+        from agriadvisor import delta
+        from agriadvisor.utils import request_ingest
+        try:
+            if request.content_type.split(';')[0] in ('application/x-ndjson', 'application/jsonl', 'text/plain'):
+                records = delta.parse_jsonl(request.body.decode('utf-8'))
+            else:
+                data = request.data
+                records = data.get('records') if isinstance(data, dict) else data
+                if not isinstance(records, list):
+                    raise ValueError("expected a list of records")
+            if not records:
+                raise ValueError("no records")
+            result = request_ingest(records)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({'error': f'Ingest failed: {e}'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(result, status=status.HTTP_201_CREATED)
+
+class CompactView(APIView):
+    """POST: fold the live delta into a new index version now (runs in the background)."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        from agriadvisor.utils import request_compact
+        try:
+            request_compact()
+        except Exception as e:
+            return Response({'error': f'Compaction failed: {e}'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({'status': 'started'}, status=status.HTTP_202_ACCEPTED)
+
 class UserProfileUpdateView(generics.UpdateAPIView):
     serializer_class = UserProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
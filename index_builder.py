@@ -1,51 +1,118 @@
 # index_builder.py
 # Build FAISS index once; then agent.py can load it in milliseconds.
+# Incremental: shards.json records each data shard's sha256 and its row/byte range
+# in corpus.jsonl; docs carry stable ids (IndexIDMap2), so a rebuild only encodes
+# docs from added/changed shards that weren't indexed before, drops ids that no
+# longer exist and copies everything else from the current version.
 # Usage:
-#   python index_builder.py
+#   python index_builder.py               # (incremental) embed + index + corpus store into artifacts/versions/<ts>/, then make it CURRENT
+#   python index_builder.py --full        # re-embed everything
+#   python index_builder.py --workers 8   # CPU build box: parse + encode on 8 processes (threads split evenly)
+#   python index_builder.py --resume      # continue the newest unfinished build from its last checkpoint
+#   python index_builder.py --low-memory --memory-budget 1024  # 8 GB box: IVF with on-disk lists, ~1 GB of vectors in RAM at most
+#   python index_builder.py --compress sq8  # 1 byte a dim in the index (fp16 | sq8 | pq); exact vectors kept for re-scoring
+#   python index_builder.py --binary        # also sign-bit codes for a Hamming first stage (exact re-score)
+#   python index_builder.py --pca-dim 128   # project vectors (and queries) to 128 dims; prints recall@10/@50 vs full dim
+#   python index_builder.py --partitions 4 --partition-by state  # also split the version into 4 parts for scatter-gather nodes
+#   python index_builder.py --no-metric-indexes   # skip the per-metric sub-indexes (written by default)
+#   python index_builder.py --no-activate # build the version but leave CURRENT alone
+#   python index_builder.py --activate <version>  # flip CURRENT (e.g. roll back), no build
+#   python index_builder.py --store-only  # (re)write the mmap corpus store of the current version from its corpus.jsonl
+# Running servers pick up a new CURRENT on SIGHUP / POST api/engine/reload/.
 
-import os, json, faiss, numpy as np, torch
+import os, sys, json, time, shutil, hashlib, argparse, threading, faiss, numpy as np, torch
+import multiprocessing as mp
 from glob import glob
 from sentence_transformers import SentenceTransformer
 
+# Store format lives with the server code that reads it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from agriadvisor import corpus_store  # noqa: E402
+from agriadvisor.embedding_store import EmbeddingStore, model_spec  # noqa: E402
+from agriadvisor import vector_index  # noqa: E402
+from agriadvisor import model_bundle  # noqa: E402
+from agriadvisor import partitions  # noqa: E402
+from agriadvisor import metric_index  # noqa: E402
+
 # ---------- Config ----------
 DATA_DIR      = "./data"
 DATA_GLOBS    = ["*.jsonl"]             # all shards
 ART_DIR       = "./artifacts"
-CORPUS_PATH   = os.path.join(ART_DIR, "corpus.jsonl")       # merged docs
-INDEX_PATH    = os.path.join(ART_DIR, "index_flatip.faiss") # FAISS vector index
+# Per version, under artifacts/versions/<name>/ (or artifacts/ itself for old unversioned builds):
+CORPUS_FILE   = "corpus.jsonl"         # merged docs
+INDEX_FILE    = "index_flatip.faiss"   # FAISS vector index
+STORE_SUBDIR  = "store"                # mmap columns + BM25 for the server
+SHARDS_FILE   = "shards.json"          # per-shard sha256 + row/byte ranges (incremental rebuilds)
+KEEP_VERSIONS = 3                      # older versions are deleted after a successful build
+EMB_CACHE_DIR = os.path.join(ART_DIR, "embeddings")   # text → vector cache shared by all versions
+PARTIAL_SUBDIR = ".partial"            # checkpoint of an unfinished build (removed once it completes)
+CHECKPOINT_FILE = "checkpoint.json"
+CHECKPOINT_SECONDS = 300               # how often a running build checkpoints (--resume continues from it)
+MEMORY_BUDGET_MB = 2048                # --low-memory: vectors held in RAM at once (model + parsing come on top)
+MODEL_BUNDLE_DIR = os.path.join(ART_DIR, model_bundle.BUNDLE_SUBDIR)   # backend/manage.py bundle_models; used when it has a CURRENT
 
 EMB_MODEL     = "all-MiniLM-L6-v2"
 MAX_SEQ_LEN   = 256          # shorter = faster; safe for short lines
 EMB_BATCH     = 256          # try 256–512 on M4 Pro; lower if you OOM
 DOCS_PER_CALL = 4096         # how many texts to encode per encode() call
+# Length bucketing: each group is tokenized, sorted by token length and cut into
+# batches of ~TOKEN_BUDGET padded tokens, so 10-token template rows go 1024 at a
+# time and 256-token PDF chunks 128 at a time instead of sharing padded batches.
+BUCKETING     = True
+TOKEN_BUDGET  = EMB_BATCH * 128
+MAX_BATCH     = 1024
 
 os.makedirs(ART_DIR, exist_ok=True)
 
-# Prefer Apple GPU (Metal) if present
+# Prefer Apple GPU (Metal) if present; --workers N encodes on N CPU processes instead
 DEVICE = "mps" if torch.backends.mps.is_available() else "cpu"
-print(f"[builder] Device: {DEVICE}")
 
-def iter_docs():
+def shard_files():
     files = []
     for pat in DATA_GLOBS:
         files += sorted(glob(os.path.join(DATA_DIR, pat)))
     if not files:
         raise RuntimeError(f"No JSONL files in {DATA_DIR} (patterns: {DATA_GLOBS})")
+    return sorted(set(files))
+
+def iter_shard(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                d = json.loads(line)
+            except Exception:
+                continue
+            text = d.get("text", "")
+            if not text:
+                continue
+            yield d, text
 
-    for path in files:
-        with open(path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    d = json.loads(line)
-                except Exception:
-                    continue
-                text = d.get("text", "")
-                if not text:
-                    continue
-                yield d, text
+def shard_hash(path, prev_entry):
+    # Same size + mtime as last build → trust the recorded hash instead of re-reading
+    st = os.stat(path)
+    if prev_entry and prev_entry.get("size") == st.st_size and prev_entry.get("mtime") == st.st_mtime:
+        return prev_entry["sha256"]
+    return corpus_store.sha256_file(path)
+
+def load_previous(full, prev_dir=None):
+    """(art_dir, shards manifest, store) of the current version (or prev_dir) if it can seed an incremental build."""
+    if full:
+        return None
+    prev_dir = prev_dir or corpus_store.current_art_dir(ART_DIR)
+    shards_path = os.path.join(prev_dir, SHARDS_FILE)
+    store_dir = os.path.join(prev_dir, STORE_SUBDIR)
+    if not (os.path.exists(shards_path) and corpus_store.store_format(store_dir) == corpus_store.FORMAT_VERSION):
+        print("[builder] No incremental manifest in the current version; doing a full build.")
+        return None
+    store = corpus_store.CorpusStore(store_dir)
+    if store.ids is None or store.manifest.get("index", {}).get("emb_model") != EMB_MODEL:
+        print("[builder] Current version has no stable ids (or another embedder); doing a full build.")
+        return None
+    with open(shards_path, "r", encoding="utf-8") as f:
+        return prev_dir, json.load(f), store
 
 def chunked(it, n):
     buf = []
@@ -57,49 +124,749 @@ def chunked(it, n):
     if buf:
         yield buf
 
-def main():
-    embedder = SentenceTransformer(EMB_MODEL, device=DEVICE)
+def build_store(out_dir, index=None, ids=None):
+    """
+    Engine snapshot next to the index: columnar, memory-mappable copy of corpus.jsonl
+    (texts, metadata, BM25 postings), gazetteers and a manifest with checksums that
+    pins the FAISS index it was built against.
+    """
+    index_path = os.path.join(out_dir, INDEX_FILE)
+    store_dir = os.path.join(out_dir, STORE_SUBDIR)
+    if index is None and os.path.exists(index_path):
+        index = vector_index.read_index(index_path)
+    if ids is None and corpus_store.store_format(store_dir) == corpus_store.FORMAT_VERSION:
+        old = corpus_store.CorpusStore(store_dir).ids   # --store-only on an id-mapped build: keep its ids
+        ids = np.array(old) if old is not None else None
+    data_path = vector_index.ivf_data_path(index_path) if vector_index.is_ondisk(index_path) else None
+    vectors_path = os.path.join(out_dir, vector_index.VECTORS_FILE)
+    vectors_path = vectors_path if os.path.exists(vectors_path) else None
+    projection_path = os.path.join(out_dir, vector_index.PROJECTION_FILE)
+    projection_path = projection_path if os.path.exists(projection_path) else None
+    binary_path = os.path.join(out_dir, vector_index.BINARY_FILE)
+    binary_path = binary_path if os.path.exists(binary_path) else None
+    extra = {"index": corpus_store.index_info(index_path, index.ntotal, index.d, EMB_MODEL, data_path, vectors_path,
+                                              vector_index.codec_of(index), projection_path, binary_path)} if index is not None else None
+    print(f"[builder] Writing corpus store → {store_dir}")
+    manifest = corpus_store.write_store(store_dir, corpus_store.iter_corpus(os.path.join(out_dir, CORPUS_FILE)), extra, ids)
+    print(f"[builder] Store: {manifest['n_docs']} docs, {manifest['bm25']['terms']} BM25 terms, "
+          f"snapshot {manifest['snapshot_id']}")
+    if index is not None and index.ntotal != manifest["n_docs"]:
+        print(f"[builder] WARNING: index has {index.ntotal} vectors but the store has {manifest['n_docs']} docs")
+
+def write_metric_indexes(art_dir, budget_mb=MEMORY_BUDGET_MB):
+    """Per-metric vector + BM25 sub-indexes next to the index (layout in backend/agriadvisor/metric_index.py)."""
+    groups = metric_index.write_groups(art_dir, os.path.join(art_dir, STORE_SUBDIR), budget_mb)
+    sizes = ", ".join(f"{g} {v['docs']}" for g, v in groups.items())
+    print(f"[builder] Metric sub-indexes: {sizes or 'none (no metric docs)'}")
+
+def write_partitions(out_dir, n, by, budget_mb=MEMORY_BUDGET_MB, metric_indexes=True):
+    """
+    Split a finished version into n parts under <version>/partitions/ (layout in
+    backend/agriadvisor/partitions.py). Each part is a complete artifact set with the version's
+    codec, IVF layout, projection and binary codes, so one retrieval daemon can serve it alone.
+    by: hash (doc id mod n, even sizes) or state / metric (whole values per part, balanced by docs).
+    """
+    root = os.path.join(out_dir, partitions.PARTITIONS_SUBDIR)
+    shutil.rmtree(root, ignore_errors=True)
+    store = corpus_store.CorpusStore(os.path.join(out_dir, STORE_SUBDIR))
+    ids = np.asarray(store.ids) if store.ids is not None else np.arange(store.n_docs, dtype=np.int64)
+    if by == "hash":
+        part = (ids % n).astype(np.int32)   # stable ids: a doc stays in its part across builds
+        held = [[] for _ in range(n)]
+    else:
+        codes = np.asarray(store.codes(by))
+        counts = {int(c): int(k) for c, k in zip(*np.unique(codes, return_counts=True))}
+        if len(counts) < n:
+            raise RuntimeError(f"Only {len(counts)} distinct {by} values; can't fill {n} partitions")
+        where = partitions.assign(counts, n)
+        lut = np.zeros(len(store.vocab(by)) + 1, dtype=np.int32)   # code + 1 → part (code -1 = no value)
+        held = [[] for _ in range(n)]
+        for c, p in where.items():
+            lut[c + 1] = p
+            held[p].append(store.vocab_value(by, c) if c >= 0 else None)
+        part = lut[codes + 1]
+
+    index_path = os.path.join(out_dir, INDEX_FILE)
+    index = vector_index.read_index(index_path)
+    codec, ivf = vector_index.codec_of(index), vector_index.is_ondisk(index_path)
+    binary = os.path.exists(os.path.join(out_dir, vector_index.BINARY_FILE))
+    read_rows = vector_index.row_reader(out_dir, index, store.ids, store.n_docs)
+    projection = os.path.join(out_dir, vector_index.PROJECTION_FILE)
+
+    outs = []
+    for p in range(n):
+        os.makedirs(partitions.part_dir(out_dir, p))
+        outs.append(open(os.path.join(partitions.part_dir(out_dir, p), CORPUS_FILE), "w", encoding="utf-8"))
+    for row, d in enumerate(corpus_store.iter_corpus(os.path.join(out_dir, CORPUS_FILE))):
+        outs[part[row]].write(json.dumps(d, ensure_ascii=False) + "\n")
+    for f in outs:
+        f.close()
+
+    parts = []
+    for p in range(n):
+        pdir = partitions.part_dir(out_dir, p)
+        rows = np.flatnonzero(part == p)
+        pids = ids[rows]
+        print(f"[builder] Partition {p}/{n}: {len(rows)} docs"
+              f"{f' ({len(held[p])} {by} values)' if by != 'hash' else ''} → {pdir}")
+
+        def blocks(k, rows=rows, pids=pids):
+            for s in range(0, len(rows), k):
+                yield pids[s:s + k], read_rows(rows[s:s + k])
+
+        if os.path.exists(projection):
+            shutil.copyfile(projection, os.path.join(pdir, vector_index.PROJECTION_FILE))
+        pindex = vector_index.build_streamed(os.path.join(pdir, INDEX_FILE), blocks, pids, index.d, budget_mb,
+                                             codec, ivf, None, binary)
+        build_store(pdir, pindex, pids)
+        if metric_indexes:
+            write_metric_indexes(pdir, budget_mb)
+        parts.append({"docs": int(len(rows)), "values": held[p]})
+    with open(os.path.join(root, partitions.MAP_FILE), "w", encoding="utf-8") as f:
+        json.dump({"by": by, "parts": parts}, f, indent=1)
+
+def prune_versions(keep=KEEP_VERSIONS):
+    current = corpus_store.current_version(ART_DIR)
+    old = [v for v in corpus_store.list_versions(ART_DIR) if v != current]
+    for v in old[:max(0, len(old) - (keep - 1))]:
+        print(f"[builder] Removing old version {v}")
+        shutil.rmtree(os.path.join(ART_DIR, corpus_store.VERSIONS_DIR, v), ignore_errors=True)
+
+# ---------- Checkpoints (--resume) ----------
+# An unfinished build keeps, under <version>/.partial/:
+#   vectors.f32, ids.i64, keys.i64   every vector encoded so far, by stable doc id (+ cache key)
+#   corpus_ids.i64                   doc ids in corpus.jsonl order for the shards written so far
+#   cached.i64                       (doc id, embedding-cache row) pairs for those shards
+#   checkpoint.json                  size + sha256 of a consistent prefix of each of these and of
+#                                    corpus.jsonl, the shard position, base version and options
+# All files are append-only; checkpoint.json is replaced atomically every CHECKPOINT_SECONDS.
+VEC_LOGS = ("vectors.f32", "ids.i64", "keys.i64")           # written as vectors come back
+ROW_LOGS = (CORPUS_FILE, "corpus_ids.i64", "cached.i64")    # written per shard
+
+class AppendLog:
+    """Append-only file with a running size + sha256, so a checkpoint can pin a verifiable prefix."""
+
+    def __init__(self, path, size=0, hasher=None):
+        self.f = open(path, "r+b" if os.path.exists(path) else "wb")
+        self.f.truncate(size)   # drop whatever was written after the checkpoint
+        self.f.seek(size)
+        self.size = size
+        self.h = hasher or hashlib.sha256()
+
+    def write(self, b):
+        self.f.write(b)
+        self.h.update(b)
+        self.size += len(b)
+
+    def mark(self):
+        """Flush and return [size, sha256] of everything written so far."""
+        self.f.flush()
+        return [self.size, self.h.hexdigest()]
+
+    def sync(self):
+        os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.close()
+
+def verified_prefix(path, mark):
+    """sha256 state after the first mark[0] bytes of path, or None if they don't hash to mark[1]."""
+    size, sha = mark
+    if not os.path.exists(path) or os.path.getsize(path) < size:
+        return None
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        left = size
+        while left:
+            b = f.read(min(left, 1 << 22))
+            h.update(b)
+            left -= len(b)
+    return h if h.hexdigest() == sha else None
+
+def read_checkpoint(out_dir):
+    try:
+        with open(os.path.join(out_dir, PARTIAL_SUBDIR, CHECKPOINT_FILE), "r", encoding="utf-8") as f:
+            ck = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if ck.get("spec") != model_spec(EMB_MODEL, MAX_SEQ_LEN):
+        print(f"[builder] Checkpoint was made with {ck.get('spec')}; can't resume it with {EMB_MODEL}")
+        return None
+    return ck
+
+def write_checkpoint(out_dir, ck):
+    path = os.path.join(out_dir, PARTIAL_SUBDIR, CHECKPOINT_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(ck, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+def find_unfinished():
+    """(name, dir) of the newest version with a build checkpoint, if any."""
+    for v in reversed(corpus_store.list_versions(ART_DIR)):
+        d = os.path.join(ART_DIR, corpus_store.VERSIONS_DIR, v)
+        if os.path.exists(os.path.join(d, PARTIAL_SUBDIR, CHECKPOINT_FILE)):
+            return v, d
+    return None
+
+def is_indexed(ids, known):
+    """Which of ids are in the sorted id array known."""
+    if not len(known):
+        return np.zeros(len(ids), dtype=bool)
+    pos = np.minimum(np.searchsorted(known, ids), len(known) - 1)
+    return known[pos] == ids
+
+def restore_checkpoint(ck, log_paths, files, hashes, base, cache):
+    """
+    Open the build's logs, keeping whatever checkpoint ck (None = new build) can vouch for.
+    Returns (state, start, logs): build state with the resumed corpus prefix, the first
+    shard still to write, and the logs truncated to their verified prefixes.
+    """
+    state = {"ids": [], "shards": {}, "rows": 0, "copied": 0, "cached": [], "queued": 0, "boundaries": []}
+    marks, hashers, start = {}, {}, 0
+    if ck:
+        # Vectors are keyed by stable doc id, so they stay usable whatever else changed
+        v, dim = ck["files"], ck["dim"] or 0
+        n = v["ids.i64"][0] // 8
+        hs = {f: verified_prefix(log_paths[f], v[f]) for f in VEC_LOGS}
+        if all(hs.values()) and v["vectors.f32"][0] == n * dim * 4 and v["keys.i64"][0] == n * 8:
+            marks.update({f: v[f] for f in VEC_LOGS})
+            hashers.update(hs)
+        else:
+            print("[builder] Checkpointed vectors failed the integrity check; re-encoding them")
+        # The corpus prefix only if its vectors survived and the same shards (same bytes, same
+        # base version) come first; its docs are not queued for encoding again
+        b = ck["boundary"]
+        done = [os.path.basename(p) for p in files[:b["shard"]]]
+        hs = {f: verified_prefix(log_paths[f], b["files"][f]) for f in ROW_LOGS}
+        ok = ("ids.i64" in marks and base == ck["base"] and done == list(b["shards"]) and all(hs.values())
+              and all(b["shards"][k]["sha256"] == h for k, h in zip(done, hashes)))
+        pairs = np.zeros((0, 2), dtype=np.int64)
+        if ok:
+            pairs = np.fromfile(log_paths["cached.i64"], dtype=np.int64,
+                                count=b["files"]["cached.i64"][0] // 8).reshape(-1, 2)
+            ok = not len(pairs) or (cache is not None and int(pairs[:, 1].max()) < cache.rows)
+        if ok:
+            start = b["shard"]
+            marks.update({f: b["files"][f] for f in ROW_LOGS})
+            hashers.update(hs)
+            corpus_ids = np.fromfile(log_paths["corpus_ids.i64"], dtype=np.int64, count=b["files"]["corpus_ids.i64"][0] // 8)
+            state.update(ids=[corpus_ids], rows=len(corpus_ids), copied=b["copied"], shards=dict(b["shards"]))
+            if len(pairs):
+                state["cached"].append((pairs[:, 0].copy(), pairs[:, 1].copy()))
+            print(f"[builder] Checkpoint: {start}/{len(files)} shards ({state['rows']} docs) already in {CORPUS_FILE}")
+        elif b["shard"]:
+            print(f"[builder] Shards, base version or {CORPUS_FILE} changed since the checkpoint; rewriting the corpus")
+    logs = {f: AppendLog(p, marks[f][0] if f in marks else 0, hashers.get(f)) for f, p in log_paths.items()}
+    state["boundary"] = {"shard": start, "queued": 0, "copied": state["copied"], "shards": dict(state["shards"]),
+                         "files": {f: logs[f].mark() for f in ROW_LOGS}}
+    return state, start, logs
+
+def restore_vectors(ck, log_paths, n_resumed, index, streaming, project, prev_sorted, cache, state):
+    """
+    Vectors the checkpoint kept: into the in-RAM index (streamed builds read them back from
+    the log at the end) and the embedding cache. Returns (index, resumed ids, restored count).
+    """
+    if not n_resumed:
+        return index, np.zeros(0, dtype=np.int64), 0
+    resumed_ids = np.fromfile(log_paths["ids.i64"], dtype=np.int64, count=n_resumed)
+    keys = np.fromfile(log_paths["keys.i64"], dtype=np.int64, count=n_resumed)
+    vecs = np.memmap(log_paths["vectors.f32"], dtype=np.float32, mode="r", shape=(n_resumed, ck["dim"]))
+    if index is None and not streaming:
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(ck["dim"]))   # not streaming: no projection
+    state["dim"] = ck["dim"]
+    keep = np.flatnonzero(~is_indexed(resumed_ids, prev_sorted))
+    for s in range(0, len(keep), DOCS_PER_CALL):
+        rows = keep[s:s + DOCS_PER_CALL]
+        if not streaming:
+            index.add_with_ids(project(vecs[rows]), resumed_ids[rows])
+        if cache:   # the interrupted run never committed them to the cache
+            miss = rows[cache.lookup(keys[rows]) < 0]
+            if len(miss):
+                cache.append(keys[miss], np.ascontiguousarray(vecs[miss]))
+    print(f"[builder] Restored {len(keep)} encoded vectors from the checkpoint")
+    return index, resumed_ids, len(keep)
+
+class Checkpointer:
+    """Writes checkpoint.json for a running build: its options plus what the logs can vouch for."""
+
+    def __init__(self, out_dir, logs, state, options):
+        self.out_dir, self.logs, self.state, self.options = out_dir, logs, state, options
+
+    def write(self, encoded):
+        state = self.state
+        # Newest shard boundary whose queued docs all have vectors (boundaries are in queue order)
+        ready = 0
+        while ready < len(state["boundaries"]) and state["boundaries"][ready]["queued"] <= encoded:
+            ready += 1
+        if ready:
+            state["boundary"] = state["boundaries"][ready - 1]
+            del state["boundaries"][:ready]
+        for log in self.logs.values():
+            log.sync()
+        write_checkpoint(self.out_dir, dict(
+            self.options,
+            dim=state.get("dim"),   # of the vector log (full dim, before any projection)
+            time=time.time(), files={f: self.logs[f].mark() for f in VEC_LOGS},
+            boundary=dict(state["boundary"], queued=0),
+        ))
+
+# ---------- Parsing (worker processes with --workers) ----------
+def parse_shard(path):
+    """(corpus bytes, ids, texts) for one shard; exact duplicates within the shard are dropped."""
+    key = os.path.basename(path)
+    seen, lines, ids, texts = set(), [], [], []
+    for d, text in iter_shard(path):
+        i = corpus_store.doc_id(key, d)
+        if i in seen:
+            continue
+        seen.add(i)
+        ids.append(i)
+        texts.append(text)
+        # the original JSON lines (unaltered) go to the merged corpus
+        lines.append(json.dumps(d, ensure_ascii=False) + "\n")
+    return "".join(lines).encode("utf-8"), np.array(ids, dtype=np.int64), texts
+
+# ---------- Encoding ----------
+def load_embedder(device):
+    bundle = model_bundle.open_current(MODEL_BUNDLE_DIR)
+    embedder = SentenceTransformer(bundle.path(EMB_MODEL) if bundle else EMB_MODEL, device=device)
     embedder.max_seq_length = MAX_SEQ_LEN
-    dim = embedder.get_sentence_embedding_dimension()
-    index = faiss.IndexFlatIP(dim)
+    return embedder
+
+def token_lengths(embedder, texts):
+    enc = embedder.tokenizer(texts, truncation=True, max_length=embedder.max_seq_length,
+                             padding=False, return_attention_mask=False, return_token_type_ids=False)
+    return np.array([len(x) for x in enc["input_ids"]], dtype=np.int32)
+
+def length_buckets(lengths, token_budget=TOKEN_BUDGET, max_batch=MAX_BATCH):
+    """Index batches over texts sorted by length, each ≈ token_budget padded tokens."""
+    order = np.argsort(lengths, kind="stable")
+    batches, start = [], 0
+    while start < len(order):
+        end = start + 1
+        # grow while (batch size × longest member) stays within budget
+        while end < len(order) and end - start < max_batch and (end + 1 - start) * lengths[order[end]] <= token_budget:
+            end += 1
+        batches.append(order[start:end])
+        start = end
+    return batches
+
+def padded_tokens(lengths, batches):
+    return int(sum(len(b) * lengths[b].max() for b in batches))
+
+def _encode(embedder, texts, device, batch_size):
+    # encode on MPS/CPU with normalization for inner product search
+    return embedder.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,  # outer loop prints progress
+        device=device,
+    )
+
+def encode_texts(embedder, texts, device, bucketing=None):
+    if not (BUCKETING if bucketing is None else bucketing):
+        return _encode(embedder, texts, device, EMB_BATCH).astype("float32")
+    lengths = token_lengths(embedder, texts)
+    out = None
+    for b in length_buckets(lengths):
+        embs = _encode(embedder, [texts[i] for i in b], device, len(b))
+        if out is None:
+            out = np.empty((len(texts), embs.shape[1]), dtype=np.float32)
+        out[b] = embs   # back to the caller's (id) order
+    return out
+
+def bench_bucketing(n_docs, device):
+    """Encode the first n_docs both ways and report padding waste and docs/s."""
+    texts = []
+    for path in shard_files():
+        texts += [t for _, t in iter_shard(path)][:n_docs - len(texts)]
+        if len(texts) >= n_docs:
+            break
+    embedder = load_embedder(device)
+    lengths = token_lengths(embedder, texts)
+    plain = [np.arange(i, min(i + EMB_BATCH, len(texts))) for i in range(0, len(texts), EMB_BATCH)]
+    real = int(lengths.sum())
+    print(f"[bench] {len(texts)} docs, {real} real tokens, median {int(np.median(lengths))}, max {int(lengths.max())}")
+    print(f"[bench] padded tokens — file order: {padded_tokens(lengths, plain)}, "
+          f"bucketed: {padded_tokens(lengths, length_buckets(lengths))}")
+    results = {}
+    for name, flag in (("file order", False), ("bucketed", True)):
+        t0 = time.time()
+        results[name] = encode_texts(embedder, texts, device, bucketing=flag)
+        dt = time.time() - t0
+        print(f"[bench] {name}: {dt:.1f}s, {len(texts) / dt:.0f} docs/s")
+    diff = float(np.abs(results["file order"] - results["bucketed"]).max())
+    print(f"[bench] max |Δ| between the two: {diff:.2e}")
+
+_worker_embedder = None
+
+def _init_encoder(threads, bucketing):
+    global _worker_embedder, BUCKETING
+    BUCKETING = bucketing   # spawned workers don't see the parent's flags
+    torch.set_num_threads(threads)
+    _worker_embedder = load_embedder("cpu")
+
+def _encode_job(job):
+    texts, ids, keys = job
+    return encode_texts(_worker_embedder, texts, "cpu"), ids, keys
+
+def main(activate=True, full=False, workers=0, threads=None, use_cache=True, resume=False,
+         low_memory=False, budget_mb=MEMORY_BUDGET_MB, nlist=None, codec=None, pca_dim=None,
+         binary=None, n_parts=None, part_by=None, metric_indexes=True):
+    ck = None
+    if resume:
+        found = find_unfinished()
+        ck = read_checkpoint(found[1]) if found else None
+        if ck:
+            name, out_dir = found
+            # continue the build as it was started
+            full, use_cache, low_memory = ck["full"], ck["use_cache"], ck.get("low_memory", False)
+            codec, pca_dim, binary = ck.get("codec", "flat"), ck.get("pca_dim", 0), ck.get("binary", False)
+            n_parts, part_by = ck.get("partitions", 0), ck.get("partition_by", "hash")
+            metric_indexes = ck.get("metric_indexes", True)
+            print(f"[builder] Resuming {name} from its checkpoint of {time.strftime('%H:%M:%S', time.localtime(ck['time']))}")
+        else:
+            print("[builder] No checkpoint to resume; starting a new build.")
+    prev = load_previous(full, ck["base"] if ck and ck["base"] else None)
+    # Incremental builds keep the current version's projection; vectors kept from it can't be
+    # re-projected, so a different --pca-dim re-indexes everything (the embedding cache still applies)
+    P = vector_index.load_projection(prev[0]) if prev else None
+    prev_pca = P.shape[1] if P is not None else 0
+    pca_dim = prev_pca if pca_dim is None else pca_dim
+    if prev and pca_dim != prev_pca:
+        print(f"[builder] Projection dims {prev_pca or 'off'} → {pca_dim or 'off'}: re-indexing every doc")
+        prev, full, P = None, True, None
+    if not ck:
+        name, out_dir = corpus_store.new_version_dir(ART_DIR)
+    corpus_path = os.path.join(out_dir, CORPUS_FILE)
+    index_path = os.path.join(out_dir, INDEX_FILE)
+    partial_dir = os.path.join(out_dir, PARTIAL_SUBDIR)
+    os.makedirs(partial_dir, exist_ok=True)
+    base = prev[0] if prev else None
+    # Incremental builds keep the current version's codec unless told otherwise
+    prev_codec = prev[2].manifest["index"].get("codec", "flat") if prev else None
+    codec = codec or prev_codec or "flat"
+    if binary is None:   # ... and its binary codes
+        binary = prev is not None and os.path.exists(os.path.join(prev[0], vector_index.BINARY_FILE))
+    # ... and its partitioning (also for --full: parts are cut from the finished version)
+    prev_map = partitions.load_map(corpus_store.current_art_dir(ART_DIR))
+    n_parts = (len(prev_map["parts"]) if prev_map else 0) if n_parts is None else n_parts
+    part_by = part_by or (prev_map["by"] if prev_map else "hash")
+    # Streamed: index built at the end from vectors on disk (bounded RAM, trained codecs, codec change)
+    streaming = (low_memory or vector_index.is_lossy(codec) or prev_codec not in (None, codec) or binary
+                 or (pca_dim and P is None))   # a new projection is trained on the encoded vectors first
+    # ... and an IVF version stays IVF
+    ivf = low_memory or (prev is not None and vector_index.is_ondisk(os.path.join(prev[0], INDEX_FILE)))
+    print(f"[builder] Building version {name} → {out_dir} ({'incremental' if prev else 'full'}, {codec}"
+          f"{f', {pca_dim} dims' if pca_dim else ''}{', binary codes' if binary else ''}"
+          f"{f', {n_parts} partitions by {part_by}' if n_parts else ''}"
+          f"{f', low memory: {budget_mb} MB' if low_memory else ''})")
+
+    def project(vecs):
+        # Index space: the logs and the embedding cache always hold full-dim vectors
+        vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+        return vecs if P is None else np.ascontiguousarray(vecs @ P)
+
+    if prev:
+        prev_dir, prev_shards, prev_store = prev
+        # Streamed: no index in RAM; vectors kept from the current version are read back at the end
+        index = None if streaming else vector_index.writable_copy(os.path.join(prev_dir, INDEX_FILE))
+        prev_corpus = open(os.path.join(prev_dir, CORPUS_FILE), "rb")
+        prev_ids = np.asarray(prev_store.ids)
+        prev_sorted = np.asarray(prev_store.ids_sorted)
+    else:
+        prev_shards, index, prev_corpus = {}, None, None   # created once the embedding dim is known
+        prev_ids = prev_sorted = np.zeros(0, dtype=np.int64)
+
+    cache = EmbeddingStore(EMB_CACHE_DIR, model_spec(EMB_MODEL, MAX_SEQ_LEN)) if use_cache else None
+
+    # Parsing/hashing pool + encoder pool (CPU build boxes), or everything in-process (MPS)
+    ctx = mp.get_context("spawn")
+    files = shard_files()
+    parse_pool = ctx.Pool(min(workers, len(files))) if workers else None
+    hash_args = [(p, prev_shards.get(os.path.basename(p))) for p in files]
+    hashes = parse_pool.starmap(shard_hash, hash_args) if parse_pool else [shard_hash(*a) for a in hash_args]
+    unchanged = [bool(e) and e["sha256"] == h for (_, e), h in zip(hash_args, hashes)]
 
     # Merge all docs into one corpus file while we build the index
     # (So agent.py can load docs from a single fast file.)
-    # We append; if file exists and you want a clean rebuild, delete it first.
-    if os.path.exists(CORPUS_PATH):
-        os.remove(CORPUS_PATH)
-
-    total = 0
-    with open(CORPUS_PATH, "a", encoding="utf-8") as out_corpus:
-        # Stream in moderately large groups to keep encode() efficient
-        for group in chunked(iter_docs(), DOCS_PER_CALL):
-            texts = [t for (_, t) in group]
-            # encode on MPS/CPU with normalization for inner product search
-            embs = embedder.encode(
-                texts,
-                batch_size=EMB_BATCH,
-                convert_to_numpy=True,
-                normalize_embeddings=True,
-                show_progress_bar=False,  # outer loop prints progress
-                device=DEVICE,
-            )
-            index.add(embs.astype("float32"))
-
-            # write the original JSON lines (unaltered) to merged corpus
-            for (d, _) in group:
-                out_corpus.write(json.dumps(d, ensure_ascii=False) + "\n")
-
-            total += len(group)
-            if total % 20000 == 0:
-                print(f"[builder] Indexed {total} docs…")
-
-    faiss.write_index(index, INDEX_PATH)
+    log_paths = {f: os.path.join(partial_dir, f) for f in VEC_LOGS + ROW_LOGS}
+    log_paths[CORPUS_FILE] = corpus_path
+    state, start, logs = restore_checkpoint(ck, log_paths, files, hashes, base, cache)
+    index, resumed_ids, restored = restore_vectors(ck, log_paths, logs["ids.i64"].size // 8, index, streaming,
+                                                   project, prev_sorted, cache, state)
+    known = np.sort(np.concatenate([prev_sorted, resumed_ids]))
+
+    to_parse = [p for k, (p, u) in enumerate(zip(files, unchanged)) if k >= start and not u]
+    parsed = parse_pool.imap(parse_shard, to_parse) if parse_pool else map(parse_shard, to_parse)
+    in_flight = threading.BoundedSemaphore(max(2, 2 * workers))   # bounds queued encode jobs
+
+    def jobs():
+        """Writes corpus.jsonl in shard order; yields (texts, ids) groups that need vectors."""
+        pending_t, pending_i, pending_k = [], [], []
+        out_corpus = logs[CORPUS_FILE]
+        for k, (path, sha, same) in enumerate(zip(files, hashes, unchanged)):
+            if k < start:
+                continue   # already in corpus.jsonl (resumed)
+            key = os.path.basename(path)
+            entry = prev_shards.get(key)
+            row0, byte0 = state["rows"], out_corpus.size
+            if same:
+                # Unchanged shard: copy its corpus bytes and ids from the current version
+                prev_corpus.seek(entry["bytes"][0])
+                out_corpus.write(prev_corpus.read(entry["bytes"][1] - entry["bytes"][0]))
+                ids = prev_ids[entry["rows"][0]:entry["rows"][1]]
+                state["copied"] += len(ids)
+            else:
+                blob, ids, texts = next(parsed)
+                out_corpus.write(blob)
+                indexed = is_indexed(ids, known)
+                # Only docs the index doesn't have yet need vectors; the cache may already have them
+                new_t = [t for t, seen in zip(texts, indexed) if not seen]
+                new_i = ids[~indexed]
+                keys = cache.keys(new_t) if cache else np.zeros(len(new_t), dtype=np.int64)
+                rows = cache.lookup(keys) if cache else np.full(len(new_t), -1)
+                hit = rows >= 0
+                if hit.any():
+                    state["cached"].append((new_i[hit], rows[hit]))
+                    logs["cached.i64"].write(np.stack([new_i[hit], rows[hit]], axis=1).astype(np.int64).tobytes())
+                pending_t += [t for t, h in zip(new_t, hit) if not h]
+                pending_i += new_i[~hit].tolist()
+                pending_k += keys[~hit].tolist()
+                state["queued"] += int((~hit).sum())
+                print(f"[builder] {key}: {'changed' if entry else 'new'}, {len(ids)} docs, "
+                      f"{len(new_i)} new to the index, {int((~hit).sum())} to encode")
+            state["ids"].append(ids)
+            state["rows"] += len(ids)
+            logs["corpus_ids.i64"].write(np.asarray(ids, dtype=np.int64).tobytes())
+            st = os.stat(path)
+            state["shards"][key] = {"sha256": sha, "size": st.st_size, "mtime": st.st_mtime,
+                                    "rows": [row0, state["rows"]], "bytes": [byte0, out_corpus.size]}
+            # Checkpointable once everything queued so far has been encoded
+            state["boundaries"].append({"shard": k + 1, "queued": state["queued"], "copied": state["copied"],
+                                        "shards": dict(state["shards"]),
+                                        "files": {f: logs[f].mark() for f in ROW_LOGS}})
+            # Stream in moderately large groups to keep encode() efficient
+            while len(pending_t) >= DOCS_PER_CALL:
+                in_flight.acquire()
+                yield (pending_t[:DOCS_PER_CALL], np.array(pending_i[:DOCS_PER_CALL], dtype=np.int64),
+                       np.array(pending_k[:DOCS_PER_CALL], dtype=np.int64))
+                pending_t, pending_i, pending_k = (pending_t[DOCS_PER_CALL:], pending_i[DOCS_PER_CALL:],
+                                                   pending_k[DOCS_PER_CALL:])
+        if pending_t:
+            in_flight.acquire()
+            yield pending_t, np.array(pending_i, dtype=np.int64), np.array(pending_k, dtype=np.int64)
+
+    encoded = 0
+    checkpoint = Checkpointer(out_dir, logs, state, {
+        "version": name, "base": base, "full": full or base is None, "use_cache": use_cache,
+        "low_memory": low_memory, "codec": codec, "pca_dim": pca_dim, "binary": binary, "spec": model_spec(EMB_MODEL, MAX_SEQ_LEN),
+        "partitions": n_parts, "partition_by": part_by, "metric_indexes": metric_indexes,
+    })
+    checkpoint.write(encoded)   # records base/options, so --resume works from the first minute
+
+    if workers:
+        threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        os.environ["OMP_NUM_THREADS"] = os.environ["MKL_NUM_THREADS"] = str(threads)
+        print(f"[builder] Encoding on {workers} CPU processes × {threads} threads")
+        enc_pool = ctx.Pool(workers, initializer=_init_encoder, initargs=(threads, BUCKETING))
+        results = enc_pool.imap(_encode_job, jobs())   # ordered: vectors land in corpus order
+    else:
+        print(f"[builder] Device: {DEVICE}")
+        embedder = load_embedder(DEVICE)
+        results = ((encode_texts(embedder, t, DEVICE), i, k) for t, i, k in jobs())
+
+    t0, next_report, last_checkpoint = time.time(), 20000, time.time()
+    for embs, ids, keys in results:
+        state["dim"] = embs.shape[1]
+        if not streaming:
+            if index is None:
+                index = faiss.IndexIDMap2(faiss.IndexFlatIP(embs.shape[1]))
+            index.add_with_ids(project(embs), ids)
+        if cache:
+            cache.append(keys, embs)
+        logs["vectors.f32"].write(np.ascontiguousarray(embs, dtype=np.float32).tobytes())
+        logs["ids.i64"].write(ids.tobytes())
+        logs["keys.i64"].write(keys.tobytes())
+        in_flight.release()
+        encoded += len(ids)
+        if encoded >= next_report:
+            print(f"[builder] Encoded {encoded} docs… ({encoded / (time.time() - t0):.0f} docs/s)")
+            next_report += 20000
+        if time.time() - last_checkpoint >= CHECKPOINT_SECONDS:
+            checkpoint.write(encoded)
+            last_checkpoint = time.time()
+    elapsed = time.time() - t0
+    for pool in (parse_pool, enc_pool if workers else None):
+        if pool:
+            pool.close()
+            pool.join()
+    if prev_corpus:
+        prev_corpus.close()
+    checkpoint.write(encoded)   # everything encoded: a crash while writing the store resumes without encoding
+    for log in logs.values():
+        log.close()
+
+    all_ids = np.concatenate(state["ids"]) if state["ids"] else np.zeros(0, dtype=np.int64)
+    stale = np.setdiff1d(np.concatenate([prev_ids, resumed_ids]), all_ids)
+    from_cache = sum(len(ids) for ids, _ in state["cached"])
+    if cache:
+        cache.commit()
+    if streaming:
+        if not len(all_ids):
+            raise RuntimeError("No documents to index")
+        # Every vector the new version needs, streamed from disk: this run's (and the checkpoint's)
+        # encodes, embedding-cache hits, and rows kept from the current version's index.
+        # Stale ids are dropped simply by not streaming them.
+        wanted = np.sort(all_ids)
+        carried = np.intersect1d(prev_ids, all_ids)
+
+        def fresh(rows):   # full dim
+            n = os.path.getsize(log_paths["ids.i64"]) // 8
+            if n:
+                log_ids = np.fromfile(log_paths["ids.i64"], dtype=np.int64, count=n)
+                vecs = np.memmap(log_paths["vectors.f32"], dtype=np.float32, mode="r", shape=(n, state["dim"]))
+                for s in range(0, n, rows):
+                    i = log_ids[s:s + rows]
+                    m = is_indexed(i, wanted) & ~is_indexed(i, carried)
+                    if m.any():
+                        yield i[m], vecs[s:s + rows][m]
+            for ids, crow in state["cached"]:
+                for s in range(0, len(ids), rows):
+                    yield ids[s:s + rows], cache.get(crow[s:s + rows])
+
+        def blocks(rows):   # index space
+            for ids, vecs in fresh(rows):
+                yield ids, project(vecs)
+            if not len(carried):
+                return
+            exact = os.path.join(prev_dir, vector_index.VECTORS_FILE)
+            if os.path.exists(exact):   # a lossy version's full-precision vectors, not its codes
+                mat = np.memmap(exact, dtype=np.float32, mode="r", shape=(prev_store.n_docs, dim))
+                for s in range(0, len(carried), rows):
+                    yield carried[s:s + rows], mat[prev_store.rows_for_ids(carried[s:s + rows])]
+                return
+            src = vector_index.read_index(os.path.join(prev_dir, INDEX_FILE))
+            for s in range(0, len(carried), rows):
+                yield carried[s:s + rows], vector_index.reconstruct_ids(src, carried[s:s + rows])
+
+        if pca_dim and P is None:   # new projection (no version to carry vectors from)
+            dim_in = state.get("dim") or cache.dim
+            sample = vector_index.strided_sample(fresh, len(all_ids), min(len(all_ids), 100000), DOCS_PER_CALL, dim_in)
+            P, kept = vector_index.train_projection(sample, pca_dim)
+            rec = vector_index.projection_recall(sample, P)
+            print(f"[builder] Projection {dim_in} → {pca_dim} dims keeps {kept:.1%} of the energy; on a held-out "
+                  f"sample recall vs full dim is {', '.join(f'@{k} {r:.3f}' for k, r in rec.items())}")
+            del sample
+        if P is not None:
+            np.save(os.path.join(out_dir, vector_index.PROJECTION_FILE), P)
+        dim = P.shape[1] if P is not None else (state.get("dim") or (cache.dim if cache else None)
+                                                 or prev_store.manifest["index"]["dim"])
+        index = vector_index.build_streamed(index_path, blocks, all_ids, dim, budget_mb, codec, ivf, nlist, binary)
+    else:
+        # Vectors served from the embedding cache (no model run)
+        for ids, rows in state["cached"]:
+            if index is None:
+                index = faiss.IndexIDMap2(faiss.IndexFlatIP(cache.dim))
+            for s in range(0, len(ids), DOCS_PER_CALL):
+                index.add_with_ids(project(cache.get(rows[s:s + DOCS_PER_CALL])), ids[s:s + DOCS_PER_CALL])
+        if index is None:
+            raise RuntimeError("No documents to index")
+        if len(stale):
+            index.remove_ids(stale)
+        if P is not None:
+            np.save(os.path.join(out_dir, vector_index.PROJECTION_FILE), P)
+        vector_index.write_index(index, index_path)   # an IVF base keeps its lists on disk
+    rate = f" in {elapsed:.1f}s ({encoded / elapsed:.0f} docs/s)" if encoded and elapsed > 0 else ""
+    print(f"[builder] Encoded {encoded} docs{rate}, {from_cache} from the embedding cache, "
+          f"{restored} from the checkpoint, reused {len(all_ids) - encoded - from_cache - restored} "
+          f"({state['copied']} from unchanged shards), removed {len(stale)} ids")
+
+    with open(os.path.join(out_dir, SHARDS_FILE), "w", encoding="utf-8") as f:
+        json.dump(state["shards"], f, indent=1)
+    build_store(out_dir, index, all_ids)
+    if metric_indexes:
+        write_metric_indexes(out_dir, budget_mb)
+    if n_parts:
+        write_partitions(out_dir, n_parts, part_by, budget_mb, metric_indexes)
+    shutil.rmtree(partial_dir, ignore_errors=True)
+    total = len(all_ids)
     print(f"[builder] DONE. Docs: {total}")
-    print(f"[builder] Wrote: {INDEX_PATH}")
-    print(f"[builder] Wrote: {CORPUS_PATH}")
+    print(f"[builder] Wrote: {out_dir}")
+    if activate:
+        corpus_store.set_current(ART_DIR, name)
+        print(f"[builder] CURRENT → {name} (reload running servers: kill -HUP, or POST /api/engine/reload/)")
+        prune_versions()
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Build the FAISS index, merged corpus and corpus store.")
+    ap.add_argument("--store-only", action="store_true",
+                    help="only rebuild the mmap corpus store from an existing corpus.jsonl")
+    ap.add_argument("--full", action="store_true", help="ignore the current version and re-embed every shard")
+    ap.add_argument("--workers", type=int, default=0,
+                    help="encoder processes for CPU-only machines (0 = encode in this process, e.g. on MPS)")
+    ap.add_argument("--no-bucketing", action="store_true", help="encode in file order with a fixed batch size")
+    ap.add_argument("--bench-bucketing", type=int, metavar="N",
+                    help="measure bucketed vs file-order encoding on the first N docs and exit")
+    ap.add_argument("--no-embedding-cache", action="store_true",
+                    help="don't read or extend the text → vector cache in artifacts/embeddings/")
+    ap.add_argument("--threads", type=int, default=None,
+                    help="torch intra-op threads per encoder process (default: cores / workers)")
+    ap.add_argument("--resume", action="store_true",
+                    help="continue the newest unfinished build from its last checkpoint (same options as it started with)")
+    ap.add_argument("--checkpoint-seconds", type=float, default=CHECKPOINT_SECONDS,
+                    help="how often a running build writes a checkpoint")
+    ap.add_argument("--low-memory", action="store_true",
+                    help="bounded-RAM build: IVF index with inverted lists on disk (searched through mmap)")
+    ap.add_argument("--memory-budget", type=int, default=MEMORY_BUDGET_MB, metavar="MB",
+                    help="--low-memory: vectors held in RAM at once (training sample, add blocks)")
+    ap.add_argument("--nlist", type=int, default=None, help="--low-memory: IVF lists (default ≈ 4·sqrt(docs))")
+    ap.add_argument("--compress", choices=["flat", "fp16", "sq8", "pq"], default=None,
+                    help="vector codes in the index (default: the current version's, else flat); "
+                         "lossy codecs keep exact vectors next to it for re-scoring")
+    ap.add_argument("--pq-m", type=int, default=48, help="--compress pq: bytes a vector (must divide the dim)")
+    ap.add_argument("--binary", action=argparse.BooleanOptionalAction, default=None,
+                    help="also write sign-bit codes for a Hamming first stage (default: as the current version)")
+    ap.add_argument("--pca-dim", type=int, default=None, metavar="N",
+                    help="project vectors to N dims (uncentered PCA; 0 = off; default: the current version's)")
+    ap.add_argument("--partitions", type=int, default=None, metavar="N",
+                    help="also split the version into N parts for partition nodes (0 = off; default: as the current version)")
+    ap.add_argument("--partition-by", choices=list(partitions.KEYS), default=None,
+                    help="hash (even sizes), state or metric (queries only go to the parts that can match; "
+                         "default: as the current version, else hash)")
+    ap.add_argument("--metric-indexes", action=argparse.BooleanOptionalAction, default=True,
+                    help="also write one vector + BM25 sub-index per metric group, searched for queries whose "
+                         "intent pins the metric")
+    ap.add_argument("--no-activate", action="store_true", help="build a new version without pointing CURRENT at it")
+    ap.add_argument("--activate", metavar="VERSION", help="point CURRENT at an existing version and exit")
+    args = ap.parse_args()
+
+    if args.activate:
+        corpus_store.set_current(ART_DIR, args.activate)
+        print(f"[builder] CURRENT → {args.activate}")
+        sys.exit(0)
+
     # Optional: make CPU side chill a bit on Apple
     os.environ.setdefault("PYTORCH_ENABLE_MPS_FALLBACK", "1")
     os.environ.setdefault("OMP_NUM_THREADS", "4")
-    main()
+    CHECKPOINT_SECONDS = args.checkpoint_seconds
+    if args.no_bucketing:
+        BUCKETING = False
+    if args.bench_bucketing:
+        bench_bucketing(args.bench_bucketing, DEVICE)
+    elif args.store_only:
+        art_dir = corpus_store.current_art_dir(ART_DIR)
+        build_store(art_dir)
+        if os.path.exists(os.path.join(art_dir, metric_index.METRICS_SUBDIR)):   # cut from the old store's rows
+            write_metric_indexes(art_dir)
+    else:
+        main(activate=not args.no_activate, full=args.full, workers=args.workers, threads=args.threads,
+             use_cache=not args.no_embedding_cache, resume=args.resume,
+             low_memory=args.low_memory, budget_mb=args.memory_budget, nlist=args.nlist,
+             codec=f"pq{args.pq_m}" if args.compress == "pq" else args.compress, pca_dim=args.pca_dim,
+             binary=args.binary, n_parts=args.partitions, part_by=args.partition_by,
+             metric_indexes=args.metric_indexes)
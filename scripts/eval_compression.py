@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Recall vs memory of the FAISS codecs index_builder.py can build (--compress / --low-memory),
+measured on the current version's own vectors.
+
+Vectors: <current version>/vectors.f32 when the version is compressed, otherwise
+reconstructed from its flat index. --queries random docs are held out and used as
+queries; the rest is the database. Ground truth is exact inner-product search.
+
+"binary" is the --binary first stage: Hamming top --binary-candidates over sign bits,
+then exact re-scoring (BINARY_CANDIDATES in the engine).
+
+For every codec (and IVF variant with --nlist) it reports:
+  bytes/vec     code size in the index (ids / IVF lists overhead not counted)
+  index MB      serialized index size
+  recall@k      overlap with the exact top-k, codes only
+  +rescore      same, after re-ranking k × --rescore candidates with exact vectors
+                (what the engine does with RESCORE_FACTOR)
+  ms/query      batch search latency per query, without / with re-scoring
+
+With --dims it instead reports, for each target dimension of an index_builder.py
+--pca-dim projection (trained on the database like the builder does), recall@10 and
+recall@50 against full-dimension search and the share of energy the projection keeps.
+Full-dim vectors of a projected version come from the embedding cache.
+
+Usage (from scripts/):
+  python eval_compression.py                              # all docs, 1000 queries, k=10
+  python eval_compression.py --codecs flat,sq8,pq48 --nlist 4096 --nprobe 16,64
+  python eval_compression.py --max-docs 200000 --out ../artifacts/compression.md
+  python eval_compression.py --dims 64,96,128,192,256    # projection report
+
+Output: markdown table on stdout (and --out).
+"""
+
+import os, sys, json, time, argparse, tempfile
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from agriadvisor import corpus_store, vector_index  # noqa: E402
+from agriadvisor.embedding_store import EmbeddingStore  # noqa: E402
+
+# ---------- CONFIG ----------
+ART_DIR   = "../artifacts/"
+CODECS    = "flat,fp16,sq8,pq16,pq32,pq48,pq96,binary"
+QUERIES   = 1000
+K         = 10
+DIMS_KS   = (10, 50)   # recall cut-offs of the projection report
+RESCORE   = 4          # candidates fetched per result when re-scoring (utils.RESCORE_FACTOR)
+BINARY_CANDIDATES = 256   # Hamming shortlist of the binary first stage (utils.BINARY_CANDIDATES)
+SEED      = 0
+
+# ---------- HELPERS ----------
+def load_vectors(art_dir):
+    """Full-precision vectors of a version in store row order."""
+    store = corpus_store.CorpusStore(os.path.join(art_dir, "store"))
+    dim = store.manifest["index"]["dim"]
+    exact = os.path.join(art_dir, vector_index.VECTORS_FILE)
+    if os.path.exists(exact):
+        return np.memmap(exact, dtype=np.float32, mode="r", shape=(store.n_docs, dim))
+    index = vector_index.read_index(os.path.join(art_dir, "index_flatip.faiss"))
+    if vector_index.codec_of(index) != "flat":
+        raise SystemExit(f"{art_dir} has lossy codes and no {vector_index.VECTORS_FILE}; nothing exact to compare with")
+    ids = np.asarray(store.ids) if store.ids is not None else np.arange(store.n_docs)
+    return np.concatenate([vector_index.reconstruct_ids(index, ids[s:s + 100000]) for s in range(0, len(ids), 100000)])
+
+def load_full_vectors(art_dir):
+    """Embedder-dim vectors in store row order, also for a --pca-dim version (from the embedding cache)."""
+    if vector_index.load_projection(art_dir) is None:
+        return load_vectors(art_dir)
+    store = corpus_store.CorpusStore(os.path.join(art_dir, "store"))
+    emb_model = store.manifest["index"]["emb_model"]
+    root = os.path.join(ART_DIR, "embeddings")
+    for name in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        meta_path = os.path.join(root, name, "meta.json")
+        if not os.path.exists(meta_path):
+            continue
+        with open(meta_path, "r", encoding="utf-8") as f:
+            spec = json.load(f)["spec"]
+        if spec.startswith(emb_model + "|"):
+            cache = EmbeddingStore(root, spec)
+            rows = np.concatenate([cache.lookup(cache.keys(store.text(i) for i in range(s, min(s + 50000, store.n_docs))))
+                                   for s in range(0, store.n_docs, 50000)])
+            if (rows < 0).any():   # e.g. live-ingested rows folded in by compaction
+                print(f"{int((rows < 0).sum())} docs have no cached embedding; leaving them out")
+            return cache.get(rows[rows >= 0])
+    raise SystemExit(f"{art_dir} is projected and no embedding cache for {emb_model} was found; "
+                     f"rebuild with index_builder.py (cache on) first")
+
+def recall(found, truth):
+    k = truth.shape[1]
+    return float(np.mean([len(set(f[:k]) & set(t)) / k for f, t in zip(found, truth)]))
+
+def train_sample(db, codec, nlist, rng):
+    want = max(nlist * vector_index.TRAIN_PER_LIST if nlist else 0,
+               256 * vector_index.TRAIN_PER_LIST if codec.startswith("pq") else 0,
+               20000 if codec == "sq8" else 0)
+    if not want:
+        return None
+    rows = np.sort(rng.choice(len(db), min(want, len(db)), replace=False))
+    return np.ascontiguousarray(db[rows])
+
+def build(db, codec, nlist, rng):
+    """(index, serialized bytes) over db with ids = db rows."""
+    if codec == "binary":   # rows are the ids already
+        with tempfile.NamedTemporaryFile(suffix=".faiss") as f:
+            index = vector_index.write_binary(db, f.name)
+            return index, os.path.getsize(f.name)
+    index = vector_index.new_index(codec, db.shape[1], nlist)
+    sample = train_sample(db, codec, nlist, rng)
+    if sample is not None:
+        index.train(sample)
+    for s in range(0, len(db), 100000):
+        chunk = np.ascontiguousarray(db[s:s + 100000])
+        index.add_with_ids(chunk, np.arange(s, s + len(chunk), dtype=np.int64))
+    with tempfile.NamedTemporaryFile(suffix=".faiss") as f:
+        faiss.write_index(index, f.name)
+        return index, os.path.getsize(f.name)
+
+def measure(index, size, db, queries, truth, codec, k, rescore, nlist=None, nprobe=None, candidates=BINARY_CANDIDATES):
+    if nprobe:
+        vector_index.set_nprobe(index, nprobe)
+    binary = codec == "binary"
+    t0 = time.perf_counter()
+    _, I = index.search(vector_index.binarize(queries) if binary else queries, k)
+    t_codes = (time.perf_counter() - t0) / len(queries) * 1000
+    t0 = time.perf_counter()
+    _, C = index.search(vector_index.binarize(queries) if binary else queries, candidates if binary else k * rescore)
+    _, R = vector_index.rescore(queries, C, db, k)
+    t_rescore = (time.perf_counter() - t0) / len(queries) * 1000
+    if binary:
+        name, code = f"BinaryFlat, top {candidates}", db.shape[1] // 8
+    else:
+        name = vector_index.factory_string(codec, nlist) + (f", nprobe {nprobe}" if nprobe else "")
+        code = vector_index.code_bytes(codec, db.shape[1])
+    return {"codec": codec, "index": name, "bytes": code,
+            "mb": size / 2**20, "recall": recall(I, truth), "recall_rs": recall(R, truth),
+            "ms": t_codes, "ms_rs": t_rescore}
+
+def table(rows, k, rescore, n, dim):
+    out = [f"Recall@{k} vs memory — {n} vectors × {dim} dims, re-scoring {rescore}×k candidates",
+           "",
+           f"| codec | index | bytes/vec | index MB | recall@{k} | +rescore | ms/query | +rescore ms |",
+           "|---|---|---:|---:|---:|---:|---:|---:|"]
+    for r in rows:
+        out.append(f"| {r['codec']} | {r['index']} | {r['bytes']} | {r['mb']:.1f} | {r['recall']:.3f} | "
+                   f"{r['recall_rs']:.3f} | {r['ms']:.3f} | {r['ms_rs']:.3f} |")
+    return "\n".join(out)
+
+def projection_rows(db, queries, dims, rng):
+    """Recall@DIMS_KS of --pca-dim projections vs full-dim search, plus the full-dim baseline."""
+    k = max(DIMS_KS)
+    exact = faiss.IndexFlatIP(db.shape[1])
+    exact.add(db)
+    t0 = time.perf_counter()
+    _, truth = exact.search(queries, k)
+    rows = [{"dims": db.shape[1], "energy": 1.0, "ms": (time.perf_counter() - t0) / len(queries) * 1000,
+             **{f"r{kk}": 1.0 for kk in DIMS_KS}}]
+    sample = np.ascontiguousarray(db[np.sort(rng.choice(len(db), min(100000, len(db)), replace=False))])
+    for d in dims:
+        if d >= db.shape[1]:
+            print(f"skipping {d}: not below the embedder's {db.shape[1]} dims")
+            continue
+        P, kept = vector_index.train_projection(sample, d)
+        index = faiss.IndexFlatIP(d)
+        index.add(np.ascontiguousarray(db @ P))
+        t0 = time.perf_counter()
+        _, found = index.search(np.ascontiguousarray(queries @ P), k)
+        ms = (time.perf_counter() - t0) / len(queries) * 1000
+        rows.append({"dims": d, "energy": kept, "ms": ms,
+                     **{f"r{kk}": recall(found[:, :kk], truth[:, :kk]) for kk in DIMS_KS}})
+    return rows
+
+def projection_table(rows, n):
+    out = [f"Projected (uncentered PCA) vs full-dimension search — {n} vectors, flat index",
+           "",
+           "| dims | bytes/vec | energy kept | " + " | ".join(f"recall@{k}" for k in DIMS_KS) + " | ms/query |",
+           "|---:|---:|---:|" + "---:|" * len(DIMS_KS) + "---:|"]
+    for r in rows:
+        out.append(f"| {r['dims']} | {4 * r['dims']} | {r['energy']:.1%} | "
+                   + " | ".join(f"{r[f'r{k}']:.3f}" for k in DIMS_KS) + f" | {r['ms']:.3f} |")
+    return "\n".join(out)
+
+# ---------- MAIN ----------
+def main():
+    ap = argparse.ArgumentParser(description="Recall vs memory of compressed FAISS codecs on the current corpus.")
+    ap.add_argument("--version", help="artifacts version to read (default: CURRENT)")
+    ap.add_argument("--codecs", default=CODECS, help="comma list of flat, fp16, sq8, pq<M>")
+    ap.add_argument("--queries", type=int, default=QUERIES, help="docs held out as queries")
+    ap.add_argument("--max-docs", type=int, default=0, help="random database subset (0 = all)")
+    ap.add_argument("--k", type=int, default=K)
+    ap.add_argument("--rescore", type=int, default=RESCORE, help="candidates per result for re-scoring")
+    ap.add_argument("--binary-candidates", type=int, default=BINARY_CANDIDATES,
+                    help="Hamming shortlist re-scored by the binary first stage")
+    ap.add_argument("--nlist", type=int, default=0, help="also evaluate IVF<nlist> variants")
+    ap.add_argument("--nprobe", default="32", help="comma list of nprobe values for the IVF variants")
+    ap.add_argument("--dims", help="comma list of projection dims: report recall vs full dim instead of codecs")
+    ap.add_argument("--out", help="also write the table to this file")
+    args = ap.parse_args()
+
+    art_dir = (os.path.join(ART_DIR, "versions", args.version) if args.version
+               else corpus_store.current_art_dir(ART_DIR))
+    X = load_full_vectors(art_dir) if args.dims else load_vectors(art_dir)
+    rng = np.random.default_rng(SEED)
+    perm = rng.permutation(len(X))
+    q_rows = np.sort(perm[:args.queries])
+    db_rows = np.sort(perm[args.queries:args.queries + args.max_docs] if args.max_docs else perm[args.queries:])
+    queries, db = np.ascontiguousarray(X[q_rows]), np.ascontiguousarray(X[db_rows])
+    dim = db.shape[1]
+    print(f"{art_dir}: {len(db)} database vectors, {len(queries)} queries, dim {dim}")
+
+    if args.dims:
+        rows = projection_rows(db, queries, [int(d) for d in args.dims.split(",")], rng)
+        md = projection_table(rows, len(db))
+        print()
+        print(md)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                f.write(md + "\n")
+        return
+
+    exact = faiss.IndexFlatIP(dim)
+    exact.add(db)
+    _, truth = exact.search(queries, args.k)
+
+    rows = []
+    for codec in [c.strip() for c in args.codecs.split(",") if c.strip()]:
+        if codec.startswith("pq") and dim % int(codec[2:]):
+            print(f"skipping {codec}: {dim} dims not divisible by {codec[2:]}")
+            continue
+        print(f"… {codec}")
+        index, size = build(db, codec, None, rng)
+        rows.append(measure(index, size, db, queries, truth, codec, args.k, args.rescore,
+                            candidates=args.binary_candidates))
+        if args.nlist and codec != "binary":
+            print(f"… {codec} ivf{args.nlist}")
+            index, size = build(db, codec, args.nlist, rng)
+            for nprobe in [int(p) for p in args.nprobe.split(",")]:
+                rows.append(measure(index, size, db, queries, truth, codec, args.k, args.rescore, args.nlist, nprobe))
+
+    md = table(rows, args.k, args.rescore, len(db), dim)
+    print()
+    print(md)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(md + "\n")
+
+if __name__ == "__main__":
+    main()